@@ -0,0 +1,180 @@
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from cloudant.client import Cloudant
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef import metrics
+from souschef.cloudant_recipe_store import CloudantRecipeStore
+from souschef.local_dialog import LocalDialog, LocalDialogClient
+from souschef.normalizer import Normalizer
+from souschef.recipe import RecipeClient
+from souschef.souschef import SousChef
+from standins import CouchDBStandIn, Faults, FakeConversationClient, FakeSlackClient, InjectedError, SpoonacularStandIn
+
+# the messages sent by a user in each scripted conversation
+CONVERSATIONS = {
+    'cuisine': ['hi', 'i want a recipe', 'no', '{cuisine}', '{selection}'],
+    'ingredients': ['hi', 'i want a recipe', 'yes', '{ingredients}', '{selection}'],
+    'favorites': ['hi', 'show me my favorite recipes', '{selection}']
+}
+CUISINES = ['chinese', 'french', 'greek', 'indian', 'italian', 'japanese', 'mexican', 'thai']
+INGREDIENTS = ['beef', 'chicken', 'garlic', 'onions', 'rice', 'tomatoes']
+SERVICES = ['watson', 'slack', 'spoonacular', 'cloudant']
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+
+def parse_service_values(value, default):
+    # "watson=50,cloudant=5" -> {'watson': 50.0, 'slack': default, ...}
+    values = dict((service, default) for service in SERVICES)
+    for item in value.split(',') if value else []:
+        service, number = item.split('=')
+        if service not in values:
+            raise ValueError('Unknown service {}, expected one of {}'.format(service, ', '.join(SERVICES)))
+        values[service] = float(number)
+    return values
+
+
+class Results(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # conversation name -> latencies of its messages in ms
+        self.latencies = dict((name, []) for name in CONVERSATIONS)
+        self.conversations = 0
+        self.failed_messages = 0
+
+    def add_conversation(self, name, latencies, failed_messages):
+        with self.lock:
+            self.latencies[name].extend(latencies)
+            self.conversations += 1
+            self.failed_messages += failed_messages
+
+
+def get_message(template, response):
+    # select one of the recipes listed in the previous response
+    listed = len(re.findall(r'^\d+\. ', response or '', re.MULTILINE))
+    return template.format(cuisine=random.choice(CUISINES),
+                           ingredients=', '.join(random.sample(INGREDIENTS, 2)),
+                           selection=random.randint(1, max(listed, 1)))
+
+
+def talk(souschef, slack_client, user_id, conversations, rounds, results, timeout):
+    # one user having rounds conversations in a row, each message waits for the bot's reply before the next is sent
+    for i in range(rounds):
+        name = conversations[i % len(conversations)]
+        latencies = []
+        failed_messages = 0
+        response = None
+        for template in CONVERSATIONS[name]:
+            start = time.time()
+            souschef.dispatcher.dispatch(user_id, get_message(template, response), user_id, user_id)
+            try:
+                response = slack_client.wait_for_post(user_id, timeout)
+            except InjectedError:
+                response = None
+            latencies.append((time.time() - start) * 1000)
+            if response is None or response.startswith('Sorry, something went wrong'):
+                failed_messages += 1
+        results.add_conversation(name, latencies, failed_messages)
+
+
+def run(args):
+    latency_ms = parse_service_values(args.latency_ms, 0)
+    error_rates = parse_service_values(args.error_rate, 0)
+    faults = dict((service, Faults(latency_ms[service], latency_ms[service] * args.jitter)) for service in SERVICES)
+    couchdb = CouchDBStandIn(faults['cloudant']).start()
+    spoonacular = SpoonacularStandIn(faults['spoonacular']).start()
+    slack_client = FakeSlackClient(faults['slack'])
+    workspace_file = os.path.join(os.path.dirname(__file__), '..', 'workspace.json')
+    dialog = LocalDialog.from_file(workspace_file)
+    conversation_client = FakeConversationClient(faults['watson'], dialog)
+    if args.local_dialog:
+        # the turns the bot can evaluate itself don't call the stand-in
+        conversation_client = LocalDialogClient(conversation_client, dialog)
+    recipe_store = CloudantRecipeStore(Cloudant('admin', 'admin', url=couchdb.url), 'souschef')
+    recipe_client = RecipeClient('benchmark', max_retries=args.max_retries, endpoint=spoonacular.url)
+    souschef = SousChef('BOT', slack_client, conversation_client, 'workspace', recipe_client, recipe_store,
+                        num_workers=args.workers, recipe_prefetch_budget=args.prefetch_budget,
+                        normalizer=Normalizer.from_file(workspace_file))
+    if args.metrics:
+        metrics.enable()
+    souschef.open()
+    # count only the calls made by the conversations, and don't fail while the store is being set up
+    for service in SERVICES:
+        faults[service].reset()
+        faults[service].error_rate = error_rates[service]
+    conversations = args.conversations.split(',')
+    results = Results()
+    threads = []
+    for i in range(args.users):
+        threads.append(threading.Thread(target=talk, args=(souschef, slack_client, 'U{}'.format(i), conversations,
+                                                           args.rounds, results, args.timeout)))
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    # closing the store writes the request docs that are still queued, which counts towards the cloudant calls
+    souschef.close()
+    couchdb.stop()
+    spoonacular.stop()
+    report(results, faults, elapsed)
+    if args.metrics:
+        print('')
+        print('{:>40} {:>8} {:>10} {:>10} {:>10}'.format('stage', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for name, summary in sorted(metrics.get().summary()['histograms'].items()):
+            print('{:>40} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                name.split('"')[1], summary['count'], summary['p50'] * 1000, summary['p95'] * 1000, summary['p99'] * 1000))
+
+
+def report(results, faults, elapsed):
+    all_latencies = [latency for latencies in results.latencies.values() for latency in latencies]
+    print('{} conversations, {} messages in {:.2f} seconds: {:.1f} conversations/s, {:.1f} messages/s, {} failed messages'.format(
+        results.conversations, len(all_latencies), elapsed, results.conversations / elapsed, len(all_latencies) / elapsed,
+        results.failed_messages))
+    print('')
+    print('{:>14} {:>10} {:>10} {:>10} {:>10}'.format('conversation', 'messages', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name, latencies in sorted(results.latencies.items()) + [('all', all_latencies)]:
+        if len(latencies) > 0:
+            print('{:>14} {:>10} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, len(latencies), percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+    print('')
+    print('{:>14} {:>10} {:>18} {:>10}'.format('service', 'calls', 'per conversation', 'errors'))
+    for service in SERVICES:
+        calls = faults[service].total_calls()
+        print('{:>14} {:>10} {:>18.2f} {:>10}'.format(service, calls, calls / float(max(results.conversations, 1)),
+                                                       faults[service].errors))
+        for name, count in sorted(faults[service].calls.items()):
+            print('{:>14} {:>10} {:>18.2f}'.format(name, count, count / float(max(results.conversations, 1))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Runs scripted conversations against a SousChef whose Slack, Watson, Spoonacular '
+                                                 'and Cloudant are local stand-ins with injected latency and errors, and reports '
+                                                 'throughput, latency percentiles and the calls made to each service per conversation.')
+    parser.add_argument('--users', type=int, default=20, help='number of users talking to the bot at the same time')
+    parser.add_argument('--rounds', type=int, default=6, help='number of conversations each user has')
+    parser.add_argument('--conversations', default='cuisine,ingredients,favorites',
+                        help='comma-separated mix of conversations each user cycles through ({})'.format(', '.join(sorted(CONVERSATIONS))))
+    parser.add_argument('--latency-ms', default='watson=60,slack=30,spoonacular=150,cloudant=10',
+                        help='comma-separated service=milliseconds of latency added to each call')
+    parser.add_argument('--jitter', type=float, default=0.5, help='max random latency added to each call, as a fraction of its latency')
+    parser.add_argument('--error-rate', default='', help='comma-separated service=fraction of calls that fail, e.g. spoonacular=0.05')
+    parser.add_argument('--workers', type=int, default=8, help='number of worker threads handling messages')
+    parser.add_argument('--max-retries', type=int, default=3, help='number of times a failed Spoonacular request is retried')
+    parser.add_argument('--prefetch-budget', type=int, default=0, help='max number of recipes prefetched per hour, 0 to not prefetch')
+    parser.add_argument('--timeout', type=float, default=30, help='max number of seconds to wait for a reply')
+    parser.add_argument('--local-dialog', action='store_true', help='evaluate the dialog locally where possible, as with CONVERSATION_WORKSPACE_FILE')
+    parser.add_argument('--metrics', action='store_true', help='also report the latency of each stage of handling a message')
+    run(parser.parse_args())
@@ -0,0 +1,101 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+from cloudant.client import Cloudant
+from cloudant.document import Document
+from dotenv import load_dotenv
+from requests.exceptions import HTTPError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.cloudant_recipe_store import CloudantRecipeStore
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "../.env"))
+
+
+def read_modify_write_increment(store, user_doc, recipe_doc, conflicts):
+    # the counter model used before the by_user views: the count is embedded in the user doc
+    while True:
+        latest_user_doc = store.get_latest_doc(user_doc['_id'])
+        user_recipes = latest_user_doc.setdefault('recipes', [])
+        matching_recipes = [x for x in user_recipes if x['id'] == recipe_doc['name']]
+        if len(matching_recipes) > 0:
+            matching_recipes[0]['count'] += 1
+        else:
+            user_recipes.append({'id': recipe_doc['name'], 'title': recipe_doc['title'], 'count': 1})
+        try:
+            latest_user_doc.save()
+            return
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 409:
+                raise
+            # someone else saved the user doc first, read it again and retry
+            conflicts.append(1)
+
+
+def run_threads(num_threads, increments, increment):
+    def work():
+        for _ in range(increments):
+            increment()
+    threads = [threading.Thread(target=work) for _ in range(num_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+
+def run(client, thread_counts, increments):
+    db_name = 'bench_counters_{}'.format(uuid.uuid4().hex[:8])
+    store = CloudantRecipeStore(client, db_name, pool_size=max(thread_counts))
+    try:
+        store.init()
+        recipe_doc = {'_id': 'recipe:1', 'name': '1', 'title': 'Benchmark Recipe'}
+        print('{:>8} {:>22} {:>10} {:>12} {:>10} {:>10}'.format('threads', 'counter', 'seconds', 'increments/s', 'conflicts', 'count'))
+        for num_threads in thread_counts:
+            expected = num_threads * increments
+            # read-modify-write of the user doc
+            user_doc = store.add_user('bench-rmw-{}'.format(num_threads))
+            conflicts = []
+            elapsed = run_threads(num_threads, increments, lambda: read_modify_write_increment(store, user_doc, recipe_doc, conflicts))
+            latest_user_doc = Document(store.get_db(), user_doc['_id'])
+            latest_user_doc.fetch()
+            print('{:>8} {:>22} {:>10.2f} {:>12.1f} {:>10} {:>10}'.format(
+                num_threads, 'read-modify-write', elapsed, expected / elapsed, len(conflicts), latest_user_doc['recipes'][0]['count']))
+            # append-only request docs counted by the by_user/recipes view
+            user_doc = store.add_user('bench-append-{}'.format(num_threads))
+            start = time.time()
+            run_threads(num_threads, increments, lambda: store.record_recipe_request_for_user(recipe_doc, None, user_doc))
+            # include the time to write the queued request docs
+            store.flush()
+            elapsed = time.time() - start
+            rows = store.get_user_request_counts(user_doc, 'recipes')
+            print('{:>8} {:>22} {:>10.2f} {:>12.1f} {:>10} {:>10}'.format(
+                num_threads, 'append-only + view', elapsed, expected / elapsed, 0, rows[0]['value']))
+    finally:
+        store.close()
+        client.connect()
+        client.delete_database(db_name)
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measures contended increments of one user\'s recipe count from many threads.')
+    parser.add_argument('--threads', default='1,4,16,32', help='comma-separated numbers of threads incrementing the same counter')
+    parser.add_argument('--increments', type=int, default=50, help='number of increments per thread')
+    args = parser.parse_args()
+    recipe_store_url = os.environ.get("CLOUDANT_URL")
+    if recipe_store_url.find('@') > 0:
+        prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
+        suffix = recipe_store_url[recipe_store_url.find('@')+1:]
+        recipe_store_url = '{}{}'.format(prefix, suffix)
+    client = Cloudant(
+        os.environ.get("CLOUDANT_USERNAME"),
+        os.environ.get("CLOUDANT_PASSWORD"),
+        url=recipe_store_url
+    )
+    run(client, [int(x) for x in args.threads.split(',')], args.increments)
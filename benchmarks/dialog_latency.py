@@ -0,0 +1,101 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.local_dialog import LocalDialog
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "../.env"))
+
+# the messages sent by a user in each scripted conversation, the first one starts the conversation
+CONVERSATIONS = [
+    ['hi', 'i want a recipe', 'no', '{cuisine}', '{selection}'],
+    ['hi', 'i want a recipe', 'yes', '{ingredients}', '{selection}'],
+    ['hi', 'show me my favorite recipes', '{selection}'],
+    ['hi', 'what can i cook tonight?', 'something with {ingredients} please']
+]
+CUISINES = ['chinese', 'french', 'greek', 'indian', 'italian', 'japanese', 'mexican', 'thai']
+INGREDIENTS = ['beef', 'chicken', 'garlic', 'onions', 'rice', 'tomatoes']
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+
+def get_message(template):
+    return template.format(cuisine=random.choice(CUISINES),
+                           ingredients=', '.join(random.sample(INGREDIENTS, 2)),
+                           selection=random.randint(1, 5))
+
+
+def run_local(dialog, conversations):
+    # latency of each turn evaluated locally, and the number of turns that would be sent to watson
+    latencies = []
+    remote_turns = 0
+    for messages in conversations:
+        # watson starts the conversation, the local dialog takes over from there
+        context = dialog.message(messages[0], None, start=True, guess=True)['context']
+        remote_turns += 1
+        for text in messages[1:]:
+            start = time.time()
+            response = dialog.message(text, context)
+            elapsed = (time.time() - start) * 1000
+            if response is None:
+                remote_turns += 1
+                response = dialog.message(text, context, guess=True)
+            else:
+                latencies.append(elapsed)
+            context = response['context']
+    return latencies, remote_turns
+
+
+def run_remote(conversation_client, workspace_id, conversations):
+    latencies = []
+    for messages in conversations:
+        context = None
+        for text in messages:
+            start = time.time()
+            response = conversation_client.message(workspace_id=workspace_id, message_input={'text': text}, context=context)
+            latencies.append((time.time() - start) * 1000)
+            context = response['context']
+    return latencies
+
+
+def report(label, latencies):
+    if len(latencies) > 0:
+        print('{:>24} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            label, len(latencies), percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measures the latency of the dialog turns evaluated locally from workspace.json, '
+                                                 'the fraction of turns that can be, and the latency of the same turns sent to '
+                                                 'Watson Conversation if its credentials are in .env.')
+    parser.add_argument('--conversations', type=int, default=1000, help='number of scripted conversations')
+    parser.add_argument('--remote-conversations', type=int, default=20, help='number of scripted conversations sent to Watson')
+    parser.add_argument('--workspace', default=os.path.join(os.path.dirname(__file__), '..', 'workspace.json'),
+                        help='the exported workspace, it must be the one deployed to CONVERSATION_WORKSPACE_ID')
+    args = parser.parse_args()
+    dialog = LocalDialog.from_file(args.workspace)
+    conversations = [[get_message(template) for template in random.choice(CONVERSATIONS)] for _ in range(args.conversations)]
+    local_latencies, remote_turns = run_local(dialog, conversations)
+    turns = len(local_latencies) + remote_turns
+    print('{} turns, {} ({:.1f}%) evaluated locally, {} sent to Watson'.format(
+        turns, len(local_latencies), 100.0 * len(local_latencies) / turns, remote_turns))
+    print('')
+    print('{:>24} {:>8} {:>10} {:>10} {:>10}'.format('turn', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+    report('local', local_latencies)
+    if os.environ.get("CONVERSATION_USERNAME"):
+        from watson_developer_cloud import ConversationV1
+        conversation_client = ConversationV1(
+            username=os.environ.get("CONVERSATION_USERNAME"),
+            password=os.environ.get("CONVERSATION_PASSWORD"),
+            version='2016-07-11'
+        )
+        report('watson', run_remote(conversation_client, os.environ.get("CONVERSATION_WORKSPACE_ID"),
+                                    conversations[:args.remote_conversations]))
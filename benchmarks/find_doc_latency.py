@@ -0,0 +1,93 @@
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+from cloudant.client import Cloudant
+from dotenv import load_dotenv
+from requests.exceptions import HTTPError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.cloudant_recipe_store import CloudantRecipeStore
+from souschef.doc_cache import DocCache
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "../.env"))
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+
+def measure(fn, names):
+    latencies = []
+    for name in names:
+        start = time.time()
+        fn(name)
+        latencies.append((time.time() - start) * 1000)
+    return latencies
+
+
+def fill(db, start, end, batch_size=1000):
+    # a realistic mix: one cuisine doc for every ten request docs
+    for i in range(start, end, batch_size):
+        docs = []
+        for j in range(i, min(i + batch_size, end)):
+            if j % 10 == 0:
+                name = 'cuisine-{}'.format(j)
+                docs.append({'_id': CloudantRecipeStore.get_doc_id('cuisine', name), 'type': 'cuisine', 'name': name, 'recipes': []})
+            else:
+                docs.append({'type': 'userCuisineRequest', 'user_id': 'user:U{}'.format(j % 100), 'cuisine_name': 'cuisine-{}'.format(j - j % 10), 'date': j})
+        db.bulk_docs(docs)
+
+
+def run(client, sizes, lookups):
+    db_name = 'bench_find_doc_{}'.format(uuid.uuid4().hex[:8])
+    # no caching, every lookup goes to Cloudant
+    store = CloudantRecipeStore(client, db_name, doc_cache=DocCache(ttls={'cuisine': 0}))
+    store.connect()
+    client.create_database(db_name)
+    try:
+        db = store.get_db()
+        print('{:>10} {:>28} {:>10} {:>10} {:>10}'.format('docs', 'lookup', 'p50 ms', 'p95 ms', 'p99 ms'))
+        doc_count = 0
+        for size in sizes:
+            fill(db, doc_count, size)
+            doc_count = size
+            names = ['cuisine-{}'.format(random.randrange(0, size, 10)) for _ in range(lookups)]
+            results = [('find_doc (GET by ID)', measure(lambda name: store.find_doc('cuisine', 'name', name), names))]
+            for index in CloudantRecipeStore.QUERY_INDEXES:
+                try:
+                    db.delete_query_index(index['name'], 'json', index['name'])
+                except HTTPError:
+                    # the index does not exist yet
+                    pass
+            results.append(('query type+name (no index)', measure(lambda name: store.query_doc('cuisine', 'name', name), names)))
+            store.create_query_indexes()
+            results.append(('query type+name (indexed)', measure(lambda name: store.query_doc('cuisine', 'name', name), names)))
+            for label, latencies in results:
+                print('{:>10} {:>28} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                    size, label, percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+    finally:
+        client.delete_database(db_name)
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measures find_doc latency against database size with and without the query indexes.')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='comma-separated database sizes to measure')
+    parser.add_argument('--lookups', type=int, default=200, help='number of lookups measured per size')
+    args = parser.parse_args()
+    recipe_store_url = os.environ.get("CLOUDANT_URL")
+    if recipe_store_url.find('@') > 0:
+        prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
+        suffix = recipe_store_url[recipe_store_url.find('@')+1:]
+        recipe_store_url = '{}{}'.format(prefix, suffix)
+    client = Cloudant(
+        os.environ.get("CLOUDANT_USERNAME"),
+        os.environ.get("CLOUDANT_PASSWORD"),
+        url=recipe_store_url
+    )
+    run(client, [int(x) for x in args.sizes.split(',')], args.lookups)
@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.normalizer import EditDistanceIndex, get_edit_distance
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+
+def misspell(word):
+    # one random substitution, deletion, insertion or transposition
+    i = random.randrange(len(word) - 1)
+    edit = random.choice(['substitute', 'delete', 'insert', 'transpose'])
+    if edit == 'substitute':
+        return word[:i] + random.choice(string.ascii_lowercase) + word[i + 1:]
+    if edit == 'delete':
+        return word[:i] + word[i + 1:]
+    if edit == 'insert':
+        return word[:i] + random.choice(string.ascii_lowercase) + word[i:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def scan(terms, word, max_distance):
+    # the closest term found by computing the distance to every term
+    best = None
+    best_distance = max_distance + 1
+    for term in terms:
+        distance = get_edit_distance(word, term, max_distance)
+        if distance < best_distance:
+            best = term
+            best_distance = distance
+    return best
+
+
+def measure(fn, words):
+    latencies = []
+    for word in words:
+        start = time.time()
+        fn(word)
+        latencies.append((time.time() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measures the latency of correcting a misspelled ingredient with the edit distance '
+                                                 'index against vocabulary size, compared to computing the distance to every term.')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated vocabulary sizes to measure')
+    parser.add_argument('--lookups', type=int, default=1000, help='number of lookups measured per size')
+    parser.add_argument('--max-distance', type=int, default=2, help='max edit distance of a correction')
+    args = parser.parse_args()
+    print('{:>10} {:>10} {:>10} {:>10} {:>10}'.format('terms', 'lookup', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for size in [int(x) for x in args.sizes.split(',')]:
+        terms = list(set(''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(5, 14))) for _ in range(size)))
+        index = EditDistanceIndex(args.max_distance)
+        for term in terms:
+            index.add(term)
+        words = [misspell(random.choice(terms)) for _ in range(args.lookups)]
+        results = [('index', measure(index.lookup, words))]
+        # the scan is slow, measure fewer lookups
+        results.append(('scan', measure(lambda word: scan(terms, word, args.max_distance), words[:max(1, args.lookups // 20)])))
+        for label, latencies in results:
+            print('{:>10} {:>10} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                len(terms), label, percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
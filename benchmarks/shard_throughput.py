@@ -0,0 +1,107 @@
+import argparse
+import functools
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.sharding import ShardedDispatcher
+from souschef.souschef import SousChef
+
+
+def busy_wait(seconds):
+    # holds the GIL like parsing and building responses does
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class FakeSlackClient(object):
+
+    def __init__(self, handled):
+        self.handled = handled
+
+    def api_call(self, method, **kwargs):
+        with self.handled.get_lock():
+            self.handled.value += 1
+
+
+class FakeConversationClient(object):
+
+    def __init__(self, cpu_ms, io_ms):
+        self.cpu_ms = cpu_ms
+        self.io_ms = io_ms
+
+    def message(self, workspace_id, message_input, context):
+        time.sleep(self.io_ms / 1000.0)
+        busy_wait(self.cpu_ms / 1000.0)
+        return {'context': {}, 'entities': [], 'output': {'text': ['Hi! What ingredients or cuisine are you in the mood for?']}}
+
+
+class FakeRecipeClient(object):
+
+    def close(self):
+        pass
+
+
+class FakeRecipeStore(object):
+
+    def init(self):
+        pass
+
+    def get_known_ingredients(self):
+        return []
+
+    def add_user(self, user_id):
+        return {'_id': 'user:{}'.format(user_id), 'type': 'user', 'name': user_id}
+
+    def close(self):
+        pass
+
+
+def create_souschef(handled, cpu_ms, io_ms, num_workers):
+    return SousChef('BOT', FakeSlackClient(handled), FakeConversationClient(cpu_ms, io_ms), 'workspace',
+                    FakeRecipeClient(), FakeRecipeStore(), num_workers=num_workers)
+
+
+def measure(dispatcher, handled, num_users, num_messages):
+    handled.value = 0
+    start = time.time()
+    for i in range(num_messages):
+        user_id = 'U{}'.format(i % num_users)
+        dispatcher.dispatch(user_id, 'hi', user_id, 'C1')
+    while handled.value < num_messages:
+        time.sleep(0.01)
+    return time.time() - start
+
+
+def run(shard_counts, num_users, num_messages, cpu_ms, io_ms, num_workers):
+    handled = multiprocessing.Value('i', 0)
+    factory = functools.partial(create_souschef, handled, cpu_ms, io_ms, num_workers)
+    print('{:>10} {:>10} {:>14}'.format('shards', 'seconds', 'messages/s'))
+    # the single process bot for comparison
+    souschef = factory()
+    souschef.open()
+    elapsed = measure(souschef.dispatcher, handled, num_users, num_messages)
+    souschef.close()
+    print('{:>10} {:>10.2f} {:>14.1f}'.format('none', elapsed, num_messages / elapsed))
+    for num_shards in shard_counts:
+        dispatcher = ShardedDispatcher(factory, num_shards)
+        dispatcher.start()
+        elapsed = measure(dispatcher, handled, num_users, num_messages)
+        dispatcher.stop()
+        print('{:>10} {:>10.2f} {:>14.1f}'.format(num_shards, elapsed, num_messages / elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measures message throughput as the number of shard processes grows, '
+                                                 'with fake clients that spend --cpu-ms holding the GIL and --io-ms waiting per message.')
+    parser.add_argument('--shards', default='1,2,4,8', help='comma-separated numbers of shard processes')
+    parser.add_argument('--users', type=int, default=200, help='number of users sending messages')
+    parser.add_argument('--messages', type=int, default=2000, help='number of messages sent')
+    parser.add_argument('--cpu-ms', type=float, default=2, help='milliseconds of CPU work per message')
+    parser.add_argument('--io-ms', type=float, default=20, help='milliseconds waiting on I/O per message')
+    parser.add_argument('--workers', type=int, default=8, help='number of worker threads in each process')
+    args = parser.parse_args()
+    run([int(x) for x in args.shards.split(',')], args.users, args.messages, args.cpu_ms, args.io_ms, args.workers)
@@ -0,0 +1,537 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+
+
+class InjectedError(Exception):
+    pass
+
+
+class Faults(object):
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0):
+        """
+        Creates a new instance of Faults, the latency and errors injected into each call to a stand-in.
+        Parameters
+        ----------
+        latency_ms - The number of milliseconds each call waits
+        jitter_ms - The max number of milliseconds randomly added to the latency of each call
+        error_rate - The fraction of calls that fail, between 0 and 1
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = 0
+
+    def inject(self, name):
+        """
+        Counts a call, waits for its latency and returns True if the call should fail.
+        Parameters
+        ----------
+        name - The name the call is counted under
+        """
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if random.random() < self.error_rate:
+            with self.lock:
+                self.errors += 1
+            return True
+        return False
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.errors = 0
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+
+# Slack and Watson
+
+
+class FakeSlackClient(object):
+
+    def __init__(self, faults):
+        """
+        Creates a new instance of FakeSlackClient, which stands in for SlackClient when posting messages.
+        The messages posted to each channel can be waited for with wait_for_post.
+        Parameters
+        ----------
+        faults - The latency and errors injected into each call
+        """
+        self.faults = faults
+        self.posted = threading.Condition()
+        # channel -> the texts posted, None for a post that failed
+        self.posts = {}
+
+    def api_call(self, method, **kwargs):
+        failed = self.faults.inject(method)
+        if method == 'chat.postMessage':
+            with self.posted:
+                self.posts.setdefault(kwargs['channel'], []).append(None if failed else kwargs['text'])
+                self.posted.notify_all()
+        if failed:
+            raise InjectedError('Injected Slack error in {}'.format(method))
+        return {'ok': True}
+
+    def wait_for_post(self, channel, timeout=None):
+        """
+        Waits for the next message posted to the channel and returns its text, or None if posting it failed.
+        Raises InjectedError if nothing is posted within timeout seconds.
+        Parameters
+        ----------
+        channel - The ID of the channel
+        timeout - The max number of seconds to wait, or None to wait forever
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.posted:
+            while len(self.posts.get(channel, [])) == 0:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise InjectedError('Nothing was posted to {} in {} seconds'.format(channel, timeout))
+                self.posted.wait(remaining)
+            return self.posts[channel].pop(0)
+
+
+class FakeConversationClient(object):
+
+    def __init__(self, faults, dialog):
+        """
+        Creates a new instance of FakeConversationClient, which stands in for ConversationV1 by evaluating the dialog of
+        the workspace locally. Only the examples of each intent are recognized, which covers the scripted conversations.
+        Parameters
+        ----------
+        faults - The latency and errors injected into each call
+        dialog - The LocalDialog of the workspace (for example LocalDialog.from_file('workspace.json'))
+        """
+        self.faults = faults
+        self.dialog = dialog
+
+    def message(self, workspace_id, message_input=None, context=None):
+        if self.faults.inject('message'):
+            raise InjectedError('Injected Watson error')
+        response = self.dialog.message(message_input['text'], context, start=True, guess=True)
+        if response is None:
+            raise ValueError('The dialog uses conditions or expressions that LocalDialog does not evaluate')
+        return response
+
+
+# HTTP stand-ins
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, handler_class, faults, port=0):
+        """
+        Creates a new instance of StandInServer, a local HTTP server answering on 127.0.0.1 in a background thread.
+        Parameters
+        ----------
+        handler_class - The request handler class
+        faults - The latency and errors injected into each request
+        port - The port to listen on, a free port is picked if 0
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), handler_class)
+        self.faults = faults
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name=self.__class__.__name__)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, like the real services
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length).decode('utf-8') if length > 0 else ''
+        # the cloudant library logs in with a form
+        if len(data) == 0 or 'json' not in self.headers.get('Content-Type', 'application/json'):
+            return None
+        return json.loads(data)
+
+    def handle_any(self):
+        url = urlparse(self.path)
+        path = [unquote(part) for part in url.path.split('/') if part]
+        params = dict((name, values[0]) for name, values in parse_qs(url.query).items())
+        body = self.read_json() if self.command in ('POST', 'PUT') else None
+        if self.server.faults.inject(self.get_call_name(path)):
+            self.send_json(500, {'error': 'injected'})
+            return
+        try:
+            self.route(path, params, body)
+        except Exception as e:
+            self.send_json(500, {'error': 'internal', 'reason': str(e)})
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = handle_any
+
+    def get_call_name(self, path):
+        raise NotImplementedError()
+
+    def route(self, path, params, body):
+        raise NotImplementedError()
+
+
+class SpoonacularRequestHandler(StandInRequestHandler):
+
+    def get_call_name(self, path):
+        # recipes/123/information -> information
+        return path[-1] if len(path) > 0 else ''
+
+    def route(self, path, params, body):
+        if path == ['recipes', 'findByIngredients']:
+            self.send_json(200, self.get_recipes_by_ingredients(params['ingredients'], params.get('number', 5)))
+        elif path == ['recipes', 'search']:
+            self.send_json(200, {'results': self.get_recipes(params['cuisine'], params.get('number', 5))})
+        elif len(path) == 3 and path[0] == 'recipes' and path[2] == 'information':
+            self.send_json(200, {'id': int(path[1]), 'title': 'Recipe {}'.format(path[1]), 'readyInMinutes': 30, 'servings': 4})
+        elif len(path) == 3 and path[0] == 'recipes' and path[2] == 'analyzedInstructions':
+            steps = [{'number': i + 1, 'step': 'Step {} of recipe {}.'.format(i + 1, path[1]), 'equipment': [{'name': 'pan'}]}
+                     for i in range(5)]
+            self.send_json(200, [{'name': '', 'steps': steps}])
+        else:
+            self.send_json(404, {'message': 'not found'})
+
+    @staticmethod
+    def get_recipes(query, number):
+        # the same query always returns the same recipes, and different queries share some of them
+        seed = sum(ord(c) for c in query)
+        return [{'id': (seed + i * 7) % 1000, 'title': 'Recipe {}'.format((seed + i * 7) % 1000)} for i in range(int(number))]
+
+    @classmethod
+    def get_recipes_by_ingredients(cls, ingredients, number):
+        # like findByIngredients with ranking=1, the first recipes use all of the ingredients and the others only some
+        count = len([x for x in ingredients.split(',') if x.strip()])
+        recipes = cls.get_recipes(ingredients, number)
+        for i, recipe in enumerate(recipes):
+            recipe['usedIngredientCount'] = count if i < 3 else max(1, count - 1)
+            recipe['missedIngredientCount'] = i
+        return recipes
+
+
+class SpoonacularStandIn(StandInServer):
+
+    def __init__(self, faults, port=0):
+        """
+        Creates a new instance of SpoonacularStandIn, which answers the Spoonacular endpoints used by RecipeClient.
+        Use its url as the RecipeClient endpoint.
+        Parameters
+        ----------
+        faults - The latency and errors injected into each request
+        port - The port to listen on, a free port is picked if 0
+        """
+        StandInServer.__init__(self, SpoonacularRequestHandler, faults, port)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server_port)
+
+
+def collation_key(value):
+    # orders view keys the way CouchDB does: null, booleans, numbers, strings, arrays, objects
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, (list, tuple)):
+        return (4, tuple(collation_key(v) for v in value))
+    if isinstance(value, dict):
+        return (5,)
+    return (3, value)
+
+
+def match_selector(doc, selector):
+    for name, condition in selector.items():
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, operand in condition.items():
+            if operator == '$eq' and doc.get(name) != operand:
+                return False
+            if operator == '$in' and doc.get(name) not in operand:
+                return False
+            if operator == '$exists' and (name in doc) != operand:
+                return False
+            if operator == '$gt' and (name not in doc or not doc[name] > operand):
+                return False
+    return True
+
+
+# python versions of the map functions in CloudantRecipeStore.DESIGN_DOCS
+
+
+def by_user_recipes(doc):
+    if doc.get('type') == 'userRecipeRequest':
+        yield [doc['user_id'], doc.get('recipe_name') or re.sub('^recipe:', '', doc['recipe_id']), doc['recipe_title']], 1
+
+
+def by_ingredient_cuisine_recipes(doc):
+    if doc.get('type') == 'userRecipeRequest' and doc.get('ingredient_cuisine_id'):
+        yield [doc['ingredient_cuisine_id'], doc['recipe_name'], doc['recipe_title']], 1
+
+
+def get_weekday(date):
+    # new Date(date).getDay() on a server in UTC
+    return ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'][(time.gmtime(date / 1000.0).tm_wday + 1) % 7]
+
+
+def emit_if_type(doc_type, get_key):
+    def map_doc(doc):
+        if doc.get('type') == doc_type:
+            yield get_key(doc), 1
+    return map_doc
+
+
+VIEWS = {
+    ('by_popularity', 'ingredients'): emit_if_type('userIngredientRequest', lambda doc: doc['ingredient_name']),
+    ('by_popularity', 'cuisines'): emit_if_type('userCuisineRequest', lambda doc: doc['cuisine_name']),
+    ('by_popularity', 'recipes'): emit_if_type('userRecipeRequest', lambda doc: doc['recipe_title']),
+    ('by_day_of_week', 'ingredients'): emit_if_type('userIngredientRequest', lambda doc: get_weekday(doc['date'])),
+    ('by_day_of_week', 'cuisines'): emit_if_type('userCuisineRequest', lambda doc: get_weekday(doc['date'])),
+    ('by_day_of_week', 'recipes'): emit_if_type('userRecipeRequest', lambda doc: get_weekday(doc['date'])),
+    ('by_user', 'ingredients'): emit_if_type('userIngredientRequest', lambda doc: [doc['user_id'], doc['ingredient_name']]),
+    ('by_user', 'cuisines'): emit_if_type('userCuisineRequest', lambda doc: [doc['user_id'], doc['cuisine_name']]),
+    ('by_user', 'recipes'): by_user_recipes,
+    ('by_ingredient_cuisine', 'recipes'): by_ingredient_cuisine_recipes
+}
+
+
+class CouchDBRequestHandler(StandInRequestHandler):
+
+    def get_call_name(self, path):
+        if len(path) == 0 or path[0].startswith('_'):
+            return '/'.join(path)
+        if len(path) == 1:
+            return 'db'
+        if path[1] == '_design' and len(path) == 5:
+            return '_view'
+        if path[1].startswith('_'):
+            return path[1]
+        return 'doc'
+
+    def route(self, path, params, body):
+        server = self.server
+        if path == ['_session']:
+            self.send_json(200, {'ok': True, 'userCtx': {'name': 'admin', 'roles': []}},
+                           {'Set-Cookie': 'AuthSession=standin; Path=/'})
+        elif path == ['_all_dbs']:
+            self.send_json(200, sorted(server.dbs.keys()))
+        elif len(path) == 0:
+            self.send_json(200, {'couchdb': 'Welcome'})
+        elif len(path) == 1 and self.command == 'PUT':
+            with server.lock:
+                if path[0] in server.dbs:
+                    self.send_json(412, {'error': 'file_exists'})
+                    return
+                server.dbs[path[0]] = {}
+            self.send_json(201, {'ok': True})
+        elif path[0] not in server.dbs:
+            self.send_json(404, {'error': 'not_found', 'reason': 'Database does not exist.'})
+        elif len(path) == 1 and self.command == 'DELETE':
+            with server.lock:
+                del server.dbs[path[0]]
+            self.send_json(200, {'ok': True})
+        elif len(path) == 1 and self.command == 'POST':
+            self.save_doc(path[0], body.get('_id') or uuid.uuid4().hex, body, True)
+        elif len(path) == 1:
+            self.send_json(200, {'db_name': path[0], 'doc_count': len(server.dbs[path[0]])})
+        elif path[1] == '_find':
+            self.find(path[0], body)
+        elif path[1] == '_bulk_docs':
+            self.send_json(201, [server.write_doc(path[0], doc) for doc in body['docs']])
+        elif path[1] == '_all_docs':
+            self.all_docs(path[0], params, body)
+        elif path[1] == '_index':
+            self.send_json(200, {'result': 'exists', 'id': '_design/{}'.format(body.get('ddoc')), 'name': body.get('name')})
+        elif path[1] == '_explain':
+            # the store only checks that its own index is used
+            self.send_json(200, {'index': {'ddoc': '_design/type-name', 'name': 'type-name', 'type': 'json'}})
+        elif path[1] == '_design' and len(path) == 5 and path[3] == '_view':
+            self.view(path[0], path[2], path[4], params)
+        else:
+            self.doc(path[0], '/'.join(path[1:]), body)
+
+    def doc(self, db_name, doc_id, body):
+        db = self.server.dbs[db_name]
+        if self.command in ('GET', 'HEAD'):
+            doc = db.get(doc_id)
+            if doc is None:
+                self.send_json(404, {'error': 'not_found', 'reason': 'missing'})
+            else:
+                self.send_json(200, doc)
+        elif self.command == 'PUT':
+            self.save_doc(db_name, doc_id, body, False)
+        elif self.command == 'DELETE':
+            with self.server.lock:
+                db.pop(doc_id, None)
+            self.send_json(200, {'ok': True})
+        else:
+            self.send_json(405, {'error': 'method_not_allowed'})
+
+    def save_doc(self, db_name, doc_id, doc, create):
+        result = self.server.write_doc(db_name, dict(doc, _id=doc_id), create)
+        if 'error' in result:
+            self.send_json(409, result)
+        else:
+            self.send_json(201, result)
+
+    def find(self, db_name, body):
+        with self.server.lock:
+            docs = [doc for _, doc in sorted(self.server.dbs[db_name].items()) if match_selector(doc, body['selector'])]
+        docs = docs[body.get('skip', 0):]
+        if 'limit' in body:
+            docs = docs[:body['limit']]
+        if body.get('fields'):
+            docs = [dict((name, doc[name]) for name in body['fields'] if name in doc) for doc in docs]
+        self.send_json(200, {'docs': docs})
+
+    def all_docs(self, db_name, params, body):
+        with self.server.lock:
+            db = dict(self.server.dbs[db_name])
+        if body is not None and 'keys' in body:
+            rows = [{'id': key, 'key': key, 'value': {'rev': db[key]['_rev']}, 'doc': db[key]} if key in db
+                    else {'key': key, 'error': 'not_found'} for key in body['keys']]
+        else:
+            rows = [{'id': doc_id, 'key': doc_id, 'value': {'rev': doc['_rev']}, 'doc': doc} for doc_id, doc in sorted(db.items())]
+            if 'startkey' in params:
+                startkey = json.loads(params['startkey'])
+                rows = [row for row in rows if row['key'] >= startkey]
+            if 'endkey' in params:
+                endkey = json.loads(params['endkey'])
+                rows = [row for row in rows if row['key'] <= endkey]
+            rows = rows[int(params.get('skip', 0)):]
+            if 'limit' in params:
+                rows = rows[:int(params['limit'])]
+        if params.get('include_docs') != 'true':
+            for row in rows:
+                row.pop('doc', None)
+        self.send_json(200, {'total_rows': len(db), 'offset': 0, 'rows': rows})
+
+    def view(self, db_name, design_doc, view_name, params):
+        map_doc = VIEWS.get((design_doc, view_name))
+        if map_doc is None:
+            self.send_json(404, {'error': 'not_found', 'reason': 'missing_named_view'})
+            return
+        with self.server.lock:
+            docs = list(self.server.dbs[db_name].values())
+        rows = sorted(((key, value, doc['_id']) for doc in docs for key, value in map_doc(doc)),
+                      key=lambda row: collation_key(row[0]))
+        if 'startkey' in params:
+            startkey = collation_key(json.loads(params['startkey']))
+            rows = [row for row in rows if collation_key(row[0]) >= startkey]
+        if 'endkey' in params:
+            endkey = collation_key(json.loads(params['endkey']))
+            rows = [row for row in rows if collation_key(row[0]) <= endkey]
+        if params.get('reduce') == 'false':
+            self.send_json(200, {'rows': [{'id': doc_id, 'key': key, 'value': value} for key, value, doc_id in rows]})
+            return
+        group_level = None
+        if 'group_level' in params:
+            group_level = int(params['group_level'])
+        elif params.get('group') == 'true':
+            group_level = -1
+        groups = []
+        for key, value, _ in rows:
+            if group_level is None:
+                group_key = None
+            elif group_level >= 0 and isinstance(key, list):
+                group_key = key[:group_level]
+            else:
+                group_key = key
+            if len(groups) > 0 and groups[-1][0] == group_key:
+                groups[-1][1] += value
+            else:
+                groups.append([group_key, value])
+        self.send_json(200, {'rows': [{'key': key, 'value': value} for key, value in groups]})
+
+
+class CouchDBStandIn(StandInServer):
+
+    def __init__(self, faults, port=0):
+        """
+        Creates a new instance of CouchDBStandIn, an in-memory server answering the CouchDB requests made by
+        CloudantRecipeStore and the cloudant library: sessions, databases, docs, _bulk_docs, _all_docs, _find and
+        the views in CloudantRecipeStore.DESIGN_DOCS (as python functions, design docs are stored but not run).
+        Parameters
+        ----------
+        faults - The latency and errors injected into each request
+        port - The port to listen on, a free port is picked if 0
+        """
+        StandInServer.__init__(self, CouchDBRequestHandler, faults, port)
+        self.dbs = {}
+        self.lock = threading.Lock()
+
+    def write_doc(self, db_name, doc, create=False):
+        """
+        Writes a doc if its _rev is the latest revision, returns the result as returned by _bulk_docs.
+        Parameters
+        ----------
+        db_name - The name of the database
+        doc - The doc to write, a new ID is generated if it has none
+        create - True to fail if the doc exists even when it has no _rev
+        """
+        doc = dict(doc)
+        doc_id = doc.setdefault('_id', uuid.uuid4().hex)
+        with self.lock:
+            db = self.dbs[db_name]
+            existing = db.get(doc_id)
+            if (existing is not None and (create or existing['_rev'] != doc.get('_rev'))) or \
+                    (existing is None and doc.get('_rev') is not None):
+                return {'id': doc_id, 'error': 'conflict', 'reason': 'Document update conflict.'}
+            generation = int(existing['_rev'].split('-')[0]) + 1 if existing is not None else 1
+            doc['_rev'] = '{}-{}'.format(generation, uuid.uuid4().hex)
+            if doc.get('_deleted'):
+                db.pop(doc_id, None)
+            else:
+                db[doc_id] = doc
+        return {'ok': True, 'id': doc_id, 'rev': doc['_rev']}
@@ -1,4 +1,5 @@
 import os
+import signal
 import sys
 
 from cloudant.client import Cloudant
@@ -6,43 +7,90 @@ from dotenv import load_dotenv
 from slackclient import SlackClient
 from watson_developer_cloud import ConversationV1
 
+from souschef import log
 from souschef.recipe import RecipeClient
 from souschef.cloudant_recipe_store import CloudantRecipeStore
+from souschef.local_dialog import LocalDialog, LocalDialogClient
+from souschef.normalizer import Normalizer
+from souschef.session_store import InMemorySessionStore, SqliteSessionStore
+from souschef.sharding import ShardedSousChef
 from souschef.souschef import SousChef
 
+# load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+# the workspace imported into Watson Conversation, its entities seed the cuisines and ingredients the bot recognizes
+WORKSPACE_FILE = os.path.join(os.path.dirname(__file__), "workspace.json")
+
+
+def configure_logging():
+    # LOG_SAMPLE_RATE is the fraction of the high volume records (datastore hits) that are written
+    log.configure(level=os.environ.get("LOG_LEVEL", "INFO"),
+                  sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", 1.0)),
+                  json_format=os.environ.get("LOG_FORMAT", "json") == "json")
+    # kill -USR1 switches to debug logging and back without restarting
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, log.toggle_debug)
+
+
+def create_souschef():
+    slack_bot_id = os.environ.get("SLACK_BOT_ID")
+    slack_client = SlackClient(os.environ.get('SLACK_BOT_TOKEN'))
+    conversation_workspace_id = os.environ.get("CONVERSATION_WORKSPACE_ID")
+    conversation_client = ConversationV1(
+        username=os.environ.get("CONVERSATION_USERNAME"),
+        password=os.environ.get("CONVERSATION_PASSWORD"),
+        version='2016-07-11'
+    )
+    # evaluate the dialog locally where Watson isn't needed if CONVERSATION_WORKSPACE_FILE is the exported workspace
+    conversation_workspace_file = os.environ.get("CONVERSATION_WORKSPACE_FILE")
+    if conversation_workspace_file:
+        conversation_client = LocalDialogClient(conversation_client, LocalDialog.from_file(conversation_workspace_file))
+    # optional max number of requests per second sent to Spoonacular, to stay within the plan's rate limit
+    spoonacular_rate_limit = os.environ.get("SPOONACULAR_RATE_LIMIT")
+    recipe_client = RecipeClient(
+        os.environ.get("SPOONACULAR_KEY"),
+        rate_limit=float(spoonacular_rate_limit) if spoonacular_rate_limit else None
+    )
+    recipe_store_url = os.environ.get("CLOUDANT_URL")
+    if recipe_store_url.find('@') > 0:
+        prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
+        suffix = recipe_store_url[recipe_store_url.find('@')+1:]
+        recipe_store_url = '{}{}'.format(prefix, suffix)
+    recipe_store = CloudantRecipeStore(
+        Cloudant(
+            os.environ.get("CLOUDANT_USERNAME"),
+            os.environ.get("CLOUDANT_PASSWORD"),
+            url=recipe_store_url
+        ),
+        os.environ.get("CLOUDANT_DB_NAME")
+    )
+    # keep conversations in a local database if SESSION_STORE_PATH is set, so they survive restarts
+    session_store_path = os.environ.get("SESSION_STORE_PATH")
+    session_store = SqliteSessionStore(session_store_path) if session_store_path else InMemorySessionStore()
+    return SousChef(slack_bot_id,
+                    slack_client,
+                    conversation_client,
+                    conversation_workspace_id,
+                    recipe_client,
+                    recipe_store,
+                    recipe_prefetch_budget=int(os.environ.get("SPOONACULAR_PREFETCH_BUDGET", 0)),
+                    session_store=session_store,
+                    normalizer=Normalizer.from_file(conversation_workspace_file or WORKSPACE_FILE))
+
+
 if __name__ == "__main__":
+    configure_logging()
     try:
-        # load environment variables
-        load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
-        slack_bot_id = os.environ.get("SLACK_BOT_ID")
-        slack_client = SlackClient(os.environ.get('SLACK_BOT_TOKEN'))
-        conversation_workspace_id = os.environ.get("CONVERSATION_WORKSPACE_ID")
-        conversation_client = ConversationV1(
-            username=os.environ.get("CONVERSATION_USERNAME"),
-            password=os.environ.get("CONVERSATION_PASSWORD"),
-            version='2016-07-11'
-        )
-        recipe_client = RecipeClient(os.environ.get("SPOONACULAR_KEY"))
-        recipe_store_url = os.environ.get("CLOUDANT_URL")
-        if recipe_store_url.find('@') > 0:
-            prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
-            suffix = recipe_store_url[recipe_store_url.find('@')+1:]
-            recipe_store_url = '{}{}'.format(prefix, suffix)
-        recipe_store = CloudantRecipeStore(
-            Cloudant(
-                os.environ.get("CLOUDANT_USERNAME"),
-                os.environ.get("CLOUDANT_PASSWORD"),
-                url=recipe_store_url
-            ),
-            os.environ.get("CLOUDANT_DB_NAME")
-        )
+        # with NUM_SHARDS > 1 this process only reads from slack and the messages are handled by NUM_SHARDS worker processes
+        num_shards = int(os.environ.get("NUM_SHARDS", 1))
+        if num_shards > 1:
+            souschef = ShardedSousChef(os.environ.get("SLACK_BOT_ID"),
+                                       SlackClient(os.environ.get('SLACK_BOT_TOKEN')),
+                                       create_souschef,
+                                       num_shards)
+        else:
+            souschef = create_souschef()
         # start the souschef bot
-        souschef = SousChef(slack_bot_id,
-                            slack_client,
-                            conversation_client,
-                            conversation_workspace_id,
-                            recipe_client,
-                            recipe_store)
         souschef.start()
         sys.stdin.readline()
     except (KeyboardInterrupt, SystemExit):
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import signal
+
+import aiohttp
+from dotenv import load_dotenv
+
+from souschef import log
+from souschef.async_cloudant_recipe_store import AsyncCloudantRecipeStore
+from souschef.async_conversation import AsyncConversationClient, AsyncLocalDialogClient
+from souschef.async_recipe import AsyncRecipeClient
+from souschef.async_slack import AsyncSlackClient
+from souschef.async_souschef import AsyncSousChef
+from souschef.local_dialog import LocalDialog
+from souschef.normalizer import Normalizer
+from souschef.session_store import InMemorySessionStore, SqliteSessionStore
+
+# the workspace imported into Watson Conversation, its entities seed the cuisines and ingredients the bot recognizes
+WORKSPACE_FILE = os.path.join(os.path.dirname(__file__), "workspace.json")
+
+
+def create_session(max_connections):
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+
+
+async def main():
+    # load environment variables
+    load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+    log.configure(level=os.environ.get("LOG_LEVEL", "INFO"),
+                  sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", 1.0)),
+                  json_format=os.environ.get("LOG_FORMAT", "json") == "json")
+    max_connections = int(os.environ.get("MAX_CONNECTIONS_PER_SERVICE", 100))
+    # one session per service so a slow service can't use up the connections of the others
+    slack_session = create_session(max_connections)
+    conversation_session = create_session(max_connections)
+    recipe_session = create_session(max_connections)
+    recipe_store_session = create_session(max_connections)
+    try:
+        slack_bot_id = os.environ.get("SLACK_BOT_ID")
+        slack_client = AsyncSlackClient(slack_session, os.environ.get('SLACK_BOT_TOKEN'))
+        conversation_workspace_id = os.environ.get("CONVERSATION_WORKSPACE_ID")
+        conversation_client = AsyncConversationClient(
+            conversation_session,
+            os.environ.get("CONVERSATION_USERNAME"),
+            os.environ.get("CONVERSATION_PASSWORD"),
+            version='2016-07-11'
+        )
+        # evaluate the dialog locally where Watson isn't needed if CONVERSATION_WORKSPACE_FILE is the exported workspace
+        conversation_workspace_file = os.environ.get("CONVERSATION_WORKSPACE_FILE")
+        if conversation_workspace_file:
+            conversation_client = AsyncLocalDialogClient(conversation_client, LocalDialog.from_file(conversation_workspace_file))
+        recipe_client = AsyncRecipeClient(recipe_session, os.environ.get("SPOONACULAR_KEY"))
+        recipe_store_url = os.environ.get("CLOUDANT_URL")
+        if recipe_store_url.find('@') > 0:
+            prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
+            suffix = recipe_store_url[recipe_store_url.find('@')+1:]
+            recipe_store_url = '{}{}'.format(prefix, suffix)
+        recipe_store = AsyncCloudantRecipeStore(
+            recipe_store_session,
+            recipe_store_url,
+            os.environ.get("CLOUDANT_USERNAME"),
+            os.environ.get("CLOUDANT_PASSWORD"),
+            os.environ.get("CLOUDANT_DB_NAME")
+        )
+        # keep conversations in a local database if SESSION_STORE_PATH is set, so they survive restarts
+        session_store_path = os.environ.get("SESSION_STORE_PATH")
+        session_store = SqliteSessionStore(session_store_path) if session_store_path else InMemorySessionStore()
+        # start the souschef bot
+        souschef = AsyncSousChef(slack_bot_id,
+                                 slack_client,
+                                 conversation_client,
+                                 conversation_workspace_id,
+                                 recipe_client,
+                                 recipe_store,
+                                 recipe_prefetch_budget=int(os.environ.get("SPOONACULAR_PREFETCH_BUDGET", 0)),
+                                 session_store=session_store,
+                                 normalizer=Normalizer.from_file(conversation_workspace_file or WORKSPACE_FILE))
+
+        def shutdown():
+            souschef.stop()
+            # closing the websocket wakes up the rtm read
+            asyncio.ensure_future(slack_client.close())
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, shutdown)
+        loop.add_signal_handler(signal.SIGUSR1, log.toggle_debug)
+        await souschef.run()
+    finally:
+        for session in (slack_session, conversation_session, recipe_session, recipe_store_session):
+            await session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
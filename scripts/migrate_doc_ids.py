@@ -0,0 +1,151 @@
+import argparse
+import copy
+import os
+import sys
+
+from cloudant.client import Cloudant
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.cloudant_recipe_store import CloudantRecipeStore
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "../.env"))
+
+# doc types stored under a derived ID and the lists of counts embedded in them
+DOC_TYPES = ['user', 'ingredient', 'cuisine', 'recipe']
+USER_LISTS = {
+    'ingredients': 'name',
+    'cuisines': 'name',
+    'recipes': 'id'
+}
+# properties of the request docs that reference the ID of another doc
+REFERENCE_PROPERTIES = ['user_id', 'ingredient_id', 'cuisine_id', 'recipe_id']
+
+
+def iterate_docs(db, batch_size):
+    # page through _all_docs using the last ID of each page as the start key of the next one
+    start_key = None
+    while True:
+        params = {'include_docs': True, 'limit': batch_size + 1}
+        if start_key is not None:
+            params['startkey'] = start_key
+        rows = db.all_docs(**params)['rows']
+        for row in rows[:batch_size]:
+            yield row['doc']
+        if len(rows) <= batch_size:
+            break
+        start_key = rows[batch_size]['id']
+
+
+def merge_user_docs(target, source):
+    # add the counts of the source user to the target user
+    for list_name, key_name in USER_LISTS.items():
+        for source_entry in source.get(list_name, []):
+            target_entries = target.setdefault(list_name, [])
+            matching_entries = [x for x in target_entries if x[key_name] == source_entry[key_name]]
+            if len(matching_entries) > 0:
+                matching_entries[0]['count'] = matching_entries[0].get('count', 0) + source_entry.get('count', 0)
+            else:
+                target_entries.append(dict(source_entry))
+
+
+def write_docs(db, docs, batch_size, dry_run):
+    # returns the IDs of the docs that were written, so callers only act on what is stored
+    written_ids = set()
+    for i in range(0, len(docs), batch_size):
+        batch = docs[i:i+batch_size]
+        if dry_run:
+            written_ids.update(doc['_id'] for doc in batch)
+            continue
+        for result in db.bulk_docs(batch):
+            if 'error' in result:
+                print('Failed to write doc {}: {}'.format(result.get('id'), result['error']))
+            else:
+                written_ids.add(result['id'])
+    return written_ids
+
+
+def migrate(db, batch_size, dry_run):
+    # find docs that are not stored under their derived ID yet
+    # docs already under the derived ID are kept so legacy duplicates can be merged into them
+    targets = {}
+    legacy_docs = []
+    for doc in iterate_docs(db, batch_size):
+        if doc.get('type') not in DOC_TYPES or 'name' not in doc:
+            continue
+        doc_id = CloudantRecipeStore.get_doc_id(doc['type'], doc['name'])
+        if doc['_id'] == doc_id:
+            targets[doc_id] = doc
+        else:
+            legacy_docs.append(doc)
+    print('Found {} docs to migrate.'.format(len(legacy_docs)))
+    # build the new docs, merging duplicates of the same user, ingredient, cuisine or recipe
+    # each new doc lists the IDs of the legacy docs in it, so a run after a partial one doesn't merge their counts twice
+    id_map = {}
+    changed_targets = {}
+    for doc in legacy_docs:
+        doc_id = CloudantRecipeStore.get_doc_id(doc['type'], doc['name'])
+        id_map[doc['_id']] = doc_id
+        target = targets.get(doc_id)
+        if target is not None and doc['_id'] in target.get('migrated_from', []):
+            continue
+        if target is None:
+            target = copy.deepcopy(dict((k, v) for k, v in doc.items() if k != '_rev'))
+            target['_id'] = doc_id
+            targets[doc_id] = target
+        elif doc['type'] == 'user':
+            merge_user_docs(target, doc)
+        target.setdefault('migrated_from', []).append(doc['_id'])
+        changed_targets[doc_id] = target
+    print('Writing {} docs under derived IDs...'.format(len(changed_targets)))
+    written_ids = write_docs(db, list(changed_targets.values()), batch_size, dry_run)
+    # only legacy docs whose new doc is stored are migrated, the others are kept for the next run
+    id_map = dict((legacy_id, doc_id) for legacy_id, doc_id in id_map.items()
+                  if doc_id in written_ids or doc_id not in changed_targets)
+    # point the request docs at the new IDs
+    request_docs = []
+    # request doc ID -> IDs of the legacy docs it referenced
+    legacy_references = {}
+    for doc in iterate_docs(db, batch_size):
+        for property_name in REFERENCE_PROPERTIES:
+            if doc.get(property_name) in id_map:
+                legacy_references.setdefault(doc['_id'], []).append(doc[property_name])
+                doc[property_name] = id_map[doc[property_name]]
+        if doc['_id'] in legacy_references:
+            request_docs.append(doc)
+    print('Updating references in {} request docs...'.format(len(request_docs)))
+    updated_ids = write_docs(db, request_docs, batch_size, dry_run)
+    # keep the legacy docs still referenced by a request doc that failed to update, the next run updates it
+    referenced_ids = set()
+    for request_id, legacy_ids in legacy_references.items():
+        if request_id not in updated_ids:
+            referenced_ids.update(legacy_ids)
+    # finally remove the migrated legacy docs
+    deleted_docs = [{'_id': doc['_id'], '_rev': doc['_rev'], '_deleted': True} for doc in legacy_docs
+                    if doc['_id'] in id_map and doc['_id'] not in referenced_ids]
+    print('Deleting {} legacy docs...'.format(len(deleted_docs)))
+    deleted_ids = write_docs(db, deleted_docs, batch_size, dry_run)
+    if len(deleted_ids) < len(legacy_docs):
+        print('{} legacy docs were not migrated, run the migration again.'.format(len(legacy_docs) - len(deleted_ids)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Moves user, ingredient, cuisine and recipe docs to their derived IDs (for example cuisine:italian).')
+    parser.add_argument('--batch-size', type=int, default=500, help='number of docs read or written per request')
+    parser.add_argument('--dry-run', action='store_true', help='report what would change without writing anything')
+    args = parser.parse_args()
+    recipe_store_url = os.environ.get("CLOUDANT_URL")
+    if recipe_store_url.find('@') > 0:
+        prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
+        suffix = recipe_store_url[recipe_store_url.find('@')+1:]
+        recipe_store_url = '{}{}'.format(prefix, suffix)
+    client = Cloudant(
+        os.environ.get("CLOUDANT_USERNAME"),
+        os.environ.get("CLOUDANT_PASSWORD"),
+        url=recipe_store_url
+    )
+    try:
+        client.connect()
+        migrate(client[os.environ.get("CLOUDANT_DB_NAME")], args.batch_size, args.dry_run)
+    finally:
+        client.disconnect()
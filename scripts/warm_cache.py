@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cloudant.client import Cloudant
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.cloudant_recipe_store import CloudantRecipeStore
+from souschef.normalizer import Normalizer
+from souschef.recipe import RecipeClient
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "../.env"))
+
+
+def load_cuisines(workspace_path):
+    # the values of the cuisine entity are the cuisines the bot recognizes
+    with open(workspace_path) as f:
+        workspace = json.load(f)
+    for entity in workspace['entities']:
+        if entity['entity'] == 'cuisine':
+            return [value['value'] for value in entity['values']]
+    return []
+
+
+def load_ingredients(ingredients_path):
+    # one comma-separated list of ingredients per line, blank lines and lines starting with # are ignored
+    with open(ingredients_path) as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def get_queries(cuisines, ingredients, normalizer):
+    # (doc type, unique name, function fetching the recipes from Spoonacular, argument passed to the function)
+    # names are normalized the way the bot normalizes what users ask for, or the bot would not find them,
+    # but like the bot the ingredients are sent to Spoonacular as written
+    queries = {}
+    for cuisine in cuisines:
+        cuisine = normalizer.normalize_cuisine(cuisine)
+        name = CloudantRecipeStore.get_unique_cuisine_name(cuisine)
+        queries[CloudantRecipeStore.get_doc_id('cuisine', name)] = ('cuisine', name, 'find_by_cuisine', cuisine)
+    for ingredients_str in ingredients:
+        name = CloudantRecipeStore.get_unique_ingredients_name(normalizer.normalize_ingredients(ingredients_str))
+        queries[CloudantRecipeStore.get_doc_id('ingredient', name)] = ('ingredient', name, 'find_by_ingredients', ingredients_str)
+    return queries
+
+
+def find_existing_ids(db, doc_ids, batch_size):
+    existing_ids = set()
+    for i in range(0, len(doc_ids), batch_size):
+        for row in db.all_docs(keys=doc_ids[i:i+batch_size])['rows']:
+            if 'value' in row and not row['value'].get('deleted'):
+                existing_ids.add(row['key'])
+    return existing_ids
+
+
+def write_docs(db, docs):
+    written = 0
+    for result in db.bulk_docs(docs):
+        if 'error' not in result:
+            written += 1
+        elif result['error'] != 'conflict':
+            # a conflict means the doc was added since we checked, anything else is worth reporting
+            print('Failed to write doc {}: {}'.format(result.get('id'), result['error']))
+    return written
+
+
+def warm(db, recipe_client, queries, workers, batch_size, dry_run):
+    existing_ids = find_existing_ids(db, sorted(queries.keys()), batch_size)
+    missing_ids = sorted(doc_id for doc_id in queries.keys() if doc_id not in existing_ids)
+    print('{} of {} cuisines and ingredients are already stored, fetching {}.'.format(
+        len(existing_ids), len(queries), len(missing_ids)))
+    if dry_run or len(missing_ids) == 0:
+        return
+    written = 0
+    failed = 0
+    docs = []
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    try:
+        for doc_id in missing_ids:
+            doc_type, name, method, arg = queries[doc_id]
+            futures[executor.submit(getattr(recipe_client, method), arg)] = doc_id
+        # write as results come in so an interrupted run keeps what it has fetched and the next run resumes from there
+        for future in as_completed(futures):
+            doc_id = futures[future]
+            doc_type, name, method, arg = queries[doc_id]
+            try:
+                recipes = future.result()
+            except Exception:
+                print('Failed to fetch {}: {}'.format(doc_id, sys.exc_info()[1]))
+                failed += 1
+                continue
+            docs.append({'_id': doc_id, 'type': doc_type, 'name': name, 'recipes': recipes})
+            if len(docs) >= batch_size:
+                written += write_docs(db, docs)
+                docs = []
+                print('Written {} docs...'.format(written))
+        if len(docs) > 0:
+            written += write_docs(db, docs)
+    finally:
+        # don't start fetches that are still queued if the run is interrupted
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+    print('Written {} docs, {} failed.'.format(written, failed))
+    if failed > 0:
+        print('Run again to retry the failed ones.')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Adds the recipes of the cuisines in the workspace and of common ingredients to Cloudant, '
+                                                 'so the first user asking for them doesn\'t wait for Spoonacular. '
+                                                 'Cuisines and ingredients already stored are skipped, so the tool can be run again to resume.')
+    parser.add_argument('--workspace', default=os.path.join(os.path.dirname(__file__), '../workspace.json'),
+                        help='Watson Conversation workspace the cuisines are read from')
+    parser.add_argument('--ingredients', help='file with one comma-separated list of ingredients per line')
+    parser.add_argument('--workers', type=int, default=4, help='number of Spoonacular requests made at the same time')
+    parser.add_argument('--batch-size', type=int, default=50, help='number of docs written per request')
+    parser.add_argument('--rate-limit', type=float, help='max number of Spoonacular requests per second')
+    parser.add_argument('--spoonacular-url', default='https://spoonacular-recipe-food-nutrition-v1.p.mashape.com/',
+                        help='base URL of the Spoonacular API')
+    parser.add_argument('--dry-run', action='store_true', help='report what would be fetched without fetching or writing anything')
+    args = parser.parse_args()
+    cuisines = load_cuisines(args.workspace)
+    ingredients = load_ingredients(args.ingredients) if args.ingredients else []
+    recipe_client = RecipeClient(
+        os.environ.get("SPOONACULAR_KEY"),
+        pool_size=args.workers,
+        rate_limit=args.rate_limit,
+        endpoint=args.spoonacular_url
+    )
+    recipe_store_url = os.environ.get("CLOUDANT_URL")
+    if recipe_store_url.find('@') > 0:
+        prefix = recipe_store_url[0:recipe_store_url.find('://')+3]
+        suffix = recipe_store_url[recipe_store_url.find('@')+1:]
+        recipe_store_url = '{}{}'.format(prefix, suffix)
+    client = Cloudant(
+        os.environ.get("CLOUDANT_USERNAME"),
+        os.environ.get("CLOUDANT_PASSWORD"),
+        url=recipe_store_url
+    )
+    try:
+        client.connect()
+        warm(client[os.environ.get("CLOUDANT_DB_NAME")], recipe_client, get_queries(cuisines, ingredients, Normalizer.from_file(args.workspace)),
+             args.workers, args.batch_size, args.dry_run)
+    finally:
+        client.disconnect()
+        recipe_client.close()
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFlushRequest(object):
+
+    def __init__(self):
+        # set by the writer task once the docs queued before the request have been written
+        self.done = asyncio.Event()
+
+
+class AsyncBulkDocWriter(object):
+
+    # marker passed through the queue to the writer task
+    STOP = object()
+
+    def __init__(self, bulk_docs, batch_size=100, flush_interval=1.0, max_pending=10000, max_retries=3):
+        """
+        Creates a new instance of AsyncBulkDocWriter, the asyncio counterpart of BulkDocWriter, a task that writes docs
+        to Cloudant in _bulk_docs batches.
+        A batch is written when it reaches batch_size docs or flush_interval seconds after its first doc was added.
+        Docs should have an _id so retrying a batch that was partly written can't write them twice.
+        Parameters
+        ----------
+        bulk_docs - A coroutine function writing a list of docs with _bulk_docs and returning the result of each doc
+        batch_size - The max number of docs written in one request
+        flush_interval - The max number of seconds a doc waits before it is written
+        max_pending - The max number of docs waiting to be written, add waits while the queue is full
+        max_retries - The number of times a failed batch is retried before its docs are dropped
+        """
+        self.bulk_docs = bulk_docs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        """
+        Starts the writer task on the running event loop.
+        """
+        if self.task is None:
+            self.queue = asyncio.Queue(self.max_pending)
+            self.task = asyncio.ensure_future(self.run())
+
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    async def add(self, doc):
+        """
+        Queues the doc to be written. Waits while max_pending docs are waiting to be written.
+        Parameters
+        ----------
+        doc - The doc to write
+        """
+        await self.queue.put(doc)
+
+    async def flush(self):
+        """
+        Writes all queued docs and waits until they have been written.
+        Docs added while waiting are not waited for, so a flush returns even while other coroutines keep adding docs.
+        """
+        if self.is_running():
+            request = AsyncFlushRequest()
+            await self.queue.put(request)
+            await request.done.wait()
+
+    async def stop(self):
+        """
+        Writes all queued docs and stops the writer task.
+        """
+        if self.is_running():
+            await self.queue.put(self.STOP)
+            await self.task
+
+    async def run(self):
+        running = True
+        while running:
+            docs = []
+            flush_request = None
+            item = await self.queue.get()
+            deadline = time.time() + self.flush_interval
+            # collect docs until the batch is full, the interval has passed or a flush is requested
+            while True:
+                if item is self.STOP:
+                    running = False
+                    break
+                if isinstance(item, AsyncFlushRequest):
+                    flush_request = item
+                    break
+                docs.append(item)
+                if len(docs) >= self.batch_size:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), max(0, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    break
+            if len(docs) > 0:
+                await self.write(docs)
+            # the docs queued before the flush request were in this batch or earlier ones
+            if flush_request is not None:
+                flush_request.done.set()
+
+    async def write(self, docs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer('cloudant.bulk_docs'):
+                    results = await self.bulk_docs(docs)
+                # a conflict on a doc with a client-generated ID means an earlier attempt already wrote it
+                failed_docs = [doc for doc, result in zip(docs, results) if 'error' in result and result['error'] != 'conflict']
+                metrics.inc('souschef_bulk_docs_written_total', len(docs) - len(failed_docs))
+                if len(failed_docs) == 0:
+                    return
+                logger.warning('Failed to write docs', extra={'failed': len(failed_docs), 'docs': len(docs)})
+                docs = failed_docs
+            except Exception:
+                logger.exception('Failed to write docs', extra={'docs': len(docs)})
+            if attempt < self.max_retries:
+                await asyncio.sleep(2 ** attempt * 0.1)
+        metrics.inc('souschef_bulk_docs_dropped_total', len(docs))
+        logger.error('Dropped docs', extra={'docs': len(docs), 'retries': self.max_retries})
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from urllib.parse import quote
+
+import aiohttp
+from cloudant.error import CloudantException
+
+from . import log
+from .async_bulk_writer import AsyncBulkDocWriter
+from .cloudant_recipe_store import CloudantRecipeStore
+from .favorites import FavoriteRecipes
+from .ingredient_index import IngredientIndex
+from .recommendations import Recommendations
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCloudantRecipeStore(object):
+
+    def __init__(self, session, url, username, password, db_name, ingredient_index=None, recommendations=None,
+                 favorite_recipes=None, request_batch_size=100, request_flush_interval=1.0, max_pending_requests=10000):
+        """
+        Creates a new instance of AsyncCloudantRecipeStore, the asyncio counterpart of CloudantRecipeStore.
+        Documents are read and written in the same format so both stores can share a database.
+        Parameters
+        ----------
+        session - The aiohttp.ClientSession used to call Cloudant
+        url - The URL of the Cloudant account
+        username - The Cloudant username
+        password - The Cloudant password
+        db_name - The name of the database to use
+        ingredient_index - The IngredientIndex used to find stored recipes for ingredients not asked for in that combination before (a new IngredientIndex if None)
+        recommendations - The Recommendations of the recipes picked most often for each ingredient and cuisine (new Recommendations if None)
+        favorite_recipes - The FavoriteRecipes caching each user's most requested recipes (a default FavoriteRecipes if None)
+        request_batch_size - The max number of request docs (userIngredientRequest, etc.) written in one _bulk_docs request
+        request_flush_interval - The max number of seconds a request doc waits before it is written
+        max_pending_requests - The max number of request docs waiting to be written before recording a request waits
+        """
+        self.session = session
+        self.auth = aiohttp.BasicAuth(username, password)
+        self.db_url = '{}/{}'.format(url.rstrip('/'), db_name)
+        self.db_name = db_name
+        # loaded from the stored ingredient docs the first time it is used
+        self.ingredient_index = ingredient_index if ingredient_index is not None else IngredientIndex()
+        self.ingredient_index_lock = asyncio.Lock()
+        # loaded by init, then updated with each recipe request recorded by this process
+        self.recommendations = recommendations if recommendations is not None else Recommendations()
+        # each user's favorites are loaded from the by_user view when first read, then updated with their recipe requests
+        self.favorite_recipes = favorite_recipes if favorite_recipes is not None else FavoriteRecipes()
+        # request docs are written in batches in the background, started by init
+        self.request_writer = AsyncBulkDocWriter(self.bulk_docs, request_batch_size, request_flush_interval, max_pending_requests)
+
+    async def request(self, method, path='', not_found_ok=False, exists_ok=False, **kwargs):
+        async with self.session.request(method, self.db_url + path, auth=self.auth, **kwargs) as response:
+            if not_found_ok and response.status == 404:
+                return None
+            # 412 when creating a database that exists, 409 when creating a doc that exists
+            if exists_ok and response.status in (409, 412):
+                return None
+            response.raise_for_status()
+            if method == 'HEAD':
+                return {}
+            return await response.json()
+
+    async def init(self):
+        """
+        Creates and initializes the database.
+        """
+        logger.info('Getting database...')
+        # other processes may be initializing the same database, so a database or design doc created since it was
+        # checked is treated as created
+        if await self.request('HEAD', not_found_ok=True) is None:
+            logger.info('Creating database', extra={'db_name': self.db_name})
+            await self.request('PUT', exists_ok=True)
+        else:
+            logger.info('Database exists', extra={'db_name': self.db_name})
+        # see if each design doc exists, if not then create it
+        for design_doc in CloudantRecipeStore.DESIGN_DOCS:
+            if await self.request('GET', '/' + design_doc['_id'], not_found_ok=True) is None:
+                await self.request('PUT', '/' + design_doc['_id'], exists_ok=True, json=design_doc)
+        await self.create_query_indexes()
+        self.request_writer.start()
+        result = await self.request('GET', '/_design/by_ingredient_cuisine/_view/recipes', params={'group': 'true'})
+        self.recommendations.load(result['rows'])
+        logger.info('Loaded recommendations')
+
+    async def flush(self):
+        """
+        Writes all queued request docs and waits until they have been written.
+        """
+        await self.request_writer.flush()
+
+    async def close(self):
+        """
+        Writes all queued request docs. The session is closed by its owner.
+        """
+        await self.request_writer.stop()
+
+    async def create_query_indexes(self):
+        """
+        Creates the json indexes for the queries issued by the store and verifies that Cloudant uses them.
+        Raises a CloudantException if a query would not use its index.
+        """
+        for index in CloudantRecipeStore.QUERY_INDEXES:
+            # creating an index that already exists is a no-op
+            await self.request('POST', '/_index', json={
+                'index': {'fields': index['fields']},
+                'ddoc': index['name'],
+                'name': index['name'],
+                'type': 'json'
+            })
+        for index in CloudantRecipeStore.QUERY_INDEXES:
+            plan = await self.request('POST', '/_explain', json={'selector': index['selector']})
+            if plan['index']['name'] != index['name']:
+                raise CloudantException('Query {} uses index {} instead of {}.'.format(
+                    json.dumps(index['selector']), plan['index']['name'], index['name']))
+        logger.info('Query indexes verified.')
+
+    # User
+
+    async def add_user(self, user_id):
+        user_doc = {
+            'type': 'user',
+            'name': user_id
+        }
+        return await self.add_doc_if_not_exists(user_doc, 'name')
+
+    # Ingredients
+
+    async def find_ingredient(self, ingredient_str):
+        ingredient_doc = await self.find_doc('ingredient', 'name', CloudantRecipeStore.get_unique_ingredients_name(ingredient_str))
+        if ingredient_doc is not None:
+            # the doc may have been added by another process
+            self.ingredient_index.add(ingredient_doc)
+        return ingredient_doc
+
+    async def find_recipes_by_ingredients(self, ingredient_str, count):
+        return (await self.get_ingredient_index()).find_recipes(ingredient_str, count)
+
+    async def get_known_ingredients(self):
+        return (await self.get_ingredient_index()).get_known_ingredients()
+
+    async def add_ingredient(self, ingredient_str, matching_recipes, user_doc):
+        ingredient_doc = {
+            'type': 'ingredient',
+            'name': CloudantRecipeStore.get_unique_ingredients_name(ingredient_str),
+            'recipes': matching_recipes
+        }
+        ingredient_doc = await self.add_doc_if_not_exists(ingredient_doc, 'name')
+        self.ingredient_index.add(ingredient_doc)
+        await self.record_ingredient_request_for_user(ingredient_doc, user_doc)
+        return ingredient_doc
+
+    async def record_ingredient_request_for_user(self, ingredient_doc, user_doc):
+        user_ingredient_doc = {
+            'type': 'userIngredientRequest',
+            'user_id': user_doc['_id'],
+            'user_name': user_doc['name'],
+            'ingredient_id': ingredient_doc['_id'],
+            'ingredient_name': ingredient_doc['name'],
+            'date': int(time.time()*1000)
+        }
+        await self.record_request(user_ingredient_doc)
+
+    # Cuisine
+
+    async def find_cuisine(self, cuisine):
+        return await self.find_doc('cuisine', 'name', CloudantRecipeStore.get_unique_cuisine_name(cuisine))
+
+    async def add_cuisine(self, cuisine_str, matching_recipes, user_doc):
+        cuisine_doc = {
+            'type': 'cuisine',
+            'name': CloudantRecipeStore.get_unique_cuisine_name(cuisine_str),
+            'recipes': matching_recipes
+        }
+        cuisine_doc = await self.add_doc_if_not_exists(cuisine_doc, 'name')
+        await self.record_cuisine_request_for_user(cuisine_doc, user_doc)
+        return cuisine_doc
+
+    async def record_cuisine_request_for_user(self, cuisine_doc, user_doc):
+        user_cuisine_doc = {
+            'type': 'userCuisineRequest',
+            'user_id': user_doc['_id'],
+            'user_name': user_doc['name'],
+            'cuisine_id': cuisine_doc['_id'],
+            'cuisine_name': cuisine_doc['name'],
+            'date': int(time.time()*1000)
+        }
+        await self.record_request(user_cuisine_doc)
+
+    # Recipe
+
+    async def find_recipe(self, recipe_id):
+        return await self.find_doc('recipe', 'name', CloudantRecipeStore.get_unique_recipe_name(recipe_id))
+
+    async def find_favorite_recipes_for_user(self, user_doc, count):
+        favorites = self.favorite_recipes.get(user_doc['_id'], count)
+        if favorites is not None:
+            return favorites
+        # requests recorded while the view is read are kept and counted if the view doesn't count them
+        self.favorite_recipes.start_load(user_doc['_id'])
+        try:
+            # write the queued request docs first, so the view counts them
+            await self.flush()
+            rows = await self.get_user_request_counts(user_doc, 'recipes')
+            request_rows = []
+            for recipe_name in self.favorite_recipes.get_loading_recipes(user_doc['_id']):
+                request_rows.extend(await self.get_user_request_counts(user_doc, 'recipes', name=recipe_name))
+        except Exception:
+            self.favorite_recipes.cancel_load(user_doc['_id'])
+            raise
+        self.favorite_recipes.load(user_doc['_id'], rows, request_rows)
+        return self.favorite_recipes.get(user_doc['_id'], count)
+
+    async def find_popular_recipes(self, ingredient_cuisine_doc, count):
+        return self.recommendations.get(ingredient_cuisine_doc['_id'], count)
+
+    async def add_recipe(self, recipe_id, recipe_title, recipe_detail, ingredient_cuisine_doc, user_doc):
+        recipe = await self.add_recipe_doc(recipe_id, recipe_title, recipe_detail)
+        await self.record_recipe_request_for_user(recipe, ingredient_cuisine_doc, user_doc)
+        return recipe
+
+    async def add_recipe_doc(self, recipe_id, recipe_title, recipe_detail):
+        recipe = {
+            'type': 'recipe',
+            'name': CloudantRecipeStore.get_unique_recipe_name(recipe_id),
+            'title': recipe_title.strip(),
+            'instructions': recipe_detail
+        }
+        return await self.add_doc_if_not_exists(recipe, 'name')
+
+    async def record_recipe_request_for_user(self, recipe_doc, ingredient_cuisine_doc, user_doc):
+        user_recipe_doc = {
+            'type': 'userRecipeRequest',
+            'user_id': user_doc['_id'],
+            'user_name': user_doc['name'],
+            'recipe_id': recipe_doc['_id'],
+            'recipe_name': recipe_doc['name'],
+            'recipe_title': recipe_doc['title'],
+            'date': int(time.time()*1000)
+        }
+        if ingredient_cuisine_doc is not None:
+            user_recipe_doc['ingredient_cuisine_id'] = ingredient_cuisine_doc['_id']
+            user_recipe_doc['ingredient_cuisine_type'] = ingredient_cuisine_doc['type']
+            user_recipe_doc['ingredient_cuisine_name'] = ingredient_cuisine_doc['name']
+        await self.record_request(user_recipe_doc)
+
+    async def record_request(self, request_doc):
+        """
+        Queues the request doc to be written in the background, an increment of one of the counters aggregated by the by_user views.
+        Parameters
+        ----------
+        request_doc - The userIngredientRequest, userCuisineRequest or userRecipeRequest doc
+        """
+        # the ID is set here so a retried write of the same request is rejected as a conflict instead of counted twice
+        request_doc['_id'] = uuid.uuid4().hex
+        await self.request_writer.add(request_doc)
+        self.recommendations.record(request_doc)
+        self.favorite_recipes.record(request_doc)
+
+    # Cloudant Helper Methods
+
+    async def find_doc(self, doc_type, property_name, property_value):
+        if property_name != 'name':
+            # served by the type-name index for the name property, like CloudantRecipeStore.query_doc
+            selector = {
+                'type': doc_type,
+                property_name: property_value
+            }
+            result = await self.request('POST', '/_find', json={'selector': selector, 'limit': 1})
+            for doc in result['docs']:
+                return doc
+            return None
+        doc_id = CloudantRecipeStore.get_doc_id(doc_type, property_value)
+        return await self.request('GET', '/' + quote(doc_id, safe=''), not_found_ok=True)
+
+    async def bulk_docs(self, docs):
+        return await self.request('POST', '/_bulk_docs', json={'docs': docs})
+
+    async def get_ingredient_index(self):
+        if not self.ingredient_index.is_loaded():
+            async with self.ingredient_index_lock:
+                if not self.ingredient_index.is_loaded():
+                    self.ingredient_index.load(await self.get_docs('ingredient'))
+                    logger.info('Loaded ingredient index', extra={'docs': len(self.ingredient_index.docs)})
+        return self.ingredient_index
+
+    async def get_user_request_counts(self, user_doc, view_name, name=None):
+        # like CloudantRecipeStore.get_user_request_counts
+        start_key = [user_doc['_id']] if name is None else [user_doc['_id'], name]
+        params = {
+            'startkey': json.dumps(start_key),
+            'endkey': json.dumps(start_key + [{}])
+        }
+        if name is None:
+            params['group'] = 'true'
+        else:
+            params['reduce'] = 'false'
+        return (await self.request('GET', '/_design/by_user/_view/' + view_name, params=params))['rows']
+
+    async def get_docs(self, doc_type, batch_size=1000):
+        # page through the IDs starting with the type prefix, using the last ID of each page as the start key of the next one
+        docs = []
+        start_key = CloudantRecipeStore.get_doc_id(doc_type, '')
+        end_key = CloudantRecipeStore.get_doc_id(doc_type, '\ufff0')
+        while True:
+            params = {
+                'include_docs': 'true',
+                'startkey': json.dumps(start_key),
+                'endkey': json.dumps(end_key),
+                'limit': str(batch_size + 1)
+            }
+            rows = (await self.request('GET', '/_all_docs', params=params))['rows']
+            docs.extend(row['doc'] for row in rows[:batch_size])
+            if len(rows) <= batch_size:
+                return docs
+            start_key = rows[batch_size]['id']
+
+    async def add_doc_if_not_exists(self, doc, unique_property_name):
+        doc_type = doc['type']
+        property_value = doc[unique_property_name]
+        if unique_property_name != 'name':
+            existing_doc = await self.find_doc(doc_type, unique_property_name, property_value)
+            if existing_doc is not None:
+                logger.info('Returning existing doc', extra=log.sampled(doc_type=doc_type, doc_name=property_value))
+                return existing_doc
+        else:
+            doc = dict(doc)
+            doc['_id'] = CloudantRecipeStore.get_doc_id(doc_type, property_value)
+        logger.info('Creating doc', extra={'doc_type': doc_type, 'doc_name': property_value})
+        async with self.session.post(self.db_url, json=doc, auth=self.auth) as response:
+            if response.status == 409:
+                # the doc already exists
+                logger.info('Returning existing doc', extra=log.sampled(doc_type=doc_type, doc_name=property_value))
+                return await self.find_doc(doc_type, unique_property_name, property_value)
+            response.raise_for_status()
+            result = await response.json()
+        doc = dict(doc)
+        doc['_id'] = result['id']
+        doc['_rev'] = result['rev']
+        return doc
@@ -0,0 +1,52 @@
+import aiohttp
+
+from .local_dialog import LocalDialogClient
+
+
+class AsyncConversationClient(object):
+
+    def __init__(self, session, username, password, version='2016-07-11',
+                 url='https://gateway.watsonplatform.net/conversation/api'):
+        """
+        Creates a new instance of AsyncConversationClient, the asyncio counterpart of ConversationV1.message.
+        Parameters
+        ----------
+        session - The aiohttp.ClientSession used to call Watson Conversation
+        username - The Watson Conversation username
+        password - The Watson Conversation password
+        version - The Watson Conversation API version
+        url - The base URL of the Watson Conversation API
+        """
+        self.session = session
+        self.auth = aiohttp.BasicAuth(username, password)
+        self.version = version
+        self.url = url
+
+    async def message(self, workspace_id, message_input=None, context=None):
+        url = '{}/v1/workspaces/{}/message'.format(self.url, workspace_id)
+        data = {
+            'input': message_input,
+            'context': context
+        }
+        async with self.session.post(url, params={'version': self.version}, json=data, auth=self.auth) as response:
+            response.raise_for_status()
+            return await response.json()
+
+
+class AsyncLocalDialogClient(LocalDialogClient):
+
+    def __init__(self, conversation_client, dialog):
+        """
+        Creates a new instance of AsyncLocalDialogClient, the asyncio counterpart of LocalDialogClient.
+        Parameters
+        ----------
+        conversation_client - The AsyncConversationClient called for the turns that can't be evaluated locally
+        dialog - The LocalDialog of the workspace
+        """
+        LocalDialogClient.__init__(self, conversation_client, dialog)
+
+    async def message(self, workspace_id, message_input=None, context=None):
+        response = self.evaluate(message_input, context)
+        if response is not None:
+            return response
+        return await self.conversation_client.message(workspace_id, message_input, context)
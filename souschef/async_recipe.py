@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRecipeClient(object):
+
+    def __init__(self, session, api_key, endpoint='https://spoonacular-recipe-food-nutrition-v1.p.mashape.com/'):
+        """
+        Creates a new instance of AsyncRecipeClient, the asyncio counterpart of RecipeClient.
+        Parameters
+        ----------
+        session - The aiohttp.ClientSession used to call Spoonacular (its connector limits concurrent connections)
+        api_key - The Spoonacular API key
+        endpoint - The base URL of the Spoonacular API
+        """
+        self.session = session
+        self.api_key = api_key
+        self.endpoint = endpoint
+
+    async def get(self, path, params):
+        headers = {
+            'X-Mashape-Key': self.api_key,
+            'Accept': 'application/json'
+        }
+        # aiohttp only accepts str, int and float query values
+        params = {k: str(v).lower() if isinstance(v, bool) else v for k, v in params.items()}
+        async with self.session.get(self.endpoint + path, params=params, headers=headers) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def find_by_ingredients(self, ingredients):
+        params = {
+            'fillIngredients': False,
+            'ingredients': ingredients,
+            'limitLicense': False,
+            'number': 5,
+            'ranking': 1
+        }
+        return await self.get('recipes/findByIngredients', params)
+
+    async def find_by_cuisine(self, cuisine):
+        params = {
+            'number': 5,
+            'query': ' ',
+            'cuisine': cuisine
+        }
+        return (await self.get('recipes/search', params))['results']
+
+    async def get_info_by_id(self, id):
+        return await self.get('recipes/' + str(id) + '/information', {'includeNutrition': False})
+
+    async def get_steps_by_id(self, id):
+        return await self.get('recipes/' + str(id) + '/analyzedInstructions', {'stepBreakdown': True})
+
+    async def get_details_by_id(self, id):
+        """
+        Gets the info and the analyzed instructions of the recipe at the same time.
+        Returns a tuple of the info and the steps, as expected by SousChef.get_recipe_instructions_response.
+        If only the steps can't be fetched they are returned as None, if the info can't be fetched the error is raised.
+        Parameters
+        ----------
+        id - The Spoonacular ID of the recipe
+        """
+        info, steps = await asyncio.gather(self.get_info_by_id(id), self.get_steps_by_id(id), return_exceptions=True)
+        if isinstance(info, BaseException):
+            raise info
+        if isinstance(steps, BaseException):
+            # the recipe can still be shown without its instructions
+            logger.warning('Failed to get recipe steps', exc_info=steps, extra={'recipe_id': id})
+            steps = None
+        return info, steps
@@ -0,0 +1,35 @@
+import asyncio
+
+
+class AsyncSingleFlight(object):
+
+    def __init__(self):
+        """
+        Creates a new instance of AsyncSingleFlight, the asyncio counterpart of SingleFlight.
+        Coroutines that ask for a key while a call for it is in flight await that call and get its result.
+        """
+        self.calls = {}
+
+    async def do(self, key, fn, *args):
+        """
+        Awaits fn(*args) unless a call for the same key is already in flight, in which case awaits that call.
+        Returns a tuple of the result and True if this coroutine made the call, False if it got the result of another one.
+        If the call raises, the exception is raised in every coroutine waiting for it.
+        Parameters
+        ----------
+        key - The key identifying the call (for example the unique name of a cuisine)
+        fn - The coroutine function to call
+        args - The arguments passed to fn
+        """
+        future = self.calls.get(key)
+        if future is not None:
+            # shield the shared call so a cancelled waiter doesn't cancel it for everyone else
+            return await asyncio.shield(future), False
+        future = asyncio.ensure_future(fn(*args))
+        self.calls[key] = future
+        try:
+            return await asyncio.shield(future), True
+        finally:
+            # later calls for the key start a new flight
+            if self.calls.get(key) is future:
+                del self.calls[key]
@@ -0,0 +1,55 @@
+import json
+
+import aiohttp
+
+
+class AsyncSlackClient(object):
+
+    def __init__(self, session, token, url='https://slack.com/api/'):
+        """
+        Creates a new instance of AsyncSlackClient, the asyncio counterpart of the SlackClient calls used by SousChef.
+        Parameters
+        ----------
+        session - The aiohttp.ClientSession used to call Slack
+        token - The Slack bot token
+        url - The base URL of the Slack Web API
+        """
+        self.session = session
+        self.token = token
+        self.url = url
+        self.websocket = None
+
+    async def api_call(self, method, **kwargs):
+        kwargs['token'] = self.token
+        # form values must be strings
+        data = {k: str(v).lower() if isinstance(v, bool) else v for k, v in kwargs.items()}
+        async with self.session.post(self.url + method, data=data) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def rtm_connect(self):
+        """
+        Connects to the Slack RTM API. Returns True if the connection was successful.
+        """
+        try:
+            reply = await self.api_call('rtm.connect')
+            if not reply.get('ok'):
+                return False
+            self.websocket = await self.session.ws_connect(reply['url'], heartbeat=30)
+            return True
+        except aiohttp.ClientError:
+            return False
+
+    async def rtm_read(self):
+        """
+        Waits for the next RTM event. Returns None when the connection is closed.
+        """
+        msg = await self.websocket.receive()
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            return None
+        return [json.loads(msg.data)]
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+            self.websocket = None
@@ -0,0 +1,325 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import log
+from .async_single_flight import AsyncSingleFlight
+from .cloudant_recipe_store import CloudantRecipeStore
+from .http_transport import TokenBucket
+from .normalizer import Normalizer
+from .session_store import InMemorySessionStore
+from .souschef import SousChef
+from .user_state import UserState
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSousChef(object):
+
+    def __init__(self, slack_bot_id, slack_client, conversation_client, conversation_workspace_id, recipe_client, recipe_store,
+                 max_concurrent_messages=1000, recipe_prefetch_budget=0, recipe_prefetch_concurrency=2, max_pending_prefetches=20,
+                 session_store=None, normalizer=None, recipe_prefetch_burst=5):
+        """
+        Creates a new instance of AsyncSousChef, the asyncio counterpart of SousChef.
+        All clients are the async variants (AsyncSlackClient, AsyncConversationClient, AsyncRecipeClient and
+        AsyncCloudantRecipeStore) so every conversation runs as a coroutine on one event loop.
+        Parameters
+        ----------
+        slack_bot_id - The ID of the Slack bot
+        slack_client - The AsyncSlackClient
+        conversation_client - The AsyncConversationClient
+        conversation_workspace_id - The ID of the Watson Conversation workspace
+        recipe_client - The AsyncRecipeClient
+        recipe_store - The AsyncCloudantRecipeStore
+        max_concurrent_messages - The max number of messages handled at the same time
+        recipe_prefetch_budget - The max number of recipes fetched per hour before the user selects them, 0 disables prefetching
+        recipe_prefetch_concurrency - The max number of recipes prefetched at the same time
+        max_pending_prefetches - The max number of recipes waiting to be prefetched, more recipes are skipped
+        session_store - The store of the conversation state of each user (defaults to an InMemorySessionStore)
+        normalizer - The Normalizer of the cuisines and ingredients asked for (defaults to a Normalizer without a workspace)
+        recipe_prefetch_burst - The max number of recipes prefetched at once after the budget has not been used for a while,
+        by default one list of recipes
+        """
+        self.running = True
+        self.slack_bot_id = slack_bot_id
+        self.slack_client = slack_client
+        self.conversation_client = conversation_client
+        self.conversation_workspace_id = conversation_workspace_id
+        self.recipe_client = recipe_client
+        self.recipe_store = recipe_store
+        #
+        self.at_bot = "<@" + slack_bot_id + ">:"
+        self.delay = 0.5  # second, wait before reconnecting to slack
+        # the conversation state of each user, idle users are evicted
+        self.session_store = session_store if session_store is not None else InMemorySessionStore()
+        # the session store may block on disk, its calls run on one thread so they don't stall the event loop
+        self.session_executor = ThreadPoolExecutor(max_workers=1)
+        self.semaphore = asyncio.Semaphore(max_concurrent_messages)
+        # the last message task for each user, the next message for that user waits for it to finish
+        self.user_tasks = {}
+        # users asking for the same ingredients or cuisine at once share one Spoonacular call
+        self.single_flight = AsyncSingleFlight()
+        # cuisines and ingredients are normalized so the ways of writing them share one stored list of recipes
+        self.normalizer = normalizer if normalizer is not None else Normalizer()
+        # optionally fetch the recipes in a list before the user selects one
+        self.recipe_prefetch_budget = None
+        if recipe_prefetch_budget > 0:
+            self.recipe_prefetch_budget = TokenBucket(recipe_prefetch_budget / 3600.0, max(1, recipe_prefetch_burst))
+        self.prefetch_semaphore = asyncio.Semaphore(recipe_prefetch_concurrency)
+        self.max_pending_prefetches = max_pending_prefetches
+        self.prefetch_tasks = set()
+
+    def parse_slack_messages(self, slack_rtm_output):
+        return SousChef.parse_slack_messages(self, slack_rtm_output)
+
+    async def post_to_slack(self, response, channel):
+        await self.slack_client.api_call("chat.postMessage", channel=channel, text=response, as_user=True)
+
+    def dispatch(self, message, message_sender, channel):
+        previous_task = self.user_tasks.get(message_sender)
+        task = asyncio.ensure_future(self.handle_message_in_order(previous_task, message, message_sender, channel))
+        self.user_tasks[message_sender] = task
+        task.add_done_callback(lambda t: self.remove_user_task(message_sender, t))
+
+    def remove_user_task(self, message_sender, task):
+        if self.user_tasks.get(message_sender) is task:
+            del self.user_tasks[message_sender]
+
+    async def handle_message_in_order(self, previous_task, message, message_sender, channel):
+        if previous_task is not None:
+            await asyncio.wait([previous_task])
+        async with self.semaphore:
+            await self.handle_message(message, message_sender, channel)
+
+    async def handle_message(self, message, message_sender, channel):
+        with log.context(user=message_sender, channel=channel):
+            # get or create state for the user
+            state = await self.run_in_session_executor(self.session_store.get, message_sender)
+            if state is None:
+                state = UserState(message_sender)
+            if not state.conversation_context or state.conversation_id is None:
+                # a new conversation, its messages are logged with the same ID
+                state.conversation_id = log.new_conversation_id()
+            with log.context(conversation=state.conversation_id):
+                await self.handle_conversation_message(state, message, channel)
+
+    async def run_in_session_executor(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.session_executor, func, *args)
+
+    async def handle_conversation_message(self, state, message, channel):
+        try:
+            # send message to watson conversation
+            watson_response = await self.conversation_client.message(
+                workspace_id=self.conversation_workspace_id,
+                message_input={'text': message},
+                context=state.conversation_context)
+            # update conversation context
+            state.conversation_context = watson_response['context']
+            # route response
+            route, cuisine = SousChef.get_message_route(state.conversation_context, watson_response)
+            if route == 'favorites':
+                response = await self.handle_favorites_message(state)
+            elif route == 'ingredients':
+                response = await self.handle_ingredients_message(state, message)
+            elif route == 'selection':
+                response = await self.handle_selection_message(state)
+            elif route == 'cuisine':
+                response = await self.handle_cuisine_message(state, cuisine)
+            else:
+                response = await self.handle_start_message(state, watson_response)
+        except Exception:
+            logger.exception('Failed to handle message')
+            # clear state and set response
+            SousChef.clear_user_state(state)
+            response = "Sorry, something went wrong! Say anything to me to start over..."
+        await self.run_in_session_executor(self.session_store.put, state)
+        # post response to slack
+        await self.post_to_slack(response, channel)
+
+    async def handle_start_message(self, state, watson_response):
+        if state.user is None:
+            user = await self.recipe_store.add_user(state.user_id)
+            state.user = user
+        response = ''
+        for text in watson_response['output']['text']:
+            response += text + "\n"
+        return response
+
+    async def handle_favorites_message(self, state):
+        recipes = await self.recipe_store.find_favorite_recipes_for_user(state.user, 5)
+        # update state
+        state.conversation_context['recipes'] = recipes
+        state.ingredient_cuisine = None
+        # build and return response
+        return SousChef.get_recipe_list_response(state)
+
+    async def handle_ingredients_message(self, state, message):
+        ingredients_str = self.normalizer.normalize_ingredients(message) or message
+        ingredient = await self.recipe_store.find_ingredient(ingredients_str)
+        if ingredient is not None:
+            logger.info('Ingredients found in datastore', extra=log.sampled(ingredients=ingredients_str))
+            matching_recipes = ingredient['recipes']
+            await self.recipe_store.record_ingredient_request_for_user(ingredient, state.user)
+        else:
+            key = ('ingredient', CloudantRecipeStore.get_unique_ingredients_name(ingredients_str))
+            ingredient, fetched = await self.single_flight.do(key, self.fetch_ingredient, ingredients_str, message, state.user)
+            if not fetched:
+                await self.recipe_store.record_ingredient_request_for_user(ingredient, state.user)
+            matching_recipes = ingredient['recipes']
+        if len(matching_recipes) > 0:
+            # misspellings of these ingredients are corrected to them from now on
+            self.normalizer.add_ingredients(ingredient['name'])
+        # recipes other users picked most for the same ingredients first
+        matching_recipes = SousChef.rank_recipes(matching_recipes, await self.recipe_store.find_popular_recipes(ingredient, 20))
+        # update state
+        state.conversation_context['recipes'] = matching_recipes
+        state.ingredient_cuisine = ingredient
+        self.prefetch_recipes(matching_recipes)
+        # build and return response
+        return SousChef.get_recipe_list_response(state)
+
+    async def handle_cuisine_message(self, state, message):
+        cuisine_str = self.normalizer.normalize_cuisine(message) or message
+        cuisine = await self.recipe_store.find_cuisine(cuisine_str)
+        if cuisine is not None:
+            logger.info('Cuisine found in datastore', extra=log.sampled(cuisine=cuisine_str))
+            matching_recipes = cuisine['recipes']
+            await self.recipe_store.record_cuisine_request_for_user(cuisine, state.user)
+        else:
+            key = ('cuisine', CloudantRecipeStore.get_unique_cuisine_name(cuisine_str))
+            cuisine, fetched = await self.single_flight.do(key, self.fetch_cuisine, cuisine_str, state.user)
+            if not fetched:
+                await self.recipe_store.record_cuisine_request_for_user(cuisine, state.user)
+            matching_recipes = cuisine['recipes']
+        # recipes other users picked most for the same cuisine first
+        matching_recipes = SousChef.rank_recipes(matching_recipes, await self.recipe_store.find_popular_recipes(cuisine, 20))
+        # update state
+        state.conversation_context['recipes'] = matching_recipes
+        state.ingredient_cuisine = cuisine
+        self.prefetch_recipes(matching_recipes)
+        # build and return response
+        return SousChef.get_recipe_list_response(state)
+
+    async def fetch_ingredient(self, ingredients_str, query, user):
+        # check again, a fetch for the same ingredients may have finished since we looked
+        ingredient = await self.recipe_store.find_ingredient(ingredients_str)
+        if ingredient is not None:
+            await self.recipe_store.record_ingredient_request_for_user(ingredient, user)
+            return ingredient
+        # recipes stored for a list including these ingredients and others contain them too
+        matching_recipes = await self.recipe_store.find_recipes_by_ingredients(ingredients_str, 5)
+        # a shorter list is not stored in place of the full list Spoonacular would return
+        if len(matching_recipes) >= 5:
+            logger.info('Recipes with the ingredients found in datastore', extra={'ingredients': ingredients_str})
+        else:
+            logger.info('Ingredients not in datastore, querying Spoonacular', extra={'ingredients': ingredients_str})
+            # the normalized ingredients only key the stored list, Spoonacular gets them as the user wrote them
+            matching_recipes = await self.recipe_client.find_by_ingredients(query)
+        return await self.recipe_store.add_ingredient(ingredients_str, matching_recipes, user)
+
+    async def fetch_cuisine(self, cuisine_str, user):
+        # check again, a fetch for the same cuisine may have finished since we looked
+        cuisine = await self.recipe_store.find_cuisine(cuisine_str)
+        if cuisine is not None:
+            await self.recipe_store.record_cuisine_request_for_user(cuisine, user)
+            return cuisine
+        logger.info('Cuisine not in datastore, querying Spoonacular', extra={'cuisine': cuisine_str})
+        matching_recipes = await self.recipe_client.find_by_cuisine(cuisine_str)
+        return await self.recipe_store.add_cuisine(cuisine_str, matching_recipes, user)
+
+    async def handle_selection_message(self, state):
+        selection = -1
+        if state.conversation_context['selection'].isdigit():
+            selection = int(state.conversation_context['selection'])
+        # fewer than 5 recipes may have been listed, for example a new user's favorites
+        if 1 <= selection <= len(state.conversation_context.get('recipes') or []):
+            recipes = state.conversation_context['recipes']
+            recipe_id = recipes[selection-1]['id']
+            recipe = await self.recipe_store.find_recipe(recipe_id)
+            if recipe is not None:
+                logger.info('Recipe found in datastore', extra=log.sampled(recipe_id=recipe_id))
+            else:
+                # the recipe may be being prefetched, in which case we wait for it instead of fetching it again
+                recipe = await self.get_recipe(recipe_id)
+            recipe_detail = recipe['instructions']
+            await self.recipe_store.record_recipe_request_for_user(recipe, state.ingredient_cuisine, state.user)
+            # clear state and return response
+            SousChef.clear_user_state(state)
+            return recipe_detail
+        else:
+            # clear state and return response
+            SousChef.clear_user_state(state)
+            return "Invalid selection! Say anything to start over..."
+
+    async def get_recipe(self, recipe_id):
+        key = ('recipe', CloudantRecipeStore.get_unique_recipe_name(recipe_id))
+        recipe, fetched = await self.single_flight.do(key, self.fetch_recipe, recipe_id)
+        return recipe
+
+    async def fetch_recipe(self, recipe_id):
+        # check again, a fetch for the same recipe may have finished since we looked
+        recipe = await self.recipe_store.find_recipe(recipe_id)
+        if recipe is not None:
+            return recipe
+        logger.info('Recipe not in datastore, querying Spoonacular', extra={'recipe_id': recipe_id})
+        # info and steps are independent so fetch them at the same time
+        recipe_info, recipe_steps = await self.recipe_client.get_details_by_id(recipe_id)
+        recipe_detail = SousChef.get_recipe_instructions_response(recipe_info, recipe_steps)
+        if recipe_steps is None:
+            # reply without the steps but don't store the recipe, so it is fetched again the next time it is selected
+            return SousChef.get_unsaved_recipe_doc(recipe_id, recipe_info['title'], recipe_detail)
+        return await self.recipe_store.add_recipe_doc(recipe_id, recipe_info['title'], recipe_detail)
+
+    def prefetch_recipes(self, recipes):
+        if self.recipe_prefetch_budget is None:
+            return
+        for recipe in recipes:
+            if len(self.prefetch_tasks) >= self.max_pending_prefetches:
+                return
+            task = asyncio.ensure_future(self.prefetch_recipe(recipe['id']))
+            self.prefetch_tasks.add(task)
+            task.add_done_callback(self.prefetch_tasks.discard)
+
+    async def prefetch_recipe(self, recipe_id):
+        async with self.prefetch_semaphore:
+            try:
+                if await self.recipe_store.find_recipe(recipe_id) is not None:
+                    return
+                if self.recipe_prefetch_budget.try_acquire():
+                    await self.get_recipe(recipe_id)
+            except Exception:
+                logger.exception('Failed to prefetch recipe', extra={'recipe_id': recipe_id})
+
+    async def run(self):
+        await self.recipe_store.init()
+        # misspellings are corrected to the ingredients stored by any process, so every process normalizes them the same way
+        for ingredient in await self.recipe_store.get_known_ingredients():
+            self.normalizer.add_ingredients(ingredient)
+        while self.running:
+            if await self.slack_client.rtm_connect():
+                logger.info('sous-chef is connected and running!')
+                while self.running:
+                    slack_output = await self.slack_client.rtm_read()
+                    if slack_output is None:
+                        logger.warning('Slack connection closed, reconnecting...')
+                        break
+                    for message, message_sender, channel in self.parse_slack_messages(slack_output):
+                        if message and channel and message_sender != self.slack_bot_id:
+                            self.dispatch(message, message_sender, channel)
+            else:
+                logger.error('Connection failed. Invalid Slack token or bot ID?')
+                await asyncio.sleep(self.delay)
+        logger.info('sous-chef shutting down...')
+        await self.slack_client.close()
+        # let in-flight conversations finish
+        if len(self.user_tasks) > 0:
+            await asyncio.wait(list(self.user_tasks.values()))
+        if len(self.prefetch_tasks) > 0:
+            await asyncio.wait(list(self.prefetch_tasks))
+        # write the request docs that are still queued
+        await self.recipe_store.close()
+        await self.run_in_session_executor(self.session_store.close)
+        self.session_executor.shutdown()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class FlushRequest(object):
+
+    def __init__(self):
+        # set by the writer thread once the docs queued before the request have been written
+        self.done = threading.Event()
+
+
+class BulkDocWriter(threading.Thread):
+
+    # marker passed through the queue to the writer thread
+    STOP = object()
+
+    def __init__(self, get_db, batch_size=100, flush_interval=1.0, max_pending=10000, max_retries=3, on_written=None):
+        """
+        Creates a new instance of BulkDocWriter, a background thread that writes docs to Cloudant in _bulk_docs batches.
+        A batch is written when it reaches batch_size docs or flush_interval seconds after its first doc was added.
+        Docs should have an _id so retrying a batch that was partly written can't write them twice.
+        Parameters
+        ----------
+        get_db - A function returning the Cloudant database to write to
+        batch_size - The max number of docs written in one request
+        flush_interval - The max number of seconds a doc waits before it is written
+        max_pending - The max number of docs waiting to be written, add blocks while the queue is full
+        max_retries - The number of times a failed batch is retried before its docs are dropped
+        on_written - A function called with the docs of each batch once they are written, or None
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.get_db = get_db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.on_written = on_written
+        self.queue = queue.Queue(max_pending)
+        # held while a batch is written, holding it pauses the writer
+        self.write_lock = threading.Lock()
+
+    def add(self, doc):
+        """
+        Queues the doc to be written. Blocks while max_pending docs are waiting to be written.
+        Parameters
+        ----------
+        doc - The doc to write
+        """
+        self.queue.put(doc)
+
+    def flush(self):
+        """
+        Writes all queued docs and waits until they have been written.
+        Docs added while waiting are not waited for, so a flush returns even while other threads keep adding docs.
+        """
+        if self.is_alive():
+            request = FlushRequest()
+            self.queue.put(request)
+            request.done.wait()
+
+    def stop(self):
+        """
+        Writes all queued docs and stops the writer thread.
+        """
+        if self.is_alive():
+            self.queue.put(self.STOP)
+            self.join()
+
+    def run(self):
+        running = True
+        while running:
+            docs = []
+            flush_request = None
+            item = self.queue.get()
+            deadline = time.time() + self.flush_interval
+            # collect docs until the batch is full, the interval has passed or a flush is requested
+            while True:
+                if item is self.STOP:
+                    running = False
+                    break
+                if isinstance(item, FlushRequest):
+                    flush_request = item
+                    break
+                docs.append(item)
+                if len(docs) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(True, max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+            if len(docs) > 0:
+                with self.write_lock:
+                    self.write(docs)
+            # the docs queued before the flush request were in this batch or earlier ones
+            if flush_request is not None:
+                flush_request.done.set()
+
+    def write(self, docs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer('cloudant.bulk_docs'):
+                    results = self.get_db().bulk_docs(docs)
+                # a conflict on a doc with a client-generated ID means an earlier attempt already wrote it
+                failed = [('error' in result and result['error'] != 'conflict') for result in results]
+                failed_docs = [doc for doc, doc_failed in zip(docs, failed) if doc_failed]
+                metrics.inc('souschef_bulk_docs_written_total', len(docs) - len(failed_docs))
+                if self.on_written is not None:
+                    self.on_written([doc for doc, doc_failed in zip(docs, failed) if not doc_failed])
+                if len(failed_docs) == 0:
+                    return
+                logger.warning('Failed to write docs', extra={'failed': len(failed_docs), 'docs': len(docs)})
+                docs = failed_docs
+            except Exception:
+                logger.exception('Failed to write docs', extra={'docs': len(docs)})
+            if attempt < self.max_retries:
+                time.sleep(2 ** attempt * 0.1)
+        metrics.inc('souschef_bulk_docs_dropped_total', len(docs))
+        logger.error('Dropped docs', extra={'docs': len(docs), 'retries': self.max_retries})
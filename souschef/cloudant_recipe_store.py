@@ -1,82 +1,236 @@
+import copy
+import json
+import logging
+import threading
 import time
+import uuid
 
+from cloudant.document import Document
+from cloudant.error import CloudantException
 from cloudant.query import Query
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
+
+from . import log
+from . import metrics
+from .bulk_writer import BulkDocWriter
+from .doc_cache import DocCache
+from .favorites import FavoriteRecipes
+from .ingredient_index import IngredientIndex
+from .leaderboard import KINDS, Leaderboards
+from .recommendations import Recommendations
+
+logger = logging.getLogger(__name__)
 
 
 class CloudantRecipeStore(object):
 
-    def __init__(self, client, db_name):
+    # design docs created by init if they do not already exist
+    DESIGN_DOCS = [
+        {
+            '_id': '_design/by_popularity',
+            'views': {
+                'ingredients': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userIngredientRequest\') {\n    emit(doc.ingredient_name, 1);\n  }\n}',
+                    'reduce': '_sum'
+                },
+                'cuisines': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userCuisineRequest\') {\n    emit(doc.cuisine_name, 1);\n  }\n}',
+                    'reduce': '_sum'
+                },
+                'recipes': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userRecipeRequest\') {\n    emit(doc.recipe_title, 1);\n  }\n}',
+                    'reduce': '_sum'
+                }
+            },
+            'language': 'javascript'
+        },
+        {
+            '_id': '_design/by_day_of_week',
+            'views': {
+                'ingredients': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userIngredientRequest\') {\n    var weekdays = [\'Sunday\',\'Monday\',\'Tuesday\',\'Wednesday\',\'Thursday\',\'Friday\',\'Saturday\'];\n    emit(weekdays[new Date(doc.date).getDay()], 1);\n  }\n}',
+                    'reduce': '_sum'
+                },
+                'cuisines': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userCuisineRequest\') {\n    var weekdays = [\'Sunday\',\'Monday\',\'Tuesday\',\'Wednesday\',\'Thursday\',\'Friday\',\'Saturday\'];\n    emit(weekdays[new Date(doc.date).getDay()], 1);\n  }\n}',
+                    'reduce': '_sum'
+                },
+                'recipes': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userRecipeRequest\') {\n    var weekdays = [\'Sunday\',\'Monday\',\'Tuesday\',\'Wednesday\',\'Thursday\',\'Friday\',\'Saturday\'];\n    emit(weekdays[new Date(doc.date).getDay()], 1);\n  }\n}',
+                    'reduce': '_sum'
+                }
+            },
+            'language': 'javascript'
+        },
+        {
+            '_id': '_design/by_user',
+            'views': {
+                'ingredients': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userIngredientRequest\') {\n    emit([doc.user_id, doc.ingredient_name], 1);\n  }\n}',
+                    'reduce': '_sum'
+                },
+                'cuisines': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userCuisineRequest\') {\n    emit([doc.user_id, doc.cuisine_name], 1);\n  }\n}',
+                    'reduce': '_sum'
+                },
+                'recipes': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userRecipeRequest\') {\n    emit([doc.user_id, doc.recipe_name || doc.recipe_id.replace(/^recipe:/, \'\'), doc.recipe_title], 1);\n  }\n}',
+                    'reduce': '_sum'
+                }
+            },
+            'language': 'javascript'
+        },
+        {
+            '_id': '_design/by_ingredient_cuisine',
+            'views': {
+                'recipes': {
+                    'map': 'function (doc) {\n  if (doc.type && doc.type==\'userRecipeRequest\' && doc.ingredient_cuisine_id) {\n    emit([doc.ingredient_cuisine_id, doc.recipe_name, doc.recipe_title], 1);\n  }\n}',
+                    'reduce': '_sum'
+                }
+            },
+            'language': 'javascript'
+        }
+    ]
+
+    # json indexes created by init, each with an example of the selectors it serves
+    QUERY_INDEXES = [
+        {
+            'name': 'type-name',
+            'fields': ['type', 'name'],
+            'selector': {'type': 'cuisine', 'name': 'italian'}
+        }
+    ]
+
+    def __init__(self, client, db_name, pool_size=10, health_check_interval=60, doc_cache=None, legacy_lookup=False,
+                 request_batch_size=100, request_flush_interval=1.0, max_pending_requests=10000, ingredient_index=None,
+                 leaderboards=None, recommendations=None, favorite_recipes=None):
         """
         Creates a new instance of CloudantRecipeStore.
+        The client stays connected from init until close and is shared by all threads using the store.
         Parameters
         ----------
         client - The instance of cloudant client to connect to
         db_name - The name of the database to use
+        pool_size - The max number of keep-alive connections to Cloudant
+        health_check_interval - The number of seconds between checks that the Cloudant session is still valid
+        doc_cache - The DocCache used to serve repeated lookups by name from memory (a default DocCache if None)
+        legacy_lookup - If True docs not found under their derived ID are also looked up with a query (for databases not yet migrated with scripts/migrate_doc_ids.py)
+        request_batch_size - The max number of request docs (userIngredientRequest, etc.) written in one _bulk_docs request
+        request_flush_interval - The max number of seconds a request doc waits before it is written
+        max_pending_requests - The max number of request docs waiting to be written before recording a request blocks
+        ingredient_index - The IngredientIndex used to find stored recipes for ingredients not asked for in that combination before (a new IngredientIndex if None)
+        leaderboards - The Leaderboards of the most requested ingredients, cuisines and recipes (new Leaderboards if None)
+        recommendations - The Recommendations of the recipes picked most often for each ingredient and cuisine (new Recommendations if None)
+        favorite_recipes - The FavoriteRecipes caching each user's most requested recipes (a default FavoriteRecipes if None)
         """
         self.client = client
         self.db_name = db_name
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.connection_lock = threading.Lock()
+        self.health_check_lock = threading.Lock()
+        self.last_health_check = 0
+        self.db = None
+        if doc_cache is None:
+            doc_cache = DocCache()
+        self.doc_cache = doc_cache
+        self.legacy_lookup = legacy_lookup
+        # loaded from the stored ingredient docs the first time it is used
+        if ingredient_index is None:
+            ingredient_index = IngredientIndex()
+        self.ingredient_index = ingredient_index
+        self.ingredient_index_lock = threading.Lock()
+        # loaded from the views the first time they are read, then updated with each request recorded by this process
+        self.leaderboards = leaderboards if leaderboards is not None else Leaderboards()
+        self.leaderboards_lock = threading.Lock()
+        # loaded by init, then updated with each recipe request recorded by this process
+        self.recommendations = recommendations if recommendations is not None else Recommendations()
+        # each user's favorites are loaded from the by_user view when first read, then updated with their recipe requests
+        self.favorite_recipes = favorite_recipes if favorite_recipes is not None else FavoriteRecipes()
+        # request docs are analytics only, so they are written in the background instead of on the reply path
+        self.request_writer = BulkDocWriter(self.get_db, request_batch_size, request_flush_interval, max_pending_requests,
+                                            on_written=self.leaderboards.written)
 
     def init(self):
         """
-        Creates and initializes the database.
+        Connects to Cloudant and creates and initializes the database.
         """
-        try:
-            self.client.connect()
-            print('Getting database...')
-            if self.db_name not in self.client.all_dbs():
-                print('Creating database {}...'.format(self.db_name))
-                self.client.create_database(self.db_name)
-            else:
-                print('Database {} exists.'.format(self.db_name))
-            # see if the by_popularity design doc exists, if not then create it
-            db = self.client[self.db_name]
-            query = Query(db, selector={ '_id': '_design/by_popularity' })
-            result = query()['docs']
-            if result is None or len(result) <= 0:
-                design_doc = {
-                    '_id': '_design/by_popularity',
-                    'views': {
-                        'ingredients': {
-                            'map': 'function (doc) {\n  if (doc.type && doc.type==\'userIngredientRequest\') {\n    emit(doc.ingredient_name, 1);\n  }\n}',
-                            'reduce': '_sum'
-                        },
-                        'cuisines': {
-                            'map': 'function (doc) {\n  if (doc.type && doc.type==\'userCuisineRequest\') {\n    emit(doc.cuisine_name, 1);\n  }\n}',
-                            'reduce': '_sum'
-                        },
-                        'recipes': {
-                            'map': 'function (doc) {\n  if (doc.type && doc.type==\'userRecipeRequest\') {\n    emit(doc.recipe_title, 1);\n  }\n}',
-                            'reduce': '_sum'
-                        }
-                    },
-                    'language': 'javascript'
-                }
-                db.create_document(design_doc)
-            # see if the by_day_of_week design doc exists, if not then create it
-            query = Query(db, selector={ '_id': '_design/by_day_of_week' })
-            result = query()['docs']
-            if result is None or len(result) <= 0:
-                design_doc = {
-                    '_id': '_design/by_day_of_week',
-                    'views': {
-                        'ingredients': {
-                            'map': 'function (doc) {\n  if (doc.type && doc.type==\'userIngredientRequest\') {\n    var weekdays = [\'Sunday\',\'Monday\',\'Tuesday\',\'Wednesday\',\'Thursday\',\'Friday\',\'Saturday\'];\n    emit(weekdays[new Date(doc.date).getDay()], 1);\n  }\n}',
-                            'reduce': '_sum'
-                        },
-                        'cuisines': {
-                            'map': 'function (doc) {\n  if (doc.type && doc.type==\'userCuisineRequest\') {\n    var weekdays = [\'Sunday\',\'Monday\',\'Tuesday\',\'Wednesday\',\'Thursday\',\'Friday\',\'Saturday\'];\n    emit(weekdays[new Date(doc.date).getDay()], 1);\n  }\n}',
-                            'reduce': '_sum'
-                        },
-                        'recipes': {
-                            'map': 'function (doc) {\n  if (doc.type && doc.type==\'userRecipeRequest\') {\n    var weekdays = [\'Sunday\',\'Monday\',\'Tuesday\',\'Wednesday\',\'Thursday\',\'Friday\',\'Saturday\'];\n    emit(weekdays[new Date(doc.date).getDay()], 1);\n  }\n}',
-                            'reduce': '_sum'
-                        }
-                    },
-                    'language': 'javascript'
-                }
-                db.create_document(design_doc)
-        finally:
-            self.client.disconnect()
+        self.connect()
+        logger.info('Getting database...')
+        # other processes (for example the other shards) may be initializing the same database, so a database or
+        # design doc created since it was checked is treated as created
+        if self.db_name not in self.client.all_dbs():
+            logger.info('Creating database', extra={'db_name': self.db_name})
+            try:
+                self.client.create_database(self.db_name, throw_on_exists=False)
+            except CloudantException as e:
+                if e.status_code != 412:
+                    raise
+        else:
+            logger.info('Database exists', extra={'db_name': self.db_name})
+        # see if each design doc exists, if not then create it
+        db = self.get_db()
+        for design_doc in self.DESIGN_DOCS:
+            if not Document(db, design_doc['_id']).exists():
+                try:
+                    self.create_doc(design_doc)
+                except HTTPError as e:
+                    if e.response is None or e.response.status_code != 409:
+                        raise
+        self.create_query_indexes()
+        if not self.request_writer.is_alive():
+            self.request_writer.start()
+        self.recommendations.load(self.get_request_counts('by_ingredient_cuisine', 'recipes'))
+        logger.info('Loaded recommendations')
+
+    def flush(self):
+        """
+        Writes all queued request docs and waits until they have been written.
+        """
+        self.request_writer.flush()
+
+    def create_query_indexes(self):
+        """
+        Creates the json indexes for the queries issued by the store and verifies that Cloudant uses them.
+        Raises a CloudantException if a query would not use its index.
+        """
+        db = self.get_db()
+        for index in self.QUERY_INDEXES:
+            # creating an index that already exists is a no-op
+            db.create_query_index(design_document_id=index['name'], index_name=index['name'], fields=index['fields'])
+        for index in self.QUERY_INDEXES:
+            plan = self.explain_query(index['selector'])
+            if plan['index']['name'] != index['name']:
+                raise CloudantException('Query {} uses index {} instead of {}.'.format(
+                    json.dumps(index['selector']), plan['index']['name'], index['name']))
+        logger.info('Query indexes verified.')
+
+    def explain_query(self, selector):
+        """
+        Returns the query plan Cloudant would use for the specified selector.
+        Parameters
+        ----------
+        selector - The selector of the query
+        """
+        db = self.get_db()
+        response = self.client.r_session.post(
+            db.database_url + '/_explain',
+            data=json.dumps({'selector': selector}),
+            headers={'Content-Type': 'application/json'}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        """
+        Writes all queued request docs and disconnects from Cloudant.
+        """
+        self.request_writer.stop()
+        with self.connection_lock:
+            if self.client.r_session is not None:
+                self.client.disconnect()
+            self.db = None
 
     # User
 
@@ -114,7 +268,30 @@ class CloudantRecipeStore(object):
         ----------
         ingredient_str - The ingredient or comma-separated list of ingredients specified by the user
         """
-        return self.find_doc('ingredient', 'name', self.get_unique_ingredients_name(ingredient_str))
+        ingredient_doc = self.find_doc('ingredient', 'name', self.get_unique_ingredients_name(ingredient_str))
+        if ingredient_doc is not None:
+            # the doc may have been added by another process
+            self.ingredient_index.add(ingredient_doc)
+        return ingredient_doc
+
+    def find_recipes_by_ingredients(self, ingredient_str, count):
+        """
+        Finds stored recipes containing at least the specified ingredients, from ingredient docs that include them along with others.
+        Returns fewer than count recipes, possibly none, if not enough are stored.
+        Parameters
+        ----------
+        ingredient_str - The ingredient or comma-separated list of ingredients specified by the user
+        count - The max number of recipes to return
+        """
+        recipes = self.get_ingredient_index().find_recipes(ingredient_str, count)
+        metrics.inc('souschef_ingredient_index_requests_total', result='hit' if len(recipes) >= count else 'miss')
+        return recipes
+
+    def get_known_ingredients(self):
+        """
+        Gets the ingredients the stored ingredient docs have recipes for, from the ingredient index.
+        """
+        return self.get_ingredient_index().get_known_ingredients()
 
     def add_ingredient(self, ingredient_str, matching_recipes, user_doc):
         """
@@ -131,53 +308,28 @@ class CloudantRecipeStore(object):
             'recipes': matching_recipes
         }
         ingredient_doc = self.add_doc_if_not_exists(ingredient_doc, 'name')
+        self.ingredient_index.add(ingredient_doc)
         self.record_ingredient_request_for_user(ingredient_doc, user_doc)
         return ingredient_doc
 
     def record_ingredient_request_for_user(self, ingredient_doc, user_doc):
         """
         Records the request by the user for the specified ingredient.
-        Stores the ingredient and the number of times it has been accessed in the user doc.
+        The number of times the user has requested the ingredient is counted by the by_user/ingredients view.
         Parameters
         ----------
         ingredient_doc - The existing Cloudant doc for the ingredient
         user_doc - The existing Cloudant doc for the user
         """
-        try:
-            self.client.connect()
-            # get latest user
-            latest_user_doc = self.client[self.db_name][user_doc['_id']]
-            # see if user has an array of ingredients, if not create it
-            if 'ingredients' not in latest_user_doc.keys():
-                latest_user_doc['ingredients'] = []
-            # find the ingredient that matches the name of the passed in ingredient
-            # if it doesn't exist create it
-            user_ingredients = list(filter(lambda x: x['name'] == ingredient_doc['name'], latest_user_doc['ingredients']))
-            if len(user_ingredients) > 0:
-                user_ingredient = user_ingredients[0]
-            else:
-                user_ingredient = {'name': ingredient_doc['name']}
-                latest_user_doc['ingredients'].append(user_ingredient)
-            # see if the user_ingredient exists, if not create it
-            if 'count' not in user_ingredient.keys():
-                user_ingredient['count'] = 0
-            # increment the count on the user_ingredient
-            user_ingredient['count'] += 1
-            # save the user doc
-            latest_user_doc.save()
-            # add a new doc with the user/ingredient details
-            user_ingredient_doc = {
-                'type': 'userIngredientRequest',
-                'user_id': user_doc['_id'],
-                'user_name': user_doc['name'],
-                'ingredient_id': ingredient_doc['_id'],
-                'ingredient_name': ingredient_doc['name'],
-                'date': int(time.time()*1000)
-            }
-            db = self.client[self.db_name]
-            db.create_document(user_ingredient_doc)
-        finally:
-            self.client.disconnect()
+        user_ingredient_doc = {
+            'type': 'userIngredientRequest',
+            'user_id': user_doc['_id'],
+            'user_name': user_doc['name'],
+            'ingredient_id': ingredient_doc['_id'],
+            'ingredient_name': ingredient_doc['name'],
+            'date': int(time.time()*1000)
+        }
+        self.record_request(user_ingredient_doc)
 
     # Cuisine
 
@@ -221,47 +373,21 @@ class CloudantRecipeStore(object):
     def record_cuisine_request_for_user(self, cuisine_doc, user_doc):
         """
         Records the request by the user for the specified cuisine.
-        Stores the cuisine and the number of times it has been accessed in the user doc.
+        The number of times the user has requested the cuisine is counted by the by_user/cuisines view.
         Parameters
         ----------
         cuisine_doc - The existing Cloudant doc for the cuisine
         user_doc - The existing Cloudant doc for the user
         """
-        try:
-            self.client.connect()
-            # get latest user
-            latest_user_doc = self.client[self.db_name][user_doc['_id']]
-            # see if user has an array of cuisines, if not create it
-            if 'cuisines' not in latest_user_doc.keys():
-                latest_user_doc['cuisines'] = []
-            # find the cuisine that matches the name of the passed in cuisine
-            # if it doesn't exist create it
-            user_cuisines = list(filter(lambda x: x['name'] == cuisine_doc['name'], latest_user_doc['cuisines']))
-            if len(user_cuisines) > 0:
-                user_cuisine = user_cuisines[0]
-            else:
-                user_cuisine = {'name': cuisine_doc['name']}
-                latest_user_doc['cuisines'].append(user_cuisine)
-            # see if the user_cuisine exists, if not create it
-            if 'count' not in user_cuisine.keys():
-                user_cuisine['count'] = 0
-            # increment the count on the user_cuisine
-            user_cuisine['count'] += 1
-            # save the user doc
-            latest_user_doc.save()
-            # add a new doc with the user/cuisine details
-            user_cuisine_doc = {
-                'type': 'userCuisineRequest',
-                'user_id': user_doc['_id'],
-                'user_name': user_doc['name'],
-                'cuisine_id': cuisine_doc['_id'],
-                'cuisine_name': cuisine_doc['name'],
-                'date': int(time.time()*1000)
-            }
-            db = self.client[self.db_name]
-            db.create_document(user_cuisine_doc)
-        finally:
-            self.client.disconnect()
+        user_cuisine_doc = {
+            'type': 'userCuisineRequest',
+            'user_id': user_doc['_id'],
+            'user_name': user_doc['name'],
+            'cuisine_id': cuisine_doc['_id'],
+            'cuisine_name': cuisine_doc['name'],
+            'date': int(time.time()*1000)
+        }
+        self.record_request(user_cuisine_doc)
 
     # Recipe
 
@@ -286,29 +412,40 @@ class CloudantRecipeStore(object):
 
     def find_favorite_recipes_for_user(self, user_doc, count):
         """
-        Finds the user's favorite recipes in Cloudant.
+        Finds the user's most requested recipes, most requested first.
+        They are read from the by_user view the first time and from memory after that.
         Parameters
         ----------
         user_doc - The existing Cloudant doc for the user
         count - The max number of recipes to return
         """
-        try:
-            self.client.connect()
-            db = self.client[self.db_name]
-            latest_user_doc = db[user_doc['_id']]
-            if 'recipes' in latest_user_doc.keys():
-                user_recipes = latest_user_doc['recipes']
-                user_recipes.sort(key=lambda x: x['count'], reverse=True)
-                recipes = []
-                for i, recipe in enumerate(user_recipes):
-                    if i >= count:
-                        break
-                    recipes.append(recipe)
-                return recipes
-            else:
-                return []
-        finally:
-            self.client.disconnect()
+        favorites = self.favorite_recipes.get(user_doc['_id'], count)
+        if favorites is None:
+            # requests recorded while the view is read are kept and counted if the view doesn't count them
+            self.favorite_recipes.start_load(user_doc['_id'])
+            try:
+                # write the queued request docs first, so the view counts them
+                self.flush()
+                rows = self.get_user_request_counts(user_doc, 'recipes')
+                request_rows = []
+                for recipe_name in self.favorite_recipes.get_loading_recipes(user_doc['_id']):
+                    request_rows.extend(self.get_user_request_counts(user_doc, 'recipes', name=recipe_name))
+            except Exception:
+                self.favorite_recipes.cancel_load(user_doc['_id'])
+                raise
+            self.favorite_recipes.load(user_doc['_id'], rows, request_rows)
+            favorites = self.favorite_recipes.get(user_doc['_id'], count)
+        return favorites
+
+    def find_popular_recipes(self, ingredient_cuisine_doc, count):
+        """
+        Finds the recipes users picked most often after asking for the ingredient or cuisine, from memory.
+        Parameters
+        ----------
+        ingredient_cuisine_doc - The existing Cloudant doc for either the ingredient or cuisine
+        count - The max number of recipes to return
+        """
+        return self.recommendations.get(ingredient_cuisine_doc['_id'], count)
 
     def add_recipe(self, recipe_id, recipe_title, recipe_detail, ingredient_cuisine_doc, user_doc):
         """
@@ -321,94 +458,329 @@ class CloudantRecipeStore(object):
         ingredient_cuisine_doc - The existing Cloudant doc for either the ingredient or cuisine selected before the recipe
         user_doc - The existing Cloudant doc for the user
         """
+        recipe = self.add_recipe_doc(recipe_id, recipe_title, recipe_detail)
+        self.record_recipe_request_for_user(recipe, ingredient_cuisine_doc, user_doc)
+        return recipe
+
+    def add_recipe_doc(self, recipe_id, recipe_title, recipe_detail):
+        """
+        Adds a new recipe to Cloudant if a recipe with the specified name does not already exist, without recording a request for it.
+        Parameters
+        ----------
+        recipe_id - The ID of the recipe (typically the ID of the recipe returned from Spoonacular)
+        recipe_title - The title of the recipe
+        recipe_detail - The detailed instructions for making the recipe
+        """
         recipe = {
             'type': 'recipe',
             'name': self.get_unique_recipe_name(recipe_id),
             'title': recipe_title.strip(),
             'instructions': recipe_detail
         }
-        recipe = self.add_doc_if_not_exists(recipe, 'name')
-        self.record_recipe_request_for_user(recipe, ingredient_cuisine_doc, user_doc)
-        return recipe
+        return self.add_doc_if_not_exists(recipe, 'name')
 
     def record_recipe_request_for_user(self, recipe_doc, ingredient_cuisine_doc, user_doc):
         """
         Records the request by the user for the specified recipe.
-        Stores the recipe and the number of times it has been accessed in the user doc.
+        The number of times the user has requested the recipe is counted by the by_user/recipes view.
         Parameters
         ----------
         recipe_doc - The existing Cloudant doc for the recipe
         ingredient_cuisine_doc - The existing Cloudant doc for either the ingredient or cuisine selected before the recipe
         user_doc - The existing Cloudant doc for the user
         """
+        user_recipe_doc = {
+            'type': 'userRecipeRequest',
+            'user_id': user_doc['_id'],
+            'user_name': user_doc['name'],
+            'recipe_id': recipe_doc['_id'],
+            'recipe_name': recipe_doc['name'],
+            'recipe_title': recipe_doc['title'],
+            'date': int(time.time()*1000)
+        }
+        if ingredient_cuisine_doc is not None:
+            # counted by the by_ingredient_cuisine view to recommend the recipes picked most for the ingredient or cuisine
+            user_recipe_doc['ingredient_cuisine_id'] = ingredient_cuisine_doc['_id']
+            user_recipe_doc['ingredient_cuisine_type'] = ingredient_cuisine_doc['type']
+            user_recipe_doc['ingredient_cuisine_name'] = ingredient_cuisine_doc['name']
+        self.record_request(user_recipe_doc)
+
+    @metrics.timed('cloudant.record_request')
+    def record_request(self, request_doc):
+        """
+        Queues the request doc to be written in the background.
+        Each request doc is an increment of one of the counters aggregated by the by_user views,
+        so requests never update a shared doc and can't conflict.
+        Parameters
+        ----------
+        request_doc - The userIngredientRequest, userCuisineRequest or userRecipeRequest doc
+        """
+        # the ID is set here so a retried write of the same request is rejected as a conflict instead of counted twice
+        request_doc['_id'] = uuid.uuid4().hex
+        # recorded before it is queued, so the leaderboards keep it if it is written while they are loading
+        self.leaderboards.record(request_doc)
+        self.request_writer.add(request_doc)
+        self.recommendations.record(request_doc)
+        self.favorite_recipes.record(request_doc)
+
+    # Leaderboards
+
+    def get_leaderboard(self, kind, count=10):
+        """
+        Gets the most requested ingredients, cuisines or recipes and the number of requests on each day of the week, from memory.
+        The first call loads them from the by_popularity and by_day_of_week views, later requests recorded by other processes
+        are not counted.
+        Parameters
+        ----------
+        kind - The leaderboard, ingredients, cuisines or recipes
+        count - The max number of ingredients, cuisines or recipes
+        """
+        if kind not in KINDS:
+            raise ValueError('Unknown leaderboard {}, expected one of {}'.format(kind, ', '.join(sorted(KINDS))))
+        if not self.leaderboards.is_loaded():
+            with self.leaderboards_lock:
+                if not self.leaderboards.is_loaded():
+                    self.load_leaderboards()
+        return self.leaderboards.get(kind, min(count, self.leaderboards.capacity))
+
+    def load_leaderboards(self):
+        # requests recorded while the views are read are kept and counted if they were not written before
+        self.leaderboards.start_load()
         try:
+            # write the queued request docs first, so the views count them
+            self.flush()
+            # pause the writer so no request docs are written between reading the views and loading them
+            with self.request_writer.write_lock:
+                popularity_rows = {}
+                day_of_week_rows = {}
+                for kind in KINDS:
+                    popularity_rows[kind] = self.get_request_counts('by_popularity', kind)
+                    day_of_week_rows[kind] = self.get_request_counts('by_day_of_week', kind)
+                self.leaderboards.load(popularity_rows, day_of_week_rows)
+        except Exception:
+            self.leaderboards.cancel_load()
+            raise
+        logger.info('Loaded leaderboards')
+
+    # Cloudant Helper Methods
+
+    @metrics.timed('cloudant.connect')
+    def connect(self):
+        """
+        Starts a Cloudant session and mounts a keep-alive connection pool on it.
+        """
+        with self.connection_lock:
             self.client.connect()
-            # get latest user
-            latest_user_doc = self.client[self.db_name][user_doc['_id']]
-            # see if user has an array of recipes, if not create it
-            if 'recipes' not in latest_user_doc.keys():
-                latest_user_doc['recipes'] = []
-            # find the recipe that matches the name of the passed in recipe
-            # if it doesn't exist create it
-            user_recipes = list(filter(lambda x: x['id'] == recipe_doc['name'], latest_user_doc['recipes']))
-            if len(user_recipes) > 0:
-                user_recipe = user_recipes[0]
+            self.mount_pool(self.client.r_session)
+            self.last_health_check = time.time()
+
+    def mount_pool(self, session):
+        # pool_block makes threads wait for a free connection instead of opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        session.mount(self.client.server_url, adapter)
+
+    @metrics.timed('cloudant.connect')
+    def reconnect(self):
+        """
+        Starts a new Cloudant session and swaps it in for the current one.
+        Other threads keep using the old session until the new one is logged in and never see the client without a session.
+        """
+        logger.warning('Cloudant session is no longer valid, reconnecting...')
+        # log in on a copy of the client, whose connect would otherwise return early because the client has a session
+        client = copy.copy(self.client)
+        client.r_session = None
+        client.connect()
+        self.mount_pool(client.r_session)
+        with self.connection_lock:
+            # the old session is not logged out or closed, it is already invalid and requests in flight on it finish
+            # (or fail) on their own, after which it is garbage collected
+            self.client.r_session = client.r_session
+            self.last_health_check = time.time()
+
+    def check_connection(self):
+        """
+        Verifies that the Cloudant session is still valid and reconnects if it is not.
+        """
+        # only one thread needs to run the check, the others keep using the current session
+        if not self.health_check_lock.acquire(False):
+            return
+        try:
+            try:
+                session = self.client.session()
+                healthy = session is None or session['userCtx']['name'] is not None
+            except Exception:
+                healthy = False
+            if healthy:
+                self.last_health_check = time.time()
             else:
-                user_recipe = {
-                    'id': recipe_doc['name'],
-                    'title': recipe_doc['title']
-                }
-                latest_user_doc['recipes'].append(user_recipe)
-            # see if the user_recipe exists, if not create it
-            if 'count' not in user_recipe.keys():
-                user_recipe['count'] = 0
-            # increment the count on the user_recipe
-            user_recipe['count'] += 1
-            # save the user doc
-            latest_user_doc.save()
-            # add a new doc with the user/recipe details
-            user_recipe_doc = {
-                'type': 'userRecipeRequest',
-                'user_id': user_doc['_id'],
-                'user_name': user_doc['name'],
-                'recipe_id': recipe_doc['_id'],
-                'recipe_title': recipe_doc['title'],
-                'date': int(time.time()*1000)
-            }
-            db = self.client[self.db_name]
-            db.create_document(user_recipe_doc)
+                self.reconnect()
         finally:
-            self.client.disconnect()
+            self.health_check_lock.release()
 
-    # Cloudant Helper Methods
+    def get_db(self):
+        """
+        Gets the database, checking the health of the Cloudant session every health_check_interval seconds.
+        """
+        if time.time() - self.last_health_check >= self.health_check_interval:
+            self.check_connection()
+        if self.db is None:
+            self.db = self.client[self.db_name]
+        return self.db
+
+    @metrics.timed('cloudant.view')
+    def get_user_request_counts(self, user_doc, view_name, name=None):
+        """
+        Gets the number of requests by the user for each ingredient, cuisine or recipe from the by_user views.
+        Parameters
+        ----------
+        user_doc - The existing Cloudant doc for the user
+        view_name - The name of the by_user view (ingredients, cuisines or recipes)
+        name - The unique name of an ingredient, cuisine or recipe to get one row per request for, with the ID of the
+        request doc, instead of one row per key
+        """
+        start_key = [user_doc['_id']] if name is None else [user_doc['_id'], name]
+        result = self.get_db().get_view_result(
+            '_design/by_user',
+            view_name,
+            raw_result=True,
+            reduce=name is None,
+            group=name is None,
+            startkey=start_key,
+            endkey=start_key + [{}]
+        )
+        return result['rows']
+
+    def get_ingredient_index(self):
+        """
+        Gets the ingredient index, loading the stored ingredient docs into it the first time.
+        """
+        if not self.ingredient_index.is_loaded():
+            with self.ingredient_index_lock:
+                if not self.ingredient_index.is_loaded():
+                    self.ingredient_index.load(self.iterate_docs('ingredient'))
+                    logger.info('Loaded ingredient index', extra={'docs': len(self.ingredient_index.docs)})
+        return self.ingredient_index
+
+    def iterate_docs(self, doc_type, batch_size=1000):
+        """
+        Iterates over the docs of the specified type stored under derived IDs, one page of _all_docs at a time.
+        Parameters
+        ----------
+        doc_type - The type value of the documents
+        batch_size - The number of docs fetched per request
+        """
+        # page through the IDs starting with the type prefix, using the last ID of each page as the start key of the next one
+        start_key = self.get_doc_id(doc_type, '')
+        end_key = self.get_doc_id(doc_type, u'\ufff0')
+        while True:
+            rows = self.get_db().all_docs(include_docs=True, startkey=start_key, endkey=end_key, limit=batch_size + 1)['rows']
+            for row in rows[:batch_size]:
+                yield row['doc']
+            if len(rows) <= batch_size:
+                break
+            start_key = rows[batch_size]['id']
 
+    @metrics.timed('cloudant.view')
+    def get_request_counts(self, design_doc, view_name):
+        """
+        Gets the number of requests for each key of one of the by_popularity or by_day_of_week views.
+        Parameters
+        ----------
+        design_doc - The name of the design doc, by_popularity or by_day_of_week
+        view_name - The name of the view (ingredients, cuisines or recipes)
+        """
+        result = self.get_db().get_view_result('_design/' + design_doc, view_name, raw_result=True, group=True)
+        return result['rows']
+
+    def get_latest_doc(self, doc_id):
+        """
+        Fetches the latest revision of the doc with the specified ID.
+        Parameters
+        ----------
+        doc_id - The ID of the doc
+        """
+        # the database object caches docs it has returned, so fetch through a new Document to always get the latest
+        doc = Document(self.get_db(), doc_id)
+        doc.fetch()
+        return doc
+
+    def create_doc(self, doc):
+        """
+        Creates a new doc in Cloudant.
+        Parameters
+        ----------
+        doc - The document to create
+        """
+        # db.create_document would keep every created doc in the database object's local cache
+        new_doc = Document(self.get_db())
+        new_doc.update(doc)
+        new_doc.create()
+        return new_doc
+
+    @staticmethod
+    def get_doc_id(doc_type, name):
+        """
+        Gets the ID of the doc with the specified type and unique name (for example cuisine:italian).
+        Parameters
+        ----------
+        doc_type - The type value of the document stored in Cloudant
+        name - The unique name of the document
+        """
+        return '{}:{}'.format(doc_type, name)
+
+    @metrics.timed('cloudant.find_doc')
     def find_doc(self, doc_type, property_name, property_value):
         """
         Finds a doc based on the specified doc_type, property_name, and property_value.
+        Docs are looked up by ID when property_name is name, otherwise with a query.
         Parameters
         ----------
         doc_type - The type value of the document stored in Cloudant
         property_name - The property name to search for
         property_value - The value that should match for the specified property name
         """
+        if property_name != 'name':
+            return self.query_doc(doc_type, property_name, property_value)
+        doc = self.doc_cache.get(doc_type, property_value)
+        if doc is not None:
+            return doc
         try:
-            self.client.connect()
-            db = self.client[self.db_name]
-            selector = {
-                '_id': {'$gt': 0},
-                'type': doc_type,
-                property_name: property_value
-            }
-            query = Query(db, selector=selector)
-            for doc in query()['docs']:
-                return doc
-            return None
-        finally:
-            self.client.disconnect()
+            doc = self.get_latest_doc(self.get_doc_id(doc_type, property_value))
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            if not self.legacy_lookup:
+                return None
+            doc = self.query_doc(doc_type, property_name, property_value)
+            if doc is None:
+                return None
+        self.doc_cache.put(doc_type, property_value, doc)
+        return doc
+
+    @metrics.timed('cloudant.query')
+    def query_doc(self, doc_type, property_name, property_value):
+        """
+        Finds a doc with a query on type and the specified property (served by the type-name index for the name property).
+        Parameters
+        ----------
+        doc_type - The type value of the document stored in Cloudant
+        property_name - The property name to search for
+        property_value - The value that should match for the specified property name
+        """
+        selector = {
+            'type': doc_type,
+            property_name: property_value
+        }
+        query = Query(self.get_db(), selector=selector)
+        for doc in query(limit=1)['docs']:
+            return doc
+        return None
 
+    @metrics.timed('cloudant.add_doc')
     def add_doc_if_not_exists(self, doc, unique_property_name):
         """
         Adds a new doc to Cloudant if a doc with the same value for unique_property_name does not exist.
+        When unique_property_name is name the doc is created under its derived ID, so concurrent adds can't create duplicates.
         Parameters
         ----------
         doc - The document to add
@@ -416,15 +788,27 @@ class CloudantRecipeStore(object):
         """
         doc_type = doc['type']
         property_value = doc[unique_property_name]
-        existing_doc = self.find_doc(doc_type, unique_property_name, property_value)
+        if unique_property_name != 'name':
+            existing_doc = self.find_doc(doc_type, unique_property_name, property_value)
+            if existing_doc is not None:
+                logger.info('Returning existing doc', extra=log.sampled(doc_type=doc_type, doc_name=property_value))
+                return existing_doc
+            logger.info('Creating doc', extra={'doc_type': doc_type, 'doc_name': property_value})
+            return self.create_doc(doc)
+        existing_doc = self.doc_cache.get(doc_type, property_value)
         if existing_doc is not None:
-            print('Returning {} doc where {}={}'.format(doc_type, unique_property_name, property_value))
+            logger.info('Returning existing doc', extra=log.sampled(doc_type=doc_type, doc_name=property_value))
             return existing_doc
-        else:
-            print('Creating {} doc where {}={}'.format(doc_type, unique_property_name, property_value))
-            try:
-                self.client.connect()
-                db = self.client[self.db_name]
-                return db.create_document(doc)
-            finally:
-                self.client.disconnect()
+        doc = dict(doc)
+        doc['_id'] = self.get_doc_id(doc_type, property_value)
+        try:
+            logger.info('Creating doc', extra={'doc_type': doc_type, 'doc_name': property_value})
+            new_doc = self.create_doc(doc)
+            self.doc_cache.invalidate(doc_type, property_value)
+            return new_doc
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 409:
+                raise
+            # the doc already exists
+            logger.info('Returning existing doc', extra=log.sampled(doc_type=doc_type, doc_name=property_value))
+            return self.find_doc(doc_type, unique_property_name, property_value)
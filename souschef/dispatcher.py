@@ -0,0 +1,100 @@
+import collections
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDispatcher(object):
+
+    def __init__(self, handler, num_workers=8, max_pending=256):
+        """
+        Creates a new instance of MessageDispatcher.
+        Messages dispatched with the same key are handled one at a time in the order they were dispatched,
+        messages with different keys are handled in parallel by a bounded pool of worker threads.
+        Parameters
+        ----------
+        handler - The function called with the arguments of each dispatched message
+        num_workers - The number of worker threads handling messages
+        max_pending - The max number of messages waiting to be handled before dispatch blocks
+        """
+        self.handler = handler
+        self.num_workers = num_workers
+        self.pending = threading.Semaphore(max_pending)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        # keys with pending messages that are not currently being handled by a worker
+        self.ready_keys = queue.Queue()
+        # key -> messages waiting to be handled, a key is present while it is queued or being handled
+        self.key_messages = {}
+        self.workers = []
+
+    def start(self):
+        """
+        Starts the worker threads.
+        """
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self.work, name='souschef-worker-{}'.format(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def dispatch(self, key, *args):
+        """
+        Queues a message to be handled by a worker. Blocks while max_pending messages are waiting.
+        Parameters
+        ----------
+        key - The key used to order messages (typically the ID of the Slack user)
+        args - The arguments passed to the handler
+        """
+        self.pending.acquire()
+        with self.lock:
+            if key in self.key_messages:
+                # a worker owns this key, it will pick the message up when it is done with the current one
+                self.key_messages[key].append(args)
+                return
+            self.key_messages[key] = collections.deque([args])
+        self.ready_keys.put(key)
+
+    def work(self):
+        while True:
+            key = self.ready_keys.get()
+            if key is None:
+                break
+            with self.lock:
+                args = self.key_messages[key].popleft()
+            try:
+                self.handler(*args)
+            except Exception:
+                logger.exception('Failed to handle message')
+            finally:
+                self.pending.release()
+            with self.lock:
+                if len(self.key_messages[key]) > 0:
+                    requeue = True
+                else:
+                    requeue = False
+                    del self.key_messages[key]
+                    if len(self.key_messages) == 0:
+                        self.idle.notify_all()
+            # put the key at the back of the queue so other users get a turn
+            if requeue:
+                self.ready_keys.put(key)
+
+    def stop(self):
+        """
+        Waits for all dispatched messages to be handled and stops the worker threads.
+        """
+        with self.lock:
+            while len(self.key_messages) > 0:
+                self.idle.wait()
+        for _ in self.workers:
+            self.ready_keys.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
@@ -0,0 +1,101 @@
+import collections
+import threading
+import time
+
+from . import metrics
+
+
+class DocCache(object):
+
+    # default number of seconds a doc of each type stays in the cache
+    DEFAULT_TTLS = {
+        'ingredient': 3600,
+        'cuisine': 3600,
+        'recipe': 3600,
+        'user': 600
+    }
+
+    def __init__(self, max_size=10000, ttls=None, default_ttl=300):
+        """
+        Creates a new instance of DocCache, a thread-safe LRU cache of Cloudant docs keyed on doc type and name.
+        Parameters
+        ----------
+        max_size - The max number of docs to keep, the least recently used doc is evicted when the cache is full
+        ttls - A dict of doc type to the number of seconds a doc of that type stays in the cache (0 disables caching)
+        default_ttl - The number of seconds a doc stays in the cache if its type is not in ttls
+        """
+        self.max_size = max_size
+        self.ttls = dict(self.DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.docs = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, doc_type, name):
+        """
+        Gets the cached doc or None if the doc is not cached or has expired.
+        Parameters
+        ----------
+        doc_type - The type of the doc
+        name - The unique name of the doc
+        """
+        key = (doc_type, name)
+        with self.lock:
+            entry = self.docs.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                self.misses += 1
+                metrics.inc('souschef_cache_requests_total', type=doc_type, result='miss')
+                return None
+            # re-insert to mark the doc as most recently used
+            self.docs[key] = entry
+            self.hits += 1
+        metrics.inc('souschef_cache_requests_total', type=doc_type, result='hit')
+        return entry[0]
+
+    def put(self, doc_type, name, doc):
+        """
+        Adds the doc to the cache.
+        Parameters
+        ----------
+        doc_type - The type of the doc
+        name - The unique name of the doc
+        doc - The doc
+        """
+        ttl = self.ttls.get(doc_type, self.default_ttl)
+        if ttl <= 0:
+            return
+        key = (doc_type, name)
+        with self.lock:
+            self.docs.pop(key, None)
+            self.docs[key] = (doc, time.time() + ttl)
+            while len(self.docs) > self.max_size:
+                self.docs.popitem(last=False)
+
+    def invalidate(self, doc_type, name):
+        """
+        Removes the doc from the cache.
+        Parameters
+        ----------
+        doc_type - The type of the doc
+        name - The unique name of the doc
+        """
+        with self.lock:
+            self.docs.pop((doc_type, name), None)
+
+    def clear(self):
+        with self.lock:
+            self.docs.clear()
+
+    def stats(self):
+        """
+        Returns the number of cache hits, misses and cached docs.
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.docs)
+            }
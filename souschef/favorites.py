@@ -0,0 +1,155 @@
+import collections
+import threading
+import time
+
+from .leaderboard import TopK
+
+
+class FavoriteRecipes(object):
+
+    def __init__(self, capacity=20, max_users=10000, ttl=3600):
+        """
+        Creates a new instance of FavoriteRecipes, a thread-safe LRU cache of each user's most requested recipes.
+        A user's recipe counts are loaded from the by_user view the first time they are read into a TopK keeping the capacity
+        most requested sorted, which is updated with each recipe request the user makes, so reading the favorites doesn't sort
+        all of them.
+        Parameters
+        ----------
+        capacity - The number of most requested recipes kept for each user, the max count that can be read
+        max_users - The max number of users kept, the least recently used user is evicted when the cache is full
+        ttl - The number of seconds before a user's recipes are loaded from the view again, to count requests recorded by other processes
+        """
+        self.capacity = capacity
+        self.max_users = max_users
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # user doc ID -> (TopK of unique recipe names, recipe name -> title, expiry time)
+        self.users = collections.OrderedDict()
+        # user doc ID -> [number of loads in progress, recipe request docs recorded since the first started]
+        self.loading = {}
+
+    def get(self, user_id, count):
+        """
+        Gets the user's count most requested recipes, most requested first, or None if they are not loaded or have expired.
+        Parameters
+        ----------
+        user_id - The ID of the user doc
+        count - The max number of recipes, at most the capacity
+        """
+        with self.lock:
+            entry = self.users.pop(user_id, None)
+            if entry is None or entry[2] < time.time():
+                return None
+            # re-insert to mark the user as most recently used
+            self.users[user_id] = entry
+            top, titles, _ = entry
+            return [{'id': name, 'title': titles[name], 'count': value} for name, value in top.top(count)]
+
+    def start_load(self, user_id):
+        """
+        Marks the user as loading, call it before reading the by_user view and then call load or cancel_load.
+        The recipe requests recorded meanwhile are kept and counted by load if the view doesn't count them.
+        Parameters
+        ----------
+        user_id - The ID of the user doc
+        """
+        with self.lock:
+            self.loading.setdefault(user_id, [0, []])[0] += 1
+
+    def cancel_load(self, user_id):
+        """
+        Ends a load started with start_load without loading the user, for example because reading the view failed.
+        Parameters
+        ----------
+        user_id - The ID of the user doc
+        """
+        with self.lock:
+            self.end_load(user_id)
+
+    def get_loading_recipes(self, user_id):
+        """
+        Gets the unique names of the recipes requested since the user started loading, call it after reading the
+        counts from the view and pass the rows of the requests for these recipes to load.
+        Parameters
+        ----------
+        user_id - The ID of the user doc
+        """
+        with self.lock:
+            return sorted(set(request_doc['recipe_name'] for request_doc in self.loading[user_id][1]))
+
+    def end_load(self, user_id):
+        # returns the request docs recorded since the first load in progress started, the lock must be held
+        loading = self.loading[user_id]
+        loading[0] -= 1
+        if loading[0] == 0:
+            del self.loading[user_id]
+        return loading[1]
+
+    def load(self, user_id, rows, request_rows):
+        """
+        Replaces the user's recipes with the rows of the by_user recipes view for the user, then counts the recipe requests
+        recorded since start_load that the view doesn't count.
+        Parameters
+        ----------
+        user_id - The ID of the user doc
+        rows - The rows of the view queried with group=true, keyed on [user doc ID, unique recipe name, recipe title]
+        request_rows - The rows of the view queried with reduce=false for each recipe returned by get_loading_recipes,
+        read after rows, with the ID of the request doc
+        """
+        counts = {}
+        titles = {}
+        for row in rows:
+            counts[row['key'][1]] = counts.get(row['key'][1], 0) + row['value']
+            titles[row['key'][1]] = row['key'][2]
+        # a request recorded during the load may have been written before or after the counts were read,
+        # so the recipes requested meanwhile are counted from their requests, which were read later
+        recounted = {}
+        for row in request_rows:
+            recounted[row['key'][1]] = recounted.get(row['key'][1], 0) + row['value']
+            titles[row['key'][1]] = row['key'][2]
+        counts.update(recounted)
+        request_ids = set(row['id'] for row in request_rows)
+        top = TopK(self.capacity)
+        # adding the most requested first saves moving them up, only the titles of the top are kept
+        for name, count in sorted(counts.items(), key=lambda x: -x[1]):
+            top.add(name, count)
+        titles = dict((name, title) for name, title in titles.items() if name in top.positions)
+        with self.lock:
+            # requests written before their recipe was recounted are already counted, requests for the other
+            # recipes were recorded after the counts were read
+            for request_doc in self.end_load(user_id):
+                if request_doc['_id'] not in request_ids:
+                    self.count(top, titles, request_doc)
+            self.users.pop(user_id, None)
+            self.users[user_id] = (top, titles, time.time() + self.ttl)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+
+    def record(self, request_doc):
+        """
+        Counts the recipe request doc if its user is loaded or loading (otherwise the view counts it when the user is loaded).
+        Parameters
+        ----------
+        request_doc - The userRecipeRequest doc, other request docs are ignored
+        """
+        if request_doc.get('type') != 'userRecipeRequest':
+            return
+        with self.lock:
+            loading = self.loading.get(request_doc['user_id'])
+            if loading is not None:
+                loading[1].append(request_doc)
+                return
+            entry = self.users.get(request_doc['user_id'])
+            if entry is not None:
+                top, titles, _ = entry
+                self.count(top, titles, request_doc)
+
+    @staticmethod
+    def count(top, titles, request_doc):
+        top.add(request_doc['recipe_name'])
+        if request_doc['recipe_name'] in top.positions:
+            titles[request_doc['recipe_name']] = request_doc['recipe_title']
+            # drop the titles of the recipes that left the top
+            if len(titles) > top.capacity:
+                for name in [name for name in titles if name not in top.positions]:
+                    del titles[name]
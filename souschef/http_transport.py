@@ -0,0 +1,212 @@
+import collections
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, capacity=None):
+        """
+        Creates a new instance of TokenBucket, a thread-safe rate limiter.
+        Tokens are added at rate per second up to capacity, each request takes one token.
+        Parameters
+        ----------
+        rate - The number of requests allowed per second on average
+        capacity - The max number of requests allowed in a burst (defaults to rate)
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, blocking until one is available.
+        """
+        while True:
+            wait = self.take()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available. Returns True if a token was taken.
+        """
+        return self.take() == 0
+
+    def take(self):
+        # returns 0 if a token was taken, otherwise the number of seconds until one is available
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return max(self.paused_until - now, (1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for the specified number of seconds, for example when the upstream asks to retry later.
+        Parameters
+        ----------
+        seconds - The number of seconds to pause
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+
+class HttpTransport(object):
+
+    # responses worth retrying: rate limited or a temporary server error
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # only idempotent requests are retried
+    RETRY_METHODS = ('GET', 'HEAD')
+    # header used by the upstream to report the number of requests left in the quota
+    QUOTA_REMAINING_HEADER = 'X-RateLimit-requests-Remaining'
+
+    def __init__(self, pool_size=10, timeout=(3.05, 10), max_retries=3, backoff_factor=0.5, max_backoff=30,
+                 rate_limiter=None, latency_samples=1000):
+        """
+        Creates a new instance of HttpTransport, a requests.Session with keep-alive pooling, timeouts,
+        retries with exponential backoff and jitter on 429/5xx and connection errors, and optional client-side rate limiting.
+        Parameters
+        ----------
+        pool_size - The max number of connections kept open to each host
+        timeout - The connect and read timeouts in seconds of each request
+        max_retries - The number of times a failed request is retried
+        backoff_factor - The max number of seconds to wait before the first retry, doubled on each retry
+        max_backoff - The max number of seconds to wait before a retry
+        rate_limiter - A TokenBucket every request waits on, or None to not limit requests
+        latency_samples - The number of recent request latencies kept for stats
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=latency_samples)
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.quota_remaining = None
+
+    def close(self):
+        self.session.close()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends the request, retrying it if it fails with a connection error, a timeout or a retryable status.
+        Returns the last response, the caller decides what to do with an error status.
+        Raises the last exception if no response was received.
+        Parameters
+        ----------
+        method - The HTTP method
+        url - The URL
+        kwargs - Passed to requests.Session.request
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        max_retries = self.max_retries if method in self.RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            start = time.time()
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.record(start, None, attempt < max_retries)
+                if attempt >= max_retries:
+                    raise
+            else:
+                retry = response.status_code in self.RETRY_STATUSES and attempt < max_retries
+                self.record(start, response, retry)
+                if not retry:
+                    return response
+            self.wait(attempt, response)
+            attempt += 1
+
+    def wait(self, attempt, response):
+        # honour Retry-After, otherwise back off exponentially with full jitter
+        delay = self.get_retry_after(response)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+        elif self.rate_limiter is not None:
+            # hold back every thread using the rate limiter, not just this one
+            self.rate_limiter.pause(delay)
+        time.sleep(min(delay, self.max_backoff))
+
+    @staticmethod
+    def get_retry_after(response):
+        if response is None:
+            return None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            return None
+        try:
+            return max(0, float(retry_after))
+        except ValueError:
+            pass
+        retry_date = email.utils.parsedate_tz(retry_after)
+        if retry_date is None:
+            return None
+        return max(0, email.utils.mktime_tz(retry_date) - time.time())
+
+    def record(self, start, response, retry):
+        metrics.inc('souschef_upstream_requests_total', status=response.status_code if response is not None else 'error')
+        if retry:
+            metrics.inc('souschef_upstream_retries_total')
+        with self.lock:
+            self.latencies.append(time.time() - start)
+            self.requests += 1
+            if retry:
+                self.retries += 1
+            elif response is None or response.status_code in self.RETRY_STATUSES:
+                self.failures += 1
+            if response is not None:
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                quota_remaining = response.headers.get(self.QUOTA_REMAINING_HEADER)
+                if quota_remaining is not None and quota_remaining.isdigit():
+                    self.quota_remaining = int(quota_remaining)
+
+    def stats(self):
+        """
+        Returns the number of requests, retries, rate limited responses and failures,
+        the remaining upstream quota if reported, and percentiles of the recent request latencies in milliseconds.
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'failures': self.failures,
+                'quota_remaining': self.quota_remaining
+            }
+        for p in (50, 95, 99):
+            if len(latencies) > 0:
+                stats['p{}_ms'.format(p)] = latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))] * 1000
+            else:
+                stats['p{}_ms'.format(p)] = None
+        return stats
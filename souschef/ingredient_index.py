@@ -0,0 +1,138 @@
+import threading
+
+
+class IngredientIndex(object):
+
+    def __init__(self):
+        """
+        Creates a new instance of IngredientIndex, a thread-safe inverted index from each ingredient to the stored
+        ingredient docs (one per list of ingredients asked for) that include it.
+        It answers which stored recipes contain at least the requested ingredients without calling Cloudant or Spoonacular.
+        """
+        self.lock = threading.Lock()
+        self.loaded = False
+        # ingredient doc name -> (set of its ingredients, its recipes)
+        self.docs = {}
+        # ingredient -> names of the ingredient docs including it
+        self.postings = {}
+
+    @staticmethod
+    def get_ingredients(ingredient_str):
+        """
+        Gets the set of ingredients in the ingredient or comma-separated list of ingredients.
+        Parameters
+        ----------
+        ingredient_str - The ingredient or comma-separated list of ingredients, as specified by the user or as the name of an ingredient doc
+        """
+        return frozenset(x.strip() for x in ingredient_str.lower().split(',') if x.strip())
+
+    def is_loaded(self):
+        with self.lock:
+            return self.loaded
+
+    def load(self, ingredient_docs):
+        """
+        Adds the existing ingredient docs and marks the index as loaded.
+        Parameters
+        ----------
+        ingredient_docs - The ingredient docs stored in Cloudant
+        """
+        for ingredient_doc in ingredient_docs:
+            self.add(ingredient_doc)
+        with self.lock:
+            self.loaded = True
+
+    def add(self, ingredient_doc):
+        """
+        Adds the ingredient doc, or replaces the recipes of an ingredient doc with the same name.
+        Parameters
+        ----------
+        ingredient_doc - The ingredient doc, with the unique name of its ingredients and its recipes
+        """
+        name = ingredient_doc['name']
+        ingredients = self.get_ingredients(name)
+        if len(ingredients) == 0:
+            return
+        with self.lock:
+            self.docs[name] = (ingredients, ingredient_doc.get('recipes') or [])
+            for ingredient in ingredients:
+                self.postings.setdefault(ingredient, set()).add(name)
+
+    def get_known_ingredients(self):
+        """
+        Gets the sorted ingredients of the ingredient docs that have recipes.
+        """
+        with self.lock:
+            return sorted(set(ingredient for ingredients, recipes in self.docs.values() if len(recipes) > 0
+                              for ingredient in ingredients))
+
+    def find(self, ingredient_str, min_coverage=1.0):
+        """
+        Finds the ingredient docs sharing ingredients with the request. Returns (name, coverage) tuples ranked by coverage,
+        the fraction of the requested ingredients the doc includes, then by the number of ingredients it has that weren't requested.
+        Parameters
+        ----------
+        ingredient_str - The ingredient or comma-separated list of ingredients specified by the user
+        min_coverage - The min fraction of the requested ingredients a doc must include, 1 for docs including all of them
+        """
+        ingredients = self.get_ingredients(ingredient_str)
+        if len(ingredients) == 0:
+            return []
+        with self.lock:
+            postings = [self.postings.get(ingredient, set()) for ingredient in ingredients]
+            if min_coverage >= 1:
+                # intersect starting from the rarest ingredient
+                postings.sort(key=len)
+                names = set(postings[0])
+                for posting in postings[1:]:
+                    names &= posting
+                counts = dict((name, len(ingredients)) for name in names)
+            else:
+                counts = {}
+                for posting in postings:
+                    for name in posting:
+                        counts[name] = counts.get(name, 0) + 1
+            matches = []
+            for name, count in counts.items():
+                coverage = count / float(len(ingredients))
+                if coverage >= min_coverage:
+                    extra = len(self.docs[name][0]) - count
+                    matches.append((name, coverage, extra))
+        matches.sort(key=lambda x: (-x[1], x[2], x[0]))
+        return [(name, coverage) for name, coverage, _ in matches]
+
+    @staticmethod
+    def uses_all_ingredients(recipe, ingredients):
+        """
+        Returns True if the recipe, as returned by Spoonacular's findByIngredients, uses all of the ingredients it was found for.
+        findByIngredients also returns recipes using only some of them, and recipes without a usedIngredientCount
+        can't be told apart, so they are left out.
+        Parameters
+        ----------
+        recipe - The recipe stored in the ingredient doc
+        ingredients - The set of ingredients of the ingredient doc
+        """
+        return recipe.get('usedIngredientCount', 0) >= len(ingredients)
+
+    def find_recipes(self, ingredient_str, count, min_coverage=1.0):
+        """
+        Gets up to count recipes of the ingredient docs found for the request, best ranked docs first and without duplicates.
+        Only the recipes using all of their doc's ingredients are returned, so they use all of the requested ingredients the doc includes.
+        Parameters
+        ----------
+        ingredient_str - The ingredient or comma-separated list of ingredients specified by the user
+        count - The max number of recipes to return
+        min_coverage - The min fraction of the requested ingredients a doc must include, 1 for docs including all of them
+        """
+        recipes = []
+        recipe_ids = set()
+        for name, _ in self.find(ingredient_str, min_coverage):
+            with self.lock:
+                doc_ingredients, doc_recipes = self.docs[name]
+            for recipe in doc_recipes:
+                if recipe['id'] not in recipe_ids and self.uses_all_ingredients(recipe, doc_ingredients):
+                    recipe_ids.add(recipe['id'])
+                    recipes.append(recipe)
+                    if len(recipes) >= count:
+                        return recipes
+        return recipes
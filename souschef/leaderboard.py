@@ -0,0 +1,191 @@
+import threading
+import time
+
+# the leaderboards and, for each, the type of the request docs counted and the property they are counted by,
+# the same as the by_popularity views
+KINDS = {
+    'ingredients': ('userIngredientRequest', 'ingredient_name'),
+    'cuisines': ('userCuisineRequest', 'cuisine_name'),
+    'recipes': ('userRecipeRequest', 'recipe_title')
+}
+# the keys of the by_day_of_week views
+WEEKDAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+class TopK(object):
+
+    def __init__(self, capacity=100, margin=None):
+        """
+        Creates a new instance of TopK, which counts names and keeps the capacity most counted ones sorted.
+        Counts only go up, so a name outside the top can only enter it when it is counted, and a count
+        only moves the counted name, which keeps each update to a few comparisons.
+        The counts of at most margin names outside the top are kept, when there are more the least counted of them
+        are dropped and start again from 0 if they are counted again.
+        Not thread-safe, its owner is.
+        Parameters
+        ----------
+        capacity - The number of names kept sorted, the max count that can be passed to top
+        margin - The max number of names outside the top whose counts are kept (the capacity if None)
+        """
+        self.capacity = capacity
+        self.margin = margin if margin is not None else capacity
+        self.counts = {}
+        # the most counted names, most counted first
+        self.top_names = []
+        # name -> position in top_names
+        self.positions = {}
+
+    def add(self, name, amount=1):
+        count = self.counts.get(name, 0) + amount
+        self.counts[name] = count
+        position = self.positions.get(name)
+        if position is None:
+            if len(self.top_names) < self.capacity:
+                position = len(self.top_names)
+                self.top_names.append(name)
+            elif count > self.counts[self.top_names[-1]]:
+                position = len(self.top_names) - 1
+                del self.positions[self.top_names[position]]
+                self.top_names[position] = name
+            else:
+                self.trim()
+                return
+            self.positions[name] = position
+        # move the name up past the names it now has a higher count than
+        while position > 0 and self.counts[self.top_names[position - 1]] < count:
+            above = self.top_names[position - 1]
+            self.top_names[position] = above
+            self.positions[above] = position
+            position -= 1
+        self.top_names[position] = name
+        self.positions[name] = position
+        self.trim()
+
+    def trim(self):
+        # drop the least counted names outside the top down to half the margin, so trimming is rare
+        if len(self.counts) <= self.capacity + self.margin:
+            return
+        outside = sorted((name for name in self.counts if name not in self.positions), key=lambda name: -self.counts[name])
+        for name in outside[self.margin // 2:]:
+            del self.counts[name]
+
+    def top(self, count):
+        return [(name, self.counts[name]) for name in self.top_names[:count]]
+
+
+class Leaderboards(object):
+
+    def __init__(self, capacity=100):
+        """
+        Creates a new instance of Leaderboards, the most requested ingredients, cuisines and recipes and the number of
+        requests on each day of the week, kept in memory so they are read without querying the views.
+        They are loaded once from the by_popularity and by_day_of_week views and then updated with each request doc recorded.
+        The request docs recorded while they are loading are kept and counted by load if they were not written before
+        the views were read.
+        Parameters
+        ----------
+        capacity - The number of most requested ingredients, cuisines and recipes kept
+        """
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.loaded = False
+        # (request docs recorded since start_load, IDs of the request docs written since start_load) while loading
+        self.loading = None
+        self.top = dict((kind, TopK(capacity)) for kind in KINDS)
+        self.by_day_of_week = dict((kind, dict((day, 0) for day in WEEKDAYS)) for kind in KINDS)
+
+    def is_loaded(self):
+        with self.lock:
+            return self.loaded
+
+    def start_load(self):
+        """
+        Starts keeping the request docs recorded and written, call it before writing the queued request docs and
+        reading the views, then call load or cancel_load.
+        """
+        with self.lock:
+            self.loading = ([], set())
+
+    def cancel_load(self):
+        """
+        Ends a load started with start_load without loading, for example because reading a view failed.
+        """
+        with self.lock:
+            self.loading = None
+
+    def written(self, request_docs):
+        """
+        Marks the request docs as written, so load doesn't count them again if they were recorded while loading.
+        Parameters
+        ----------
+        request_docs - The request docs written to Cloudant
+        """
+        with self.lock:
+            if self.loading is not None:
+                self.loading[1].update(request_doc['_id'] for request_doc in request_docs)
+
+    def load(self, popularity_rows, day_of_week_rows):
+        """
+        Replaces the counts with the rows of the views, grouped by key, then counts the request docs recorded since
+        start_load that were not written before the views were read.
+        No request docs may be written between reading the views and calling load.
+        Parameters
+        ----------
+        popularity_rows - A dict of leaderboard (ingredients, cuisines or recipes) to the rows of its by_popularity view
+        day_of_week_rows - A dict of leaderboard to the rows of its by_day_of_week view
+        """
+        with self.lock:
+            for kind in KINDS:
+                top = TopK(self.capacity)
+                # adding the most counted first saves moving them up
+                for row in sorted(popularity_rows.get(kind, []), key=lambda row: -row['value']):
+                    top.add(row['key'], row['value'])
+                self.top[kind] = top
+                self.by_day_of_week[kind] = dict((day, 0) for day in WEEKDAYS)
+                for row in day_of_week_rows.get(kind, []):
+                    self.by_day_of_week[kind][row['key']] = row['value']
+            if self.loading is not None:
+                request_docs, written_ids = self.loading
+                for request_doc in request_docs:
+                    if request_doc['_id'] not in written_ids:
+                        self.count(request_doc)
+            self.loading = None
+            self.loaded = True
+
+    def record(self, request_doc):
+        """
+        Counts the request doc once the leaderboards are loaded, keeps it while they are loading (otherwise the views count it).
+        Record it before queuing it to be written, so it is kept if it is written while loading.
+        Parameters
+        ----------
+        request_doc - The userIngredientRequest, userCuisineRequest or userRecipeRequest doc
+        """
+        with self.lock:
+            if self.loaded:
+                self.count(request_doc)
+            elif self.loading is not None:
+                self.loading[0].append(request_doc)
+
+    def count(self, request_doc):
+        # the lock must be held
+        for kind, (doc_type, property_name) in KINDS.items():
+            if request_doc.get('type') == doc_type:
+                # the views use the weekday of the date in UTC
+                day = WEEKDAYS[(time.gmtime(request_doc['date'] / 1000.0).tm_wday + 1) % 7]
+                self.top[kind].add(request_doc[property_name])
+                self.by_day_of_week[kind][day] += 1
+                return
+
+    def get(self, kind, count):
+        """
+        Gets the count most requested names with their number of requests, and the number of requests on each day of the week.
+        Parameters
+        ----------
+        kind - The leaderboard, ingredients, cuisines or recipes
+        count - The max number of names, at most the capacity
+        """
+        with self.lock:
+            return {
+                'top': [{'name': name, 'count': value} for name, value in self.top[kind].top(count)],
+                'by_day_of_week': dict(self.by_day_of_week[kind])
+            }
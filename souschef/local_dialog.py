@@ -0,0 +1,265 @@
+import json
+import re
+import threading
+import uuid
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+ROOT = 'root'
+
+
+class LocalDialog(object):
+
+    # conditions that can be evaluated without the Watson classifier, anything else is left to Watson
+    VARIABLE_CONDITION = re.compile(r'^\$(\w+)(?:\s*(==|!=)\s*(true|false|-?\d+(?:\.\d+)?|"[^"]*"|\'[^\']*\'))?$')
+
+    def __init__(self, workspace):
+        """
+        Creates a new instance of LocalDialog, which evaluates the dialog of an exported Watson Conversation workspace
+        for the turns whose outcome doesn't depend on the Watson classifier.
+        Intents are only recognized when the input is one of their examples, entities when the input contains one of
+        their values or synonyms, so turns that need Watson to classify free text can't be evaluated.
+        Parameters
+        ----------
+        workspace - The workspace, as exported from Watson Conversation (for example workspace.json)
+        """
+        self.nodes = dict((node['dialog_node'], node) for node in workspace['dialog_nodes'])
+        # parent -> child nodes in the order they are evaluated
+        self.children = {}
+        for node in workspace['dialog_nodes']:
+            self.children.setdefault(node.get('parent') or ROOT, [])
+        for parent, children in self.children.items():
+            siblings = [node for node in workspace['dialog_nodes'] if (node.get('parent') or ROOT) == parent]
+            previous = None
+            while len(children) < len(siblings):
+                next_nodes = [node for node in siblings if node.get('previous_sibling') == previous]
+                if len(next_nodes) != 1:
+                    raise ValueError('Siblings of {} are not a chain'.format(parent))
+                children.append(next_nodes[0])
+                previous = next_nodes[0]['dialog_node']
+        # normalized example -> intents it is an example of
+        self.examples = {}
+        for intent in workspace['intents']:
+            for example in intent['examples']:
+                self.examples.setdefault(self.normalize(example['text']), set()).add(intent['intent'])
+        # (entity, value, pattern) for each value and synonym, longest first so "latin american" wins over "american"
+        self.entity_patterns = []
+        for entity in workspace['entities']:
+            for value in entity['values']:
+                for text in [value['value']] + (value.get('synonyms') or []):
+                    pattern = re.compile(r'\b{}\b'.format(re.escape(text.lower())))
+                    self.entity_patterns.append((len(text), entity['entity'], value['value'], pattern))
+        self.entity_patterns.sort(key=lambda x: -x[0])
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(text.lower().split())
+
+    def get_intents(self, text):
+        # the intent of an input that is an example of exactly one intent, None if the classifier is needed
+        intents = self.examples.get(self.normalize(text))
+        if intents is None or len(intents) != 1:
+            return None
+        return [{'intent': list(intents)[0], 'confidence': 1.0}]
+
+    def get_entities(self, text):
+        text = text.lower()
+        entities = []
+        taken = []
+        for _, entity, value, pattern in self.entity_patterns:
+            for match in pattern.finditer(text):
+                if any(match.start() < end and start < match.end() for start, end in taken):
+                    continue
+                taken.append((match.start(), match.end()))
+                entities.append({'entity': entity, 'location': [match.start(), match.end()], 'value': value})
+        entities.sort(key=lambda e: e['location'][0])
+        return entities
+
+    def message(self, text, context, start=False, guess=False):
+        """
+        Evaluates a turn of the dialog the way Watson Conversation would.
+        Returns the response in the format of the Watson Conversation message API, or None if the turn can't be evaluated
+        locally (the input has to be classified, or the context does not hold the position in the dialog).
+        Parameters
+        ----------
+        text - The input text
+        context - The context returned by the previous turn, or None to start a conversation
+        start - True to start conversations locally, otherwise a turn without a dialog position in its context is left to Watson
+        guess - True to treat intents that can't be recognized as not matching instead of leaving the turn to Watson
+        """
+        context = json.loads(json.dumps(context)) if context else {}
+        system = context.get('system')
+        if system is None or not system.get('dialog_stack'):
+            if not start:
+                return None
+            # the format of the 2016-07-11 api version
+            system = {'dialog_stack': [ROOT], 'dialog_turn_counter': 0, 'dialog_request_counter': 0}
+            context['conversation_id'] = context.get('conversation_id') or str(uuid.uuid4())
+            conversation_start = True
+        else:
+            conversation_start = False
+        stack = system['dialog_stack']
+        node_id = stack[-1]['dialog_node'] if isinstance(stack[-1], dict) else stack[-1]
+        turn = Turn(self, text, context, conversation_start, guess)
+        if not turn.respond(node_id):
+            return None
+        next_node = turn.waiting_at if turn.waiting_at is not None else ROOT
+        system = dict(system)
+        system['dialog_stack'] = [{'dialog_node': next_node} if isinstance(stack[-1], dict) else next_node]
+        system['dialog_turn_counter'] = system.get('dialog_turn_counter', 0) + 1
+        system['dialog_request_counter'] = system.get('dialog_request_counter', 0) + 1
+        context['system'] = system
+        return {
+            'input': {'text': text},
+            'context': context,
+            'entities': turn.entities,
+            'intents': turn.intents or [],
+            'output': {'text': turn.output, 'nodes_visited': turn.nodes_visited, 'log_messages': []},
+            'alternate_intents': False
+        }
+
+
+class Turn(object):
+
+    def __init__(self, dialog, text, context, conversation_start, guess):
+        self.dialog = dialog
+        self.text = text
+        self.context = context
+        self.conversation_start = conversation_start
+        self.guess = guess
+        self.intents = dialog.get_intents(text)
+        self.entities = dialog.get_entities(text)
+        self.output = []
+        self.nodes_visited = []
+        self.waiting_at = None
+
+    def respond(self, node_id):
+        # evaluates the children of the node the dialog is waiting at, then the root nodes, returns False if it can't tell
+        for parent in ([node_id, ROOT] if node_id != ROOT else [ROOT]):
+            for node in self.dialog.children.get(parent, []):
+                matches = self.evaluate(node['conditions'])
+                if matches is None:
+                    return False
+                if matches:
+                    return self.run(node)
+        return False
+
+    def run(self, node, depth=0):
+        if depth > 10:
+            return False
+        if not self.apply(node):
+            return False
+        go_to = node.get('go_to')
+        if go_to is None:
+            self.waiting_at = node['dialog_node'] if len(self.dialog.children.get(node['dialog_node'], [])) > 0 else None
+            return True
+        target = self.dialog.nodes.get(go_to['dialog_node'])
+        if target is None:
+            return False
+        if go_to.get('selector') == 'condition' and self.evaluate(target['conditions']) is not True:
+            return False
+        return self.run(target, depth + 1)
+
+    def apply(self, node):
+        # sets the node's context variables and adds its output, returns False if they use expressions
+        for name, value in (node.get('context') or {}).items():
+            if isinstance(value, string_types) and '<?' in value:
+                if value.strip() != '<?input_text?>':
+                    return False
+                value = self.text
+            self.context[name] = value
+        text = (node.get('output') or {}).get('text')
+        if isinstance(text, dict):
+            values = text.get('values') or []
+            if text.get('selection_policy', 'sequential') != 'sequential' or len(values) == 0:
+                return False
+            text = values[0]
+        if text:
+            if '<?' in text or '$' in text:
+                return False
+            self.output.append(text)
+        self.nodes_visited.append(node['dialog_node'])
+        return True
+
+    def evaluate(self, condition):
+        # True or False, or None if Watson is needed to tell
+        condition = (condition or '').strip()
+        if '||' in condition:
+            results = [self.evaluate(part) for part in condition.split('||')]
+            return True if True in results else (None if None in results else False)
+        if '&&' in condition:
+            results = [self.evaluate(part) for part in condition.split('&&')]
+            return False if False in results else (None if None in results else True)
+        if condition in ('true', 'anything_else'):
+            return True
+        if condition == 'false':
+            return False
+        if condition == 'conversation_start':
+            return self.conversation_start
+        if condition.startswith('#') and re.match(r'^#\w+$', condition):
+            if self.intents is None:
+                return False if self.guess else None
+            return self.intents[0]['intent'] == condition[1:]
+        if condition.startswith('@') and re.match(r'^@\w+(:\w+|:\([^)]*\))?$', condition):
+            name, _, value = condition[1:].partition(':')
+            value = value.strip('()')
+            return any(e['entity'] == name and (not value or e['value'] == value) for e in self.entities)
+        match = LocalDialog.VARIABLE_CONDITION.match(condition)
+        if match is not None:
+            name, operator, operand = match.groups()
+            value = self.context.get(name)
+            if operator is None:
+                return value not in (None, False, '', 0)
+            operand = json.loads(operand.replace("'", '"'))
+            return (value == operand) == (operator == '==')
+        return None
+
+
+class LocalDialogClient(object):
+
+    def __init__(self, conversation_client, dialog):
+        """
+        Creates a new instance of LocalDialogClient, which has the same message method as ConversationV1 but answers
+        the turns the LocalDialog can evaluate itself, and only calls Watson Conversation for the others.
+        The dialog must be the one deployed in the Watson workspace (export it to a file after each change).
+        Parameters
+        ----------
+        conversation_client - The Watson Conversation client called for the turns that can't be evaluated locally
+        dialog - The LocalDialog of the workspace
+        """
+        self.conversation_client = conversation_client
+        self.dialog = dialog
+        self.lock = threading.Lock()
+        self.local_turns = 0
+        self.remote_turns = 0
+
+    def message(self, workspace_id, message_input=None, context=None):
+        response = self.evaluate(message_input, context)
+        if response is not None:
+            return response
+        return self.conversation_client.message(workspace_id=workspace_id, message_input=message_input, context=context)
+
+    def evaluate(self, message_input, context):
+        # the local response, or None if the turn has to be sent to watson
+        response = self.dialog.message(message_input['text'], context)
+        with self.lock:
+            if response is not None:
+                self.local_turns += 1
+            else:
+                self.remote_turns += 1
+        return response
+
+    def stats(self):
+        """
+        Returns the number of turns evaluated locally and sent to Watson.
+        """
+        with self.lock:
+            return {'local_turns': self.local_turns, 'remote_turns': self.remote_turns}
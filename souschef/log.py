@@ -0,0 +1,313 @@
+import atexit
+import contextlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+# the correlation fields (user, channel, conversation) of the message being handled,
+# a context variable follows asyncio tasks as well as threads
+if contextvars is not None:
+    _context = contextvars.ContextVar('souschef_log_context', default={})
+else:
+    _local = threading.local()
+
+# the writer of the configured logging, None until configure is called
+_writer = None
+_config = None
+
+
+def get_context():
+    if contextvars is not None:
+        return _context.get()
+    return getattr(_local, 'context', {})
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """
+    Adds the fields to every record logged by the current thread or task inside the block.
+    Parameters
+    ----------
+    fields - The correlation fields, for example user, channel and conversation
+    """
+    previous = get_context()
+    fields = dict(previous, **fields)
+    if contextvars is not None:
+        token = _context.set(fields)
+        try:
+            yield
+        finally:
+            _context.reset(token)
+    else:
+        _local.context = fields
+        try:
+            yield
+        finally:
+            _local.context = previous
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex[:12]
+
+
+def sampled(**fields):
+    """
+    Returns the extra fields of a high volume record, only sample_rate of which are written.
+    Parameters
+    ----------
+    fields - Extra fields added to the record
+    """
+    fields['sampled'] = True
+    return fields
+
+
+class ContextFilter(logging.Filter):
+
+    def filter(self, record):
+        # runs in the thread that logged the record, so it sees that thread's context
+        for name, value in get_context().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+
+    def __init__(self, sample_rate):
+        """
+        Creates a new instance of SamplingFilter, which keeps sample_rate of the records logged with sampled extra fields.
+        Warnings and errors are always kept.
+        Parameters
+        ----------
+        sample_rate - The fraction of sampled records kept, between 0 and 1
+        """
+        logging.Filter.__init__(self)
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False) and record.levelno < logging.WARNING:
+            return random.random() < self.sample_rate
+        return True
+
+
+# the attributes every record has, anything else was added as an extra or context field
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', logging.INFO, '', 0, '', (), None)).keys()) | set(['message', 'asctime', 'sampled'])
+
+
+def get_fields(record):
+    return dict((name, value) for name, value in vars(record).items() if name not in RECORD_ATTRIBUTES)
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.{:03d}Z'.format(int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(get_fields(record))
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def __init__(self):
+        logging.Formatter.__init__(self, '%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        text = logging.Formatter.format(self, record)
+        fields = ' '.join('{}={}'.format(name, value) for name, value in sorted(get_fields(record).items()))
+        if fields:
+            # the exception, if any, stays on the lines after the message
+            lines = text.split('\n', 1)
+            lines[0] = '{} {}'.format(lines[0], fields)
+            text = '\n'.join(lines)
+        return text
+
+
+class QueueHandler(logging.Handler):
+
+    def __init__(self, records):
+        """
+        Creates a new instance of QueueHandler, which puts records on a bounded queue for a LogWriter and never blocks.
+        Records are dropped, and counted, while the queue is full.
+        Parameters
+        ----------
+        records - The queue the records are put on
+        """
+        logging.Handler.__init__(self)
+        self.records = records
+        self.dropped = 0
+
+    def emit(self, record):
+        # resolve the message and the traceback now, the arguments may change once the caller moves on
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def get_dropped(self):
+        with self.lock:
+            return self.dropped
+
+
+class LogWriter(object):
+
+    def __init__(self, records, handler, queue_handler):
+        """
+        Creates a new instance of LogWriter, a thread passing the records on the queue to the handler that writes them.
+        Parameters
+        ----------
+        records - The queue of records
+        handler - The handler writing the records
+        queue_handler - The QueueHandler putting the records on the queue, used to report dropped records
+        """
+        self.records = records
+        self.handler = handler
+        self.queue_handler = queue_handler
+        self.reported_dropped = 0
+        self.thread = threading.Thread(target=self.run, name='souschef-log-writer')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                break
+            self.write(record)
+            if self.records.empty():
+                self.report_dropped()
+                self.handler.flush()
+        self.report_dropped()
+        self.handler.flush()
+
+    def write(self, record):
+        try:
+            self.handler.handle(record)
+        except Exception:
+            self.handler.handleError(record)
+
+    def report_dropped(self):
+        dropped = self.queue_handler.get_dropped()
+        if dropped > self.reported_dropped:
+            record = logging.LogRecord('souschef.log', logging.WARNING, __file__, 0, 'Dropped log records because the queue was full',
+                                       None, None)
+            record.dropped = dropped - self.reported_dropped
+            self.reported_dropped = dropped
+            self.write(record)
+
+    def stop(self):
+        """
+        Writes the records that are still queued and stops the thread.
+        """
+        self.records.put(None)
+        self.thread.join()
+
+
+def configure(level='INFO', sample_rate=1.0, json_format=True, stream=None, max_pending=10000):
+    """
+    Sends log records through a bounded queue to a background thread that writes them, so logging never blocks the caller.
+    The souschef loggers log at level, other libraries only log warnings and errors.
+    Parameters
+    ----------
+    level - The level of the souschef loggers, for example DEBUG or INFO
+    sample_rate - The fraction of high volume records (logged with sampled extra fields) that are written
+    json_format - True to write one JSON object per line, False to write text
+    stream - The stream the records are written to, stderr if None
+    max_pending - The max number of records waiting to be written, records are dropped while this many are waiting
+    """
+    global _writer, _config
+    if _writer is not None:
+        shutdown()
+    _config = dict(level=level, sample_rate=sample_rate, json_format=json_format, stream=stream, max_pending=max_pending)
+    handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_format else TextFormatter())
+    records = queue.Queue(max_pending)
+    queue_handler = QueueHandler(records)
+    # sample before adding the context, dropped records cost less
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.WARNING)
+    set_level(level)
+    _writer = LogWriter(records, handler, queue_handler)
+    _writer.start()
+
+
+def restart():
+    """
+    Starts a new writer with the configuration of the parent process, called in a process forked after configure.
+    A forked process does not run the parent's writer thread, so its records would never be written.
+    """
+    global _writer
+    if _config is not None:
+        _writer = None
+        configure(**_config)
+
+
+def shutdown():
+    """
+    Writes the records that are still queued and stops the writer.
+    """
+    global _writer
+    writer = _writer
+    _writer = None
+    if writer is not None:
+        writer.stop()
+
+
+atexit.register(shutdown)
+
+
+def set_level(level):
+    """
+    Changes the level of the souschef loggers at runtime.
+    Parameters
+    ----------
+    level - The level name or number, for example DEBUG
+    """
+    if _config is not None:
+        _config['level'] = level
+    logging.getLogger('souschef').setLevel(level)
+
+
+def toggle_debug(signum=None, frame=None):
+    """
+    Switches the souschef loggers between DEBUG and their configured level, can be used as a signal handler.
+    """
+    logger = logging.getLogger('souschef')
+    if logger.level == logging.DEBUG:
+        configured = _config['level'] if _config is not None else 'INFO'
+        logger.setLevel(logging.INFO if configured in ('DEBUG', logging.DEBUG) else configured)
+    else:
+        logger.setLevel(logging.DEBUG)
@@ -0,0 +1,232 @@
+import bisect
+import functools
+import threading
+import time
+
+# the metrics being collected, None while metrics are disabled so instrumented code only pays for a global lookup
+_metrics = None
+
+
+class Histogram(object):
+
+    # upper bounds in seconds, from a fast cache hit to a slow upstream call
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        Creates a new instance of Histogram, which counts observed values in fixed buckets.
+        Parameters
+        ----------
+        buckets - The sorted upper bounds of the buckets, values above the last bound are counted in an extra bucket
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # not locked, the Metrics instance owning the histogram is
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimates the value below which the fraction q of the observed values fall, interpolating within the bucket.
+        Parameters
+        ----------
+        q - The fraction, for example 0.95
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    # no upper bound, the last bound is the best estimate
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class _Timer(object):
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe('souschef_duration_seconds', time.time() - self.start, stage=self.stage)
+        if exc_type is not None:
+            self.metrics.inc('souschef_errors_total', stage=self.stage)
+        return False
+
+
+class _NoopTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+class Metrics(object):
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        """
+        Creates a new instance of Metrics, a thread-safe set of histograms and counters identified by name and labels.
+        """
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def summary(self):
+        """
+        Returns the count and estimated p50, p95 and p99 in seconds of each histogram, and the value of each counter.
+        """
+        with self.lock:
+            histograms = dict((self.format_name(name, labels), {
+                'count': histogram.count,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+                'p99': histogram.quantile(0.99)
+            }) for (name, labels), histogram in self.histograms.items())
+            counters = dict((self.format_name(name, labels), value) for (name, labels), value in self.counters.items())
+        return {'histograms': histograms, 'counters': counters}
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        The estimated quantiles of each histogram are exposed as a gauge named after the histogram with a _quantile suffix.
+        """
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append('# TYPE {} histogram'.format(name))
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('{} {}'.format(self.format_name(name + '_bucket', labels + (('le', str(bound)),)), cumulative))
+                lines.append('{} {}'.format(self.format_name(name + '_sum', labels), histogram.sum))
+                lines.append('{} {}'.format(self.format_name(name + '_count', labels), histogram.count))
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                quantile_name = name + '_quantile'
+                if quantile_name not in typed:
+                    typed.add(quantile_name)
+                    lines.append('# TYPE {} gauge'.format(quantile_name))
+                for q in self.QUANTILES:
+                    value = histogram.quantile(q)
+                    if value is not None:
+                        lines.append('{} {}'.format(self.format_name(quantile_name, labels + (('quantile', str(q)),)), value))
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append('# TYPE {} counter'.format(name))
+                lines.append('{} {}'.format(self.format_name(name, labels), value))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def format_name(name, labels):
+        if len(labels) == 0:
+            return name
+        return '{}{{{}}}'.format(name, ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels))
+
+
+def enable(metrics=None):
+    """
+    Starts collecting metrics. Returns the Metrics instance collecting them.
+    Parameters
+    ----------
+    metrics - The Metrics instance to collect into, a new one is created if None
+    """
+    global _metrics
+    _metrics = metrics if metrics is not None else Metrics()
+    return _metrics
+
+
+def disable():
+    global _metrics
+    _metrics = None
+
+
+def get():
+    """
+    Returns the Metrics instance collecting metrics, or None if metrics are disabled.
+    """
+    return _metrics
+
+
+def timer(stage):
+    """
+    Returns a context manager that records the time spent in the block as the specified stage, and counts errors raised in it.
+    Parameters
+    ----------
+    stage - The name of the stage (for example watson or cloudant.find_doc)
+    """
+    metrics = _metrics
+    if metrics is None:
+        return _NOOP_TIMER
+    return _Timer(metrics, stage)
+
+
+def timed(stage):
+    """
+    Decorates a function to record the time spent in each call as the specified stage, and count the errors it raises.
+    Parameters
+    ----------
+    stage - The name of the stage (for example spoonacular.find_by_cuisine)
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            metrics = _metrics
+            if metrics is None:
+                return fn(*args, **kwargs)
+            with _Timer(metrics, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def inc(name, amount=1, **labels):
+    """
+    Adds amount to the counter with the specified name and labels.
+    Parameters
+    ----------
+    name - The name of the counter (for example souschef_cache_requests_total)
+    amount - The amount to add
+    labels - The labels of the counter
+    """
+    metrics = _metrics
+    if metrics is not None:
+        metrics.inc(name, amount, **labels)
@@ -0,0 +1,298 @@
+import json
+import re
+import threading
+
+
+def get_edit_distance(a, b, max_distance):
+    """
+    Gets the number of insertions, deletions, substitutions and transpositions of adjacent characters turning a into b,
+    or max_distance + 1 if it is more than max_distance.
+    Parameters
+    ----------
+    a - The first string
+    b - The second string
+    max_distance - The max distance of interest, the computation stops once it is exceeded
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before_previous_row = previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        previous_row, row = row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before_previous_row[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+        before_previous_row = previous_row
+    return row[-1] if row[-1] <= max_distance else max_distance + 1
+
+
+class EditDistanceIndex(object):
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        """
+        Creates a new instance of EditDistanceIndex, which finds the closest known term to a misspelled word.
+        Like SymSpell, each term is indexed under the strings obtained by deleting up to max_distance characters from it,
+        so a lookup only generates the deletes of the word and checks the terms indexed under them. Its cost depends on the
+        length of the word and max_distance but not on the number of terms.
+        Parameters
+        ----------
+        max_distance - The max edit distance between a word and the term it is corrected to
+        prefix_length - The number of leading characters indexed, longer prefixes use more memory for fewer candidates
+        """
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.lock = threading.Lock()
+        self.terms = set()
+        # delete -> terms it was obtained from
+        self.deletes = {}
+
+    def get_deletes(self, word, max_distance):
+        deletes = set([word])
+        edits = [word]
+        for _ in range(max_distance):
+            next_edits = []
+            for edit in edits:
+                for i in range(len(edit)):
+                    delete = edit[:i] + edit[i + 1:]
+                    if delete not in deletes:
+                        deletes.add(delete)
+                        next_edits.append(delete)
+            edits = next_edits
+        return deletes
+
+    def add(self, term):
+        with self.lock:
+            if term in self.terms:
+                return
+            self.terms.add(term)
+            for delete in self.get_deletes(term[:self.prefix_length], self.max_distance):
+                self.deletes.setdefault(delete, set()).add(term)
+
+    def __contains__(self, term):
+        with self.lock:
+            return term in self.terms
+
+    def __len__(self):
+        with self.lock:
+            return len(self.terms)
+
+    def lookup(self, word, max_distance=None):
+        """
+        Gets the closest term within max_distance of the word, None if there is none or several are equally close.
+        Parameters
+        ----------
+        word - The word to correct
+        max_distance - The max edit distance, at most the max_distance of the index (the index's if None)
+        """
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        candidates = set()
+        with self.lock:
+            if word in self.terms:
+                return word
+            for delete in self.get_deletes(word[:self.prefix_length], max_distance):
+                candidates.update(self.deletes.get(delete, ()))
+        best = []
+        best_distance = max_distance + 1
+        for term in candidates:
+            distance = get_edit_distance(word, term, max_distance)
+            if distance < best_distance:
+                best = [term]
+                best_distance = distance
+            elif distance == best_distance and distance <= max_distance:
+                best.append(term)
+        # don't guess between equally close terms
+        return best[0] if len(best) == 1 else None
+
+
+class TermNormalizer(object):
+
+    # plural endings and their singular replacements, the first matching ending is used
+    PLURAL_ENDINGS = [('ies', 'y'), ('oes', 'o'), ('ches', 'ch'), ('shes', 'sh'), ('sses', 'ss'), ('xes', 'x'), ('s', '')]
+    # words ending in s that are not plurals
+    SINGULAR_ENDINGS = ('ss', 'us', 'is')
+    SINGULAR_WORDS = frozenset(['molasses', 'fries', 'grits', 'swiss', 'brussels', 'series', 'species', 'chips', 'greens', 'oats'])
+    # plurals the endings get wrong
+    IRREGULAR_PLURALS = {
+        'cookies': 'cookie',
+        'brownies': 'brownie',
+        'pies': 'pie',
+        'veggies': 'veggie',
+        'smoothies': 'smoothie',
+        'chilies': 'chili',
+        'leaves': 'leaf',
+        'loaves': 'loaf',
+        'halves': 'half',
+        'calves': 'calf',
+        'knives': 'knife',
+        'shelves': 'shelf',
+        'geese': 'goose',
+        'mice': 'mouse'
+    }
+
+    def __init__(self, synonyms=None, vocabulary=None, stem=True, max_distance=2):
+        """
+        Creates a new instance of TermNormalizer, which maps the ways users write a term (an ingredient or a cuisine) to one name.
+        Terms are lowercased, mapped from their synonyms, made singular and corrected to the closest known term.
+        Parameters
+        ----------
+        synonyms - A dict of synonym to the term it stands for
+        vocabulary - The known terms, misspellings are corrected to them
+        stem - True to make plural words singular
+        max_distance - The max edit distance of a correction, words shorter than 5 characters are never corrected
+        and words shorter than 8 characters by at most 1 edit
+        """
+        self.stem = stem
+        self.synonyms = {}
+        self.vocabulary = EditDistanceIndex(max_distance)
+        for synonym, term in (synonyms or {}).items():
+            term = self.clean(term)
+            self.synonyms[self.clean(synonym)] = self.get_singular(term) if stem else term
+        for term in vocabulary or []:
+            self.add(term)
+
+    @staticmethod
+    def clean(term):
+        return ' '.join(re.sub(r'[^\w\s-]', ' ', term.lower()).split())
+
+    def get_singular(self, term):
+        words = term.split(' ')
+        word = words[-1]
+        if word in self.IRREGULAR_PLURALS:
+            words[-1] = self.IRREGULAR_PLURALS[word]
+        elif len(word) > 3 and word not in self.SINGULAR_WORDS and not word.endswith(self.SINGULAR_ENDINGS):
+            for ending, replacement in self.PLURAL_ENDINGS:
+                if word.endswith(ending):
+                    words[-1] = word[:-len(ending)] + replacement
+                    break
+        return ' '.join(words)
+
+    def get_max_distance(self, term):
+        if len(term) < 5:
+            return 0
+        return 1 if len(term) < 8 else self.vocabulary.max_distance
+
+    @staticmethod
+    def is_substitution(word, term):
+        # the same length without being a transposition, so at least one letter was replaced
+        return len(word) == len(term) and sorted(word) != sorted(term)
+
+    def is_plausible(self, word, correction):
+        """
+        Returns True if the word is likely a term of its own rather than a misspelling of the correction.
+        Short words a letter apart are often both ingredients (chive and chile, parrot and carrot), so a word shorter than
+        8 characters is only corrected for a missing, extra or swapped letter.
+        Parameters
+        ----------
+        word - The word as written by the user, cleaned and made singular
+        correction - The closest known term
+        """
+        return len(word) < 8 and self.is_substitution(word, correction)
+
+    def add(self, term):
+        """
+        Adds a term to the vocabulary misspellings are corrected to.
+        Parameters
+        ----------
+        term - The term
+        """
+        term = self.clean(term)
+        if term:
+            self.vocabulary.add(self.get_singular(term) if self.stem else term)
+
+    def normalize(self, term):
+        """
+        Gets the name of the term, empty if the term has no words.
+        Parameters
+        ----------
+        term - The term as written by the user
+        """
+        term = self.clean(term)
+        if term in self.synonyms:
+            return self.synonyms[term]
+        if self.stem:
+            term = self.get_singular(term)
+            if term in self.synonyms:
+                return self.synonyms[term]
+        max_distance = self.get_max_distance(term)
+        if max_distance > 0:
+            correction = self.vocabulary.lookup(term, max_distance)
+            if correction is not None and not self.is_plausible(term, correction):
+                return correction
+        return term
+
+
+class Normalizer(object):
+
+    def __init__(self, cuisines=None, ingredients=None):
+        """
+        Creates a new instance of Normalizer, which normalizes the cuisines and ingredients asked for before they are
+        looked up in the store, so that "Tomatoes", "tomato" and "tomatoe" share one stored list of recipes.
+        Parameters
+        ----------
+        cuisines - The TermNormalizer of cuisines (one that only lowercases if None)
+        ingredients - The TermNormalizer of ingredients (one that makes them singular if None)
+        """
+        self.cuisines = cuisines if cuisines is not None else TermNormalizer(stem=False)
+        self.ingredients = ingredients if ingredients is not None else TermNormalizer()
+
+    @classmethod
+    def from_workspace(cls, workspace):
+        """
+        Creates a Normalizer knowing the values and synonyms of the entities of a Watson Conversation workspace.
+        The cuisine entity seeds the cuisines, any other entity the ingredients.
+        Parameters
+        ----------
+        workspace - The workspace, as exported from Watson Conversation (for example workspace.json)
+        """
+        terms = {'cuisine': ([], {}), 'ingredient': ([], {})}
+        for entity in workspace['entities']:
+            vocabulary, synonyms = terms['cuisine' if entity['entity'] == 'cuisine' else 'ingredient']
+            for value in entity['values']:
+                vocabulary.append(value['value'])
+                for synonym in value.get('synonyms') or []:
+                    synonyms[synonym] = value['value']
+        return cls(TermNormalizer(terms['cuisine'][1], terms['cuisine'][0], stem=False),
+                   TermNormalizer(terms['ingredient'][1], terms['ingredient'][0]))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls.from_workspace(json.load(f))
+
+    def normalize_cuisine(self, cuisine):
+        """
+        Gets the name of the cuisine.
+        Parameters
+        ----------
+        cuisine - The cuisine specified by the user
+        """
+        return self.cuisines.normalize(cuisine)
+
+    def normalize_ingredients(self, ingredient_str):
+        """
+        Gets the comma-separated list of the names of the ingredients, without duplicates.
+        Parameters
+        ----------
+        ingredient_str - The ingredient or comma-separated list of ingredients specified by the user
+        """
+        ingredients = []
+        for ingredient in ingredient_str.split(','):
+            ingredient = self.ingredients.normalize(ingredient)
+            if ingredient and ingredient not in ingredients:
+                ingredients.append(ingredient)
+        return ', '.join(ingredients)
+
+    def add_ingredients(self, ingredient_str):
+        """
+        Adds the ingredients to the vocabulary misspelled ingredients are corrected to.
+        Parameters
+        ----------
+        ingredient_str - The ingredient or comma-separated list of ingredients, for example the name of a stored ingredient doc
+        """
+        for ingredient in ingredient_str.split(','):
+            self.ingredients.add(ingredient)
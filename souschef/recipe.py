@@ -1,13 +1,44 @@
-import requests
-import json, os
-from dotenv import load_dotenv
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+from .http_transport import HttpTransport, TokenBucket
+
+logger = logging.getLogger(__name__)
 
 class RecipeClient:
-  def __init__(self, api_key):
-    self. endpoint = \
-      'https://spoonacular-recipe-food-nutrition-v1.p.mashape.com/'
+  def __init__(self, api_key, pool_size=10, timeout=(3.05, 10), max_retries=3, rate_limit=None, transport=None,
+               endpoint='https://spoonacular-recipe-food-nutrition-v1.p.mashape.com/'):
+    """
+    Creates a new instance of RecipeClient.
+    Parameters
+    ----------
+    api_key - The Spoonacular API key
+    pool_size - The max number of connections kept open to Spoonacular and of requests made at the same time
+    timeout - The connect and read timeouts in seconds of each request to Spoonacular
+    max_retries - The number of times a request is retried when Spoonacular is rate limiting or failing
+    rate_limit - The max number of requests per second sent to Spoonacular, or None to not limit requests
+    transport - The HttpTransport used to call Spoonacular, overrides pool_size, timeout, max_retries and rate_limit
+    endpoint - The base URL of the Spoonacular API
+    """
+    self.endpoint = endpoint
     self.api_key = api_key
+    if transport is None:
+      transport = HttpTransport(
+        pool_size=pool_size,
+        timeout=timeout,
+        max_retries=max_retries,
+        rate_limiter=TokenBucket(rate_limit) if rate_limit else None)
+    self.transport = transport
+    self.executor = ThreadPoolExecutor(max_workers=pool_size)
+
+  def close(self):
+    self.executor.shutdown()
+    self.transport.close()
 
+  def stats(self):
+    return self.transport.stats()
+
+  @metrics.timed('spoonacular.find_by_ingredients')
   def find_by_ingredients(self, ingredients):
     url = self.endpoint + 'recipes/findByIngredients'
 
@@ -24,8 +55,12 @@ class RecipeClient:
       "Accept": "application/json"
     }
 
-    return requests.get(url, params=params, headers=headers).json()
+    # don't let an error response be stored as the list of recipes
+    response = self.transport.get(url, params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()
 
+  @metrics.timed('spoonacular.find_by_cuisine')
   def find_by_cuisine(self, cuisine):
     url = self.endpoint + "recipes/search"
 
@@ -36,20 +71,48 @@ class RecipeClient:
     }
     headers={ 'X-Mashape-Key': self.api_key }
 
-    return requests.get(url, 
-                        params=payload, 
-                        headers=headers).json()['results']
+    response = self.transport.get(url, 
+                                  params=payload, 
+                                  headers=headers)
+    response.raise_for_status()
+    return response.json()['results']
 
+  @metrics.timed('spoonacular.get_info_by_id')
   def get_info_by_id(self, id):
     url = self.endpoint + "recipes/" + str(id) + "/information"
     params = {'includeNutrition': False }
     headers = {'X-Mashape-Key': self.api_key}
 
-    return requests.get(url, params=params, headers=headers).json()
+    response = self.transport.get(url, params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()
 
+  @metrics.timed('spoonacular.get_steps_by_id')
   def get_steps_by_id(self, id):
     url = self.endpoint + "recipes/" + str(id) + "/analyzedInstructions"
     params = {'stepBreakdown': True}
     headers={'X-Mashape-Key': self.api_key}
 
-    return requests.get(url, params=params, headers=headers).json()
+    response = self.transport.get(url, params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+  @metrics.timed('spoonacular.get_details_by_id')
+  def get_details_by_id(self, id):
+    """
+    Gets the info and the analyzed instructions of the recipe at the same time.
+    Returns a tuple of the info and the steps, as expected by SousChef.get_recipe_instructions_response.
+    If only the steps can't be fetched they are returned as None, if the info can't be fetched the error is raised.
+    Parameters
+    ----------
+    id - The Spoonacular ID of the recipe
+    """
+    steps_future = self.executor.submit(self.get_steps_by_id, id)
+    info = self.get_info_by_id(id)
+    try:
+      steps = steps_future.result()
+    except Exception:
+      # the recipe can still be shown without its instructions
+      logger.warning('Failed to get recipe steps', exc_info=True, extra={'recipe_id': id})
+      steps = None
+    return info, steps
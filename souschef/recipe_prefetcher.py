@@ -0,0 +1,89 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .http_transport import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class RecipePrefetcher(object):
+
+    def __init__(self, recipe_store, fetch_recipe, max_workers=2, max_pending=20, budget_per_hour=100, burst=5):
+        """
+        Creates a new instance of RecipePrefetcher, which adds the recipes shown to a user to the datastore in the background,
+        so the recipe the user selects is usually already there.
+        Prefetching is best effort: recipes are skipped when max_pending recipes are waiting or the budget is used up.
+        Parameters
+        ----------
+        recipe_store - The recipe store checked for recipes that are already stored
+        fetch_recipe - A function that fetches the recipe with the specified ID from Spoonacular and adds it to the recipe store
+        max_workers - The max number of recipes fetched at the same time
+        max_pending - The max number of recipes waiting to be fetched
+        budget_per_hour - The max number of recipes fetched from Spoonacular per hour (each costs two Spoonacular requests)
+        burst - The max number of recipes fetched at once after the budget has not been used for a while,
+        by default one list of recipes so a whole list can be prefetched
+        """
+        self.recipe_store = recipe_store
+        self.fetch_recipe = fetch_recipe
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.budget = TokenBucket(budget_per_hour / 3600.0, max(1, burst))
+        self.lock = threading.Lock()
+        self.prefetched = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def prefetch(self, recipe_ids):
+        """
+        Queues the recipes to be fetched if they are not already stored. Never blocks.
+        Parameters
+        ----------
+        recipe_ids - The Spoonacular IDs of the recipes
+        """
+        for recipe_id in recipe_ids:
+            if not self.pending.acquire(False):
+                self.count('skipped')
+                continue
+            try:
+                self.executor.submit(self.prefetch_recipe, recipe_id)
+            except RuntimeError:
+                # the prefetcher has been stopped
+                self.pending.release()
+                return
+
+    def prefetch_recipe(self, recipe_id):
+        try:
+            if self.recipe_store.find_recipe(recipe_id) is not None:
+                return
+            if not self.budget.try_acquire():
+                self.count('skipped')
+                return
+            self.fetch_recipe(recipe_id)
+            self.count('prefetched')
+        except Exception:
+            logger.exception('Failed to prefetch recipe', extra={'recipe_id': recipe_id})
+            self.count('errors')
+        finally:
+            self.pending.release()
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stop(self):
+        """
+        Waits for the recipes being fetched and stops the prefetcher.
+        """
+        self.executor.shutdown()
+
+    def stats(self):
+        """
+        Returns the number of recipes prefetched, skipped because of the budget or the queue being full, and failed.
+        """
+        with self.lock:
+            return {
+                'prefetched': self.prefetched,
+                'skipped': self.skipped,
+                'errors': self.errors
+            }
@@ -0,0 +1,78 @@
+import threading
+
+from .leaderboard import TopK
+
+
+class Recommendations(object):
+
+    def __init__(self, capacity=20):
+        """
+        Creates a new instance of Recommendations, the recipes users picked most often after asking for each cuisine or
+        list of ingredients, kept in memory so they are read with a dictionary lookup instead of a view query.
+        They are loaded once from the by_ingredient_cuisine view and then updated with each recipe request recorded.
+        Parameters
+        ----------
+        capacity - The number of most picked recipes kept for each cuisine or list of ingredients
+        """
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.loaded = False
+        # ingredient or cuisine doc ID -> TopK of the unique names of the recipes picked after it
+        self.picks = {}
+        # unique recipe name -> title
+        self.titles = {}
+
+    def is_loaded(self):
+        with self.lock:
+            return self.loaded
+
+    def load(self, rows):
+        """
+        Replaces the counts with the rows of the by_ingredient_cuisine view, grouped by key.
+        Parameters
+        ----------
+        rows - The rows, keyed on [ingredient or cuisine doc ID, unique recipe name, recipe title]
+        """
+        picks = {}
+        titles = {}
+        # adding the most counted first saves moving them up
+        for row in sorted(rows, key=lambda row: -row['value']):
+            ingredient_cuisine_id, recipe_name, recipe_title = row['key']
+            picks.setdefault(ingredient_cuisine_id, TopK(self.capacity)).add(recipe_name, row['value'])
+            titles[recipe_name] = recipe_title
+        with self.lock:
+            self.picks = picks
+            self.titles = titles
+            self.loaded = True
+
+    def record(self, request_doc):
+        """
+        Counts the recipe request doc, once loaded (before that the view counts it).
+        Parameters
+        ----------
+        request_doc - The userRecipeRequest doc, other request docs are ignored
+        """
+        if request_doc.get('type') != 'userRecipeRequest' or not request_doc.get('ingredient_cuisine_id'):
+            return
+        with self.lock:
+            if self.loaded:
+                top = self.picks.get(request_doc['ingredient_cuisine_id'])
+                if top is None:
+                    top = TopK(self.capacity)
+                    self.picks[request_doc['ingredient_cuisine_id']] = top
+                top.add(request_doc['recipe_name'])
+                self.titles[request_doc['recipe_name']] = request_doc['recipe_title']
+
+    def get(self, ingredient_cuisine_id, count):
+        """
+        Gets the count recipes picked most often after the cuisine or list of ingredients, most picked first.
+        Parameters
+        ----------
+        ingredient_cuisine_id - The ID of the ingredient or cuisine doc
+        count - The max number of recipes, at most the capacity
+        """
+        with self.lock:
+            top = self.picks.get(ingredient_cuisine_id)
+            if top is None:
+                return []
+            return [{'id': name, 'title': self.titles[name], 'count': value} for name, value in top.top(count)]
@@ -0,0 +1,162 @@
+import collections
+import json
+import sqlite3
+import threading
+import time
+
+from .user_state import UserState
+
+
+class InMemorySessionStore(object):
+
+    def __init__(self, max_size=10000, idle_ttl=3600):
+        """
+        Creates a new instance of InMemorySessionStore, a thread-safe LRU map of user ID to UserState.
+        States of users who have been idle for idle_ttl seconds are evicted, as is the least recently used state when the store is full.
+        Parameters
+        ----------
+        max_size - The max number of user states to keep
+        idle_ttl - The number of seconds a user state is kept after the user's last message
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.states = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, user_id):
+        """
+        Gets the state of the user or None if the user has no state or it has been evicted.
+        Parameters
+        ----------
+        user_id - The ID of the Slack user
+        """
+        with self.lock:
+            entry = self.states.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] < time.time() - self.idle_ttl:
+                del self.states[user_id]
+                self.evictions += 1
+                return None
+            return entry[0]
+
+    def put(self, state):
+        """
+        Saves the state of the user and marks the user as active.
+        Parameters
+        ----------
+        state - The UserState
+        """
+        now = time.time()
+        with self.lock:
+            self.states.pop(state.user_id, None)
+            self.states[state.user_id] = (state, now)
+            # the oldest entries are first, drop them while they are idle for too long or the store is too big
+            while len(self.states) > 0:
+                user_id, entry = next(iter(self.states.items()))
+                if len(self.states) <= self.max_size and entry[1] >= now - self.idle_ttl:
+                    break
+                del self.states[user_id]
+                self.evictions += 1
+
+    def delete(self, user_id):
+        with self.lock:
+            self.states.pop(user_id, None)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        """
+        Returns the number of user states kept and evicted.
+        """
+        with self.lock:
+            return {
+                'size': len(self.states),
+                'evictions': self.evictions
+            }
+
+
+class SqliteSessionStore(object):
+
+    def __init__(self, path, max_size=100000, idle_ttl=86400, cleanup_interval=60):
+        """
+        Creates a new instance of SqliteSessionStore, which keeps user states in a local SQLite database,
+        so conversations survive restarts and can be continued by another bot process using the same file.
+        Parameters
+        ----------
+        path - The path of the SQLite database file
+        max_size - The max number of user states to keep
+        idle_ttl - The number of seconds a user state is kept after the user's last message
+        cleanup_interval - The min number of seconds between removing idle and excess user states
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.cleanup_interval = cleanup_interval
+        self.last_cleanup = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            # write-ahead logging lets other processes read while a state is being written
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sessions (user_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)')
+
+    def get(self, user_id):
+        """
+        Gets the state of the user or None if the user has no state or it has been evicted.
+        Parameters
+        ----------
+        user_id - The ID of the Slack user
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT state FROM sessions WHERE user_id = ? AND updated >= ?',
+                                          (user_id, time.time() - self.idle_ttl)).fetchone()
+        if row is None:
+            return None
+        return UserState.from_dict(json.loads(row[0]))
+
+    def put(self, state):
+        """
+        Saves the state of the user and marks the user as active.
+        Parameters
+        ----------
+        state - The UserState
+        """
+        now = time.time()
+        data = json.dumps(state.to_dict())
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO sessions (user_id, state, updated) VALUES (?, ?, ?)',
+                                    (state.user_id, data, now))
+            if now - self.last_cleanup >= self.cleanup_interval:
+                self.last_cleanup = now
+                self.cleanup(now)
+
+    def cleanup(self, now):
+        deleted = self.connection.execute('DELETE FROM sessions WHERE updated < ?', (now - self.idle_ttl,)).rowcount
+        # keep the most recently active users
+        deleted += self.connection.execute(
+            'DELETE FROM sessions WHERE user_id IN (SELECT user_id FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)',
+            (self.max_size,)).rowcount
+        self.evictions += max(0, deleted)
+
+    def delete(self, user_id):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def stats(self):
+        """
+        Returns the number of user states kept and evicted.
+        """
+        with self.lock:
+            size = self.connection.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+            return {
+                'size': size,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,225 @@
+import collections
+import logging
+import multiprocessing
+import signal
+import threading
+import zlib
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from . import log
+from .souschef import SousChef
+
+logger = logging.getLogger(__name__)
+
+
+def run_shard(create_souschef, shard_queue, last_taken):
+    # runs in the shard process: handles the messages put on its queue until it gets None
+    # the parent handles ctrl-c and tells the shard to stop once its queue is drained
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # the parent's log writer thread does not exist in this process
+    log.restart()
+    souschef = create_souschef()
+    souschef.open()
+    try:
+        while True:
+            item = shard_queue.get()
+            if item is None:
+                break
+            seq, key, args = item
+            # tells the parent which messages were taken, the others are sent to the next process if this one exits
+            last_taken.value = seq
+            souschef.dispatcher.dispatch(key, *args)
+    finally:
+        souschef.close()
+        # processes started by multiprocessing exit without running atexit handlers
+        log.shutdown()
+
+
+class ShardedDispatcher(object):
+
+    def __init__(self, create_souschef, num_shards=4, max_pending=256, health_check_interval=5, stop_timeout=60):
+        """
+        Creates a new instance of ShardedDispatcher, which has the same interface as MessageDispatcher but hands messages to
+        a pool of worker processes (shards). Each shard runs its own SousChef with its own MessageDispatcher.
+        Messages with the same key always go to the same shard, so messages from one user are still handled in order
+        and the user's state stays in one process.
+        Parameters
+        ----------
+        create_souschef - A picklable function called in each shard process to create its SousChef
+        num_shards - The number of worker processes
+        max_pending - The max number of messages waiting for each shard before dispatch blocks
+        health_check_interval - The number of seconds between checks that restart shards that have exited
+        stop_timeout - The number of seconds stop waits for each shard to drain its queue before terminating it
+        """
+        self.create_souschef = create_souschef
+        self.num_shards = num_shards
+        self.health_check_interval = health_check_interval
+        self.stop_timeout = stop_timeout
+        self.max_pending = max_pending
+        # a restarted shard gets a new queue, a process that exits while reading its queue can leave it unreadable
+        self.queues = [multiprocessing.Queue(max_pending) for _ in range(num_shards)]
+        # the messages sent to each shard that its process may not have taken yet, as (sequence number, key, args)
+        self.sent = [collections.deque() for _ in range(num_shards)]
+        self.next_seq = [1] * num_shards
+        # the sequence number of the last message each shard has taken, written by the shard process
+        self.last_taken = [multiprocessing.RawValue('q', 0) for _ in range(num_shards)]
+        # held while a message is put on the shard's queue, so messages are put in the order of their sequence numbers
+        self.put_locks = [threading.Lock() for _ in range(num_shards)]
+        self.processes = [None] * num_shards
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.supervisor = None
+        self.restarts = 0
+
+    @staticmethod
+    def get_shard(key, num_shards):
+        """
+        Gets the index of the shard handling messages with the specified key.
+        crc32 is used instead of hash() because it is the same in every process and across restarts.
+        Parameters
+        ----------
+        key - The key used to order messages (typically the ID of the Slack user)
+        num_shards - The number of shards
+        """
+        return (zlib.crc32(key.encode('utf-8')) & 0xffffffff) % num_shards
+
+    def start(self):
+        """
+        Starts the shard processes and the thread restarting them if they exit.
+        """
+        with self.lock:
+            for i in range(self.num_shards):
+                self.start_shard(i)
+        self.supervisor = threading.Thread(target=self.supervise, name='souschef-shard-supervisor')
+        self.supervisor.daemon = True
+        self.supervisor.start()
+
+    def start_shard(self, i):
+        # the lock must be held
+        if self.processes[i] is not None:
+            # the old queue is left to the exited process, only the messages it had taken are lost
+            self.queues[i].cancel_join_thread()
+            self.drop_taken(i)
+            if len(self.sent[i]) > 0:
+                logger.warning('Sending the messages the exited shard had not taken to the new shard.',
+                               extra={'shard': i, 'messages': len(self.sent[i])})
+            self.queues[i] = multiprocessing.Queue(max(self.max_pending, len(self.sent[i])))
+            for item in self.sent[i]:
+                self.queues[i].put(item)
+        process = multiprocessing.Process(target=run_shard, args=(self.create_souschef, self.queues[i], self.last_taken[i]),
+                                          name='souschef-shard-{}'.format(i))
+        process.daemon = True
+        process.start()
+        self.processes[i] = process
+
+    def drop_taken(self, i):
+        # forgets the messages the shard has taken, the lock must be held
+        last_taken = self.last_taken[i].value
+        sent = self.sent[i]
+        while len(sent) > 0 and sent[0][0] <= last_taken:
+            sent.popleft()
+
+    def supervise(self):
+        while not self.stopping.wait(self.health_check_interval):
+            with self.lock:
+                if self.stopping.is_set():
+                    return
+                for i, process in enumerate(self.processes):
+                    if not process.is_alive():
+                        logger.error('Shard exited, restarting...', extra={'shard': i, 'exitcode': process.exitcode})
+                        self.restarts += 1
+                        self.start_shard(i)
+
+    def dispatch(self, key, *args):
+        """
+        Queues a message to be handled by the shard for its key. Blocks while max_pending messages are waiting for the shard.
+        Parameters
+        ----------
+        key - The key used to order messages (typically the ID of the Slack user)
+        args - The arguments passed to the handler, they must be picklable
+        """
+        i = self.get_shard(key, self.num_shards)
+        with self.put_locks[i]:
+            with self.lock:
+                self.drop_taken(i)
+                item = (self.next_seq[i], key, args)
+                self.next_seq[i] += 1
+                # kept until the shard takes it, so it is sent again if the shard exits first
+                self.sent[i].append(item)
+                shard_queue = self.queues[i]
+            while True:
+                try:
+                    shard_queue.put(item, True, 1)
+                    return
+                except queue.Full:
+                    with self.lock:
+                        if self.queues[i] is not shard_queue:
+                            # the shard was restarted and the message put on the new queue
+                            return
+
+    def stop(self):
+        """
+        Waits for the shards to handle their queued messages and stops them.
+        """
+        with self.lock:
+            self.stopping.set()
+        if self.supervisor is not None:
+            self.supervisor.join()
+        for shard_queue in self.queues:
+            shard_queue.put(None)
+        for i, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                logger.warning('Shard did not stop in time, terminating it.', extra={'shard': i, 'timeout': self.stop_timeout})
+                process.terminate()
+                process.join()
+
+    def stats(self):
+        """
+        Returns the number of shards alive, the number of times a shard was restarted and the number of messages waiting for each shard.
+        """
+        with self.lock:
+            alive = len([p for p in self.processes if p is not None and p.is_alive()])
+            restarts = self.restarts
+        pending = []
+        for shard_queue in self.queues:
+            try:
+                pending.append(shard_queue.qsize())
+            except NotImplementedError:
+                # not available on macOS
+                pending.append(None)
+        return {
+            'alive': alive,
+            'restarts': restarts,
+            'pending': pending
+        }
+
+
+class ShardedSousChef(SousChef):
+
+    def __init__(self, slack_bot_id, slack_client, create_souschef, num_shards=4, max_pending_messages=256):
+        """
+        Creates a new instance of ShardedSousChef, which reads messages from Slack in this process
+        and hands them to num_shards worker processes, each running the SousChef returned by create_souschef.
+        Parameters
+        ----------
+        slack_bot_id - The ID of the Slack bot
+        slack_client - The Slack client used to read messages
+        create_souschef - A picklable function called in each shard process to create its SousChef
+        num_shards - The number of worker processes
+        max_pending_messages - The max number of messages waiting for each shard before reading from Slack blocks
+        """
+        self.init_slack_reader(slack_bot_id, slack_client)
+        self.dispatcher = ShardedDispatcher(create_souschef, num_shards, max_pending_messages)
+
+    def open(self):
+        self.dispatcher.start()
+
+    def close(self):
+        self.dispatcher.stop()
@@ -0,0 +1,57 @@
+import sys
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        """
+        Creates a new instance of SingleFlight, which makes sure only one call for a key is in flight at a time.
+        Threads that ask for a key while a call for it is in flight wait for that call and get its result.
+        """
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args):
+        """
+        Calls fn(*args) unless a call for the same key is already in flight, in which case waits for that call.
+        Returns a tuple of the result and True if this thread made the call, False if it got the result of another thread.
+        If the call raises, the exception is raised in every thread waiting for it.
+        Parameters
+        ----------
+        key - The key identifying the call (for example the unique name of a cuisine)
+        fn - The function to call
+        args - The arguments passed to fn
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = _Call()
+                self.calls[key] = call
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[1]
+            return call.value, False
+        try:
+            call.value = fn(*args)
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            # later calls for the key start a new flight
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.value, True
@@ -0,0 +1,148 @@
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+
+try:
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import SimpleHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+
+from . import metrics
+from .leaderboard import KINDS
+
+logger = logging.getLogger(__name__)
+
+
+class SlackEventsRequestHandler(SimpleHTTPRequestHandler):
+
+    EVENTS_PATH = '/slack/events'
+    METRICS_PATH = '/metrics'
+    LEADERBOARDS_PATH = '/leaderboards'
+    # requests signed longer ago than this are rejected so a captured request can't be replayed
+    MAX_REQUEST_AGE = 60 * 5
+
+    def do_GET(self):
+        if self.path.split('?')[0] == self.LEADERBOARDS_PATH:
+            self.send_leaderboards()
+            return
+        if self.path.split('?')[0] != self.METRICS_PATH:
+            SimpleHTTPRequestHandler.do_GET(self)
+            return
+        collected = metrics.get()
+        if collected is None:
+            self.send_error(404)
+            return
+        self.send_body(200, 'text/plain; version=0.0.4', collected.render())
+
+    def send_leaderboards(self):
+        # /leaderboards?count=10&kind=recipes, every leaderboard if kind is not specified
+        params = parse_qs(urlparse(self.path).query)
+        try:
+            count = int(params.get('count', ['10'])[0])
+        except ValueError:
+            self.send_error(400)
+            return
+        kinds = params.get('kind') or sorted(KINDS)
+        if count < 1 or any(kind not in KINDS for kind in kinds):
+            self.send_error(400)
+            return
+        try:
+            leaderboards = dict((kind, self.server.souschef.recipe_store.get_leaderboard(kind, count)) for kind in kinds)
+        except Exception:
+            logger.exception('Failed to get leaderboards')
+            self.send_error(503)
+            return
+        self.send_body(200, 'application/json', json.dumps(leaderboards))
+
+    def do_POST(self):
+        if self.server.signing_secret is None or self.path.split('?')[0] != self.EVENTS_PATH:
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.is_signed_by_slack(body):
+            self.send_error(401)
+            return
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self.send_error(400)
+            return
+        if payload.get('type') == 'url_verification':
+            # sent by slack when the request url is configured
+            self.send_body(200, 'text/plain', payload.get('challenge', ''))
+            return
+        # acknowledge straight away, slack retries events that are not acknowledged within 3 seconds
+        self.send_body(200, 'text/plain', '')
+        if payload.get('type') == 'event_callback':
+            self.server.handle_event(payload.get('event_id'), payload.get('event', {}))
+
+    def is_signed_by_slack(self, body):
+        timestamp = self.headers.get('X-Slack-Request-Timestamp', '')
+        signature = self.headers.get('X-Slack-Signature', '')
+        if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > self.MAX_REQUEST_AGE:
+            return False
+        base_string = 'v0:{}:'.format(timestamp).encode('utf-8') + body
+        expected = 'v0=' + hmac.new(self.server.signing_secret.encode('utf-8'), base_string, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected.encode('utf-8'), signature.encode('utf-8'))
+
+    def send_body(self, code, content_type, text):
+        data = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class SlackEventsServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, server_address, souschef, signing_secret, max_recent_events=10000):
+        """
+        Creates a new instance of SlackEventsServer, a threaded HTTP server that serves the files in the current directory
+        and receives Slack Events API requests on /slack/events.
+        If metrics are enabled they are served on /metrics in the Prometheus text format.
+        The most requested ingredients, cuisines and recipes are served on /leaderboards as JSON.
+        Message events are handed to the SousChef's dispatcher, so the SousChef must have been opened but not started,
+        as it doesn't need to read messages from the RTM API.
+        Parameters
+        ----------
+        server_address - The (host, port) to listen on
+        souschef - The SousChef handling the messages
+        signing_secret - The signing secret of the Slack app, used to check that requests come from Slack, or None to only serve files
+        max_recent_events - The number of recent event IDs remembered to ignore events that Slack sends again
+        """
+        HTTPServer.__init__(self, server_address, SlackEventsRequestHandler)
+        self.souschef = souschef
+        self.signing_secret = signing_secret
+        self.max_recent_events = max_recent_events
+        self.recent_event_ids = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def handle_event(self, event_id, event):
+        if event_id is not None:
+            with self.lock:
+                if event_id in self.recent_event_ids:
+                    # a retry of an event we have already handled
+                    return
+                self.recent_event_ids[event_id] = True
+                while len(self.recent_event_ids) > self.max_recent_events:
+                    self.recent_event_ids.popitem(last=False)
+        # only new messages from users, not edits, deletes or other subtypes
+        if event.get('type') != 'message' or 'subtype' in event or 'user' not in event:
+            return
+        try:
+            self.souschef.dispatch_slack_messages([event])
+        except Exception:
+            logger.exception('Failed to dispatch event', extra={'event_id': event_id})
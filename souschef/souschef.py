@@ -1,74 +1,143 @@
+import logging
 import pprint
-import sys
+import select
 import time
 import threading
+from . import log
+from . import metrics
+from .cloudant_recipe_store import CloudantRecipeStore
+from .dispatcher import MessageDispatcher
+from .normalizer import Normalizer
+from .recipe_prefetcher import RecipePrefetcher
+from .session_store import InMemorySessionStore
+from .single_flight import SingleFlight
 from .user_state import UserState
 
+logger = logging.getLogger(__name__)
+
 
 class SousChef(threading.Thread):
 
-    def __init__(self, slack_bot_id, slack_client, conversation_client, conversation_workspace_id, recipe_client, recipe_store):
-        threading.Thread.__init__(self)
-        self.running = True
-        self.slack_bot_id = slack_bot_id
-        self.slack_client = slack_client
+    def __init__(self, slack_bot_id, slack_client, conversation_client, conversation_workspace_id, recipe_client, recipe_store,
+                 num_workers=8, max_pending_messages=256, recipe_prefetch_budget=0, recipe_prefetch_workers=2, session_store=None,
+                 normalizer=None, recipe_prefetch_burst=5):
+        self.init_slack_reader(slack_bot_id, slack_client)
         self.conversation_client = conversation_client
         self.conversation_workspace_id = conversation_workspace_id
         self.recipe_client = recipe_client
         self.recipe_store = recipe_store
+        # the conversation state of each user, idle users are evicted
+        self.session_store = session_store if session_store is not None else InMemorySessionStore()
+        self.pp = pprint.PrettyPrinter(indent=4)
+        # messages from the same user are handled in order, messages from different users in parallel
+        self.dispatcher = MessageDispatcher(self.handle_message, num_workers, max_pending_messages)
+        # users asking for the same ingredients or cuisine at once share one Spoonacular call
+        self.single_flight = SingleFlight()
+        # cuisines and ingredients are normalized so the ways of writing them share one stored list of recipes
+        self.normalizer = normalizer if normalizer is not None else Normalizer()
+        # optionally fetch the recipes in a list before the user selects one,
+        # recipe_prefetch_budget is the max number of recipes prefetched from Spoonacular per hour
+        self.recipe_prefetcher = None
+        if recipe_prefetch_budget > 0:
+            self.recipe_prefetcher = RecipePrefetcher(recipe_store, self.get_recipe, recipe_prefetch_workers,
+                                                      budget_per_hour=recipe_prefetch_budget, burst=recipe_prefetch_burst)
+
+    def init_slack_reader(self, slack_bot_id, slack_client):
+        # the setup shared with ShardedSousChef, which reads messages from Slack but handles them in other processes
+        threading.Thread.__init__(self)
+        self.running = True
+        self.slack_bot_id = slack_bot_id
+        self.slack_client = slack_client
         #
         self.at_bot = "<@" + slack_bot_id + ">:"
-        self.delay = 0.5  # second
-        self.user_state_map = {}
-        self.pp = pprint.PrettyPrinter(indent=4)
+        self.delay = 0.5  # second, max time to wait on the rtm socket before checking if we should stop
 
-    def parse_slack_output(self, slack_rtm_output):
+    def parse_slack_messages(self, slack_rtm_output):
+        messages = []
         output_list = slack_rtm_output
         if output_list and len(output_list) > 0:
             for output in output_list:
                 if output and 'text' in output and 'user_profile' not in output and self.at_bot in output['text']:
-                    return output['text'].split(self.at_bot)[1].strip().lower(), output['user'], output['channel']
+                    messages.append((output['text'].split(self.at_bot)[1].strip().lower(), output['user'], output['channel']))
                 elif output and 'text' in output and 'user_profile' not in output:
-                    return output['text'].lower(), output['user'], output['channel']
+                    messages.append((output['text'].lower(), output['user'], output['channel']))
+        return messages
+
+    def parse_slack_output(self, slack_rtm_output):
+        messages = self.parse_slack_messages(slack_rtm_output)
+        if len(messages) > 0:
+            return messages[0]
         return None, None, None
 
+    def wait_for_slack_output(self):
+        # wake up as soon as the rtm socket has data instead of sleeping a fixed delay
+        try:
+            select.select([self.slack_client.server.websocket.sock], [], [], self.delay)
+        except (AttributeError, TypeError, ValueError, select.error):
+            time.sleep(self.delay)
+
     def post_to_slack(self, response, channel):
         self.slack_client.api_call("chat.postMessage", channel=channel, text=response, as_user=True)
 
     def handle_message(self, message, message_sender, channel):
-        try:
+        with log.context(user=message_sender, channel=channel), metrics.timer('message'):
             # get or create state for the user
-            if message_sender in self.user_state_map.keys():
-                state = self.user_state_map[message_sender]
-            else:
+            state = self.session_store.get(message_sender)
+            if state is None:
                 state = UserState(message_sender)
-                self.user_state_map[message_sender] = state
+            if not state.conversation_context or state.conversation_id is None:
+                # a new conversation, its messages are logged with the same ID
+                state.conversation_id = log.new_conversation_id()
+            with log.context(conversation=state.conversation_id):
+                self.handle_conversation_message(state, message, channel)
+
+    def handle_conversation_message(self, state, message, channel):
+        try:
             # send message to watson conversation
-            watson_response = self.conversation_client.message(
-                workspace_id=self.conversation_workspace_id,
-                message_input={'text': message},
-                context=state.conversation_context)
+            with metrics.timer('watson'):
+                watson_response = self.conversation_client.message(
+                    workspace_id=self.conversation_workspace_id,
+                    message_input={'text': message},
+                    context=state.conversation_context)
             # update conversation context
             state.conversation_context = watson_response['context']
             # route response
-            if 'is_favorites' in state.conversation_context.keys() and state.conversation_context['is_favorites']:
-                response = self.handle_favorites_message(state)
-            elif 'is_ingredients' in state.conversation_context.keys() and state.conversation_context['is_ingredients']:
-                response = self.handle_ingredients_message(state, message)
-            elif 'is_selection' in state.conversation_context.keys() and state.conversation_context['is_selection']:
-                response = self.handle_selection_message(state)
-            elif watson_response['entities'] and watson_response['entities'][0]['entity'] == 'cuisine':
-                cuisine = watson_response['entities'][0]['value']
-                response = self.handle_cuisine_message(state, cuisine)
-            else:
-                response = self.handle_start_message(state, watson_response)
+            route, cuisine = self.get_message_route(state.conversation_context, watson_response)
+            with metrics.timer('handle.{}'.format(route)):
+                if route == 'favorites':
+                    response = self.handle_favorites_message(state)
+                elif route == 'ingredients':
+                    response = self.handle_ingredients_message(state, message)
+                elif route == 'selection':
+                    response = self.handle_selection_message(state)
+                elif route == 'cuisine':
+                    response = self.handle_cuisine_message(state, cuisine)
+                else:
+                    response = self.handle_start_message(state, watson_response)
         except Exception:
-            print(sys.exc_info())
+            logger.exception('Failed to handle message')
+            metrics.inc('souschef_errors_total', stage='message')
             # clear state and set response
             self.clear_user_state(state)
             response = "Sorry, something went wrong! Say anything to me to start over..."
+        self.session_store.put(state)
         # post response to slack
-        self.post_to_slack(response, channel)
+        with metrics.timer('slack.post'):
+            self.post_to_slack(response, channel)
+
+    @staticmethod
+    def get_message_route(conversation_context, watson_response):
+        # returns the handler that should respond to the message and the cuisine, if any
+        if 'is_favorites' in conversation_context.keys() and conversation_context['is_favorites']:
+            return 'favorites', None
+        elif 'is_ingredients' in conversation_context.keys() and conversation_context['is_ingredients']:
+            return 'ingredients', None
+        elif 'is_selection' in conversation_context.keys() and conversation_context['is_selection']:
+            return 'selection', None
+        elif watson_response['entities'] and watson_response['entities'][0]['entity'] == 'cuisine':
+            return 'cuisine', watson_response['entities'][0]['value']
+        else:
+            return 'start', None
 
     def handle_start_message(self, state, watson_response):
         if state.user is None:
@@ -91,22 +160,30 @@ class SousChef(threading.Thread):
     def handle_ingredients_message(self, state, message):
         # we want to get a list of recipes based on the ingredients (message)
         # first we see if we already have the ingredients in our datastore
-        ingredients_str = message
+        ingredients_str = self.normalizer.normalize_ingredients(message) or message
         ingredient = self.recipe_store.find_ingredient(ingredients_str)
         if ingredient is not None:
-            print("Ingredient exists for {}. Returning recipes from datastore.".format(ingredients_str))
+            logger.info('Ingredients found in datastore', extra=log.sampled(ingredients=ingredients_str))
             matching_recipes = ingredient['recipes']
             # increment the count on the user-ingredient
             self.recipe_store.record_ingredient_request_for_user(ingredient, state.user)
         else:
             # we don't have the ingredients in our datastore yet, so get list of recipes from Spoonacular
-            print("Ingredient does not exist for {}. Querying Spoonacular for recipes.".format(ingredients_str))
-            matching_recipes = self.recipe_client.find_by_ingredients(ingredients_str)
-            # add ingredient to datastore
-            ingredient = self.recipe_store.add_ingredient(ingredients_str, matching_recipes, state.user)
+            # if another user is already fetching the same ingredients we wait for their result instead
+            key = ('ingredient', self.recipe_store.get_unique_ingredients_name(ingredients_str))
+            ingredient, fetched = self.single_flight.do(key, self.fetch_ingredient, ingredients_str, message, state.user)
+            if not fetched:
+                self.recipe_store.record_ingredient_request_for_user(ingredient, state.user)
+            matching_recipes = ingredient['recipes']
+        if len(matching_recipes) > 0:
+            # misspellings of these ingredients are corrected to them from now on
+            self.normalizer.add_ingredients(ingredient['name'])
+        # recipes other users picked most for the same ingredients first
+        matching_recipes = self.rank_recipes(matching_recipes, self.recipe_store.find_popular_recipes(ingredient, 20))
         # update state
         state.conversation_context['recipes'] = matching_recipes
         state.ingredient_cuisine = ingredient
+        self.prefetch_recipes(matching_recipes)
         # build and return response
         response = self.get_recipe_list_response(state)
         return response
@@ -114,50 +191,79 @@ class SousChef(threading.Thread):
     def handle_cuisine_message(self, state, message):
         # we want to get a list of recipes based on the cuisine
         # first we see if we already have the cuisine in our datastore
-        cuisine_str = message
+        cuisine_str = self.normalizer.normalize_cuisine(message) or message
         cuisine = self.recipe_store.find_cuisine(cuisine_str)
         if cuisine is not None:
-            print("Cuisine exists for {}. Returning recipes from datastore.".format(cuisine_str))
+            logger.info('Cuisine found in datastore', extra=log.sampled(cuisine=cuisine_str))
             matching_recipes = cuisine['recipes']
             # increment the count on the user-cuisine
             self.recipe_store.record_cuisine_request_for_user(cuisine, state.user)
         else:
             # we don't have the cuisine in our datastore yet, so get list of recipes from Spoonacular
-            print("Cuisine does not exist for {}. Querying Spoonacular for recipes.".format(cuisine_str))
-            matching_recipes = self.recipe_client.find_by_cuisine(cuisine_str)
-            # add cuisine to datastore
-            cuisine = self.recipe_store.add_cuisine(cuisine_str, matching_recipes, state.user)
+            # if another user is already fetching the same cuisine we wait for their result instead
+            key = ('cuisine', self.recipe_store.get_unique_cuisine_name(cuisine_str))
+            cuisine, fetched = self.single_flight.do(key, self.fetch_cuisine, cuisine_str, state.user)
+            if not fetched:
+                self.recipe_store.record_cuisine_request_for_user(cuisine, state.user)
+            matching_recipes = cuisine['recipes']
+        # recipes other users picked most for the same cuisine first
+        matching_recipes = self.rank_recipes(matching_recipes, self.recipe_store.find_popular_recipes(cuisine, 20))
         # update state
         state.conversation_context['recipes'] = matching_recipes
         state.ingredient_cuisine = cuisine
+        self.prefetch_recipes(matching_recipes)
         # build and return response
         response = self.get_recipe_list_response(state)
         return response
 
+    def fetch_ingredient(self, ingredients_str, query, user):
+        # check again, a fetch for the same ingredients may have finished since we looked
+        ingredient = self.recipe_store.find_ingredient(ingredients_str)
+        if ingredient is not None:
+            self.recipe_store.record_ingredient_request_for_user(ingredient, user)
+            return ingredient
+        # recipes stored for a list including these ingredients and others contain them too
+        matching_recipes = self.recipe_store.find_recipes_by_ingredients(ingredients_str, 5)
+        # a shorter list is not stored in place of the full list Spoonacular would return
+        if len(matching_recipes) >= 5:
+            logger.info('Recipes with the ingredients found in datastore', extra={'ingredients': ingredients_str})
+        else:
+            logger.info('Ingredients not in datastore, querying Spoonacular', extra={'ingredients': ingredients_str})
+            # the normalized ingredients only key the stored list, Spoonacular gets them as the user wrote them
+            matching_recipes = self.recipe_client.find_by_ingredients(query)
+        # add ingredient to datastore
+        return self.recipe_store.add_ingredient(ingredients_str, matching_recipes, user)
+
+    def fetch_cuisine(self, cuisine_str, user):
+        # check again, a fetch for the same cuisine may have finished since we looked
+        cuisine = self.recipe_store.find_cuisine(cuisine_str)
+        if cuisine is not None:
+            self.recipe_store.record_cuisine_request_for_user(cuisine, user)
+            return cuisine
+        logger.info('Cuisine not in datastore, querying Spoonacular', extra={'cuisine': cuisine_str})
+        matching_recipes = self.recipe_client.find_by_cuisine(cuisine_str)
+        # add cuisine to datastore
+        return self.recipe_store.add_cuisine(cuisine_str, matching_recipes, user)
+
     def handle_selection_message(self, state):
         selection = -1
         if state.conversation_context['selection'].isdigit():
             selection = int(state.conversation_context['selection'])
-        if 1 <= selection <= 5:
+        # fewer than 5 recipes may have been listed, for example a new user's favorites
+        if 1 <= selection <= len(state.conversation_context.get('recipes') or []):
             # we want to get a the recipe based on the selection
             # first we see if we already have the recipe in our datastore
             recipes = state.conversation_context['recipes']
             recipe_id = recipes[selection-1]['id']
             recipe = self.recipe_store.find_recipe(recipe_id)
             if recipe is not None:
-                print("Recipe exists for {}. Returning recipe steps from datastore.".format(recipe_id))
-                recipe_detail = recipe['instructions']
-                recipe_title = recipe['title']
-                # increment the count on the ingredient/cuisine-recipe and the user-recipe
-                self.recipe_store.record_recipe_request_for_user(recipe, state.ingredient_cuisine, state.user)
+                logger.info('Recipe found in datastore', extra=log.sampled(recipe_id=recipe_id))
             else:
-                print("Recipe does not exist for {}. Querying Spoonacular for details.".format(recipe_id))
-                recipe_info = self.recipe_client.get_info_by_id(recipe_id)
-                recipe_steps = self.recipe_client.get_steps_by_id(recipe_id)
-                recipe_detail = self.get_recipe_instructions_response(recipe_info, recipe_steps)
-                recipe_title = recipe_info['title']
-                # add recipe to datastore
-                self.recipe_store.add_recipe(recipe_id, recipe_title, recipe_detail, state.ingredient_cuisine, state.user)
+                # the recipe may be being prefetched, in which case we wait for it instead of fetching it again
+                recipe = self.get_recipe(recipe_id)
+            recipe_detail = recipe['instructions']
+            # increment the count on the ingredient/cuisine-recipe and the user-recipe
+            self.recipe_store.record_recipe_request_for_user(recipe, state.ingredient_cuisine, state.user)
             # clear state and return response
             self.clear_user_state(state)
             return recipe_detail
@@ -166,17 +272,72 @@ class SousChef(threading.Thread):
             self.clear_user_state(state)
             return "Invalid selection! Say anything to start over..."
 
+    def get_recipe(self, recipe_id):
+        key = ('recipe', self.recipe_store.get_unique_recipe_name(recipe_id))
+        recipe, fetched = self.single_flight.do(key, self.fetch_recipe, recipe_id)
+        return recipe
+
+    def fetch_recipe(self, recipe_id):
+        # check again, a fetch for the same recipe may have finished since we looked
+        recipe = self.recipe_store.find_recipe(recipe_id)
+        if recipe is not None:
+            return recipe
+        logger.info('Recipe not in datastore, querying Spoonacular', extra={'recipe_id': recipe_id})
+        # info and steps are independent so fetch them at the same time
+        recipe_info, recipe_steps = self.recipe_client.get_details_by_id(recipe_id)
+        recipe_detail = self.get_recipe_instructions_response(recipe_info, recipe_steps)
+        if recipe_steps is None:
+            # reply without the steps but don't store the recipe, so it is fetched again the next time it is selected
+            return self.get_unsaved_recipe_doc(recipe_id, recipe_info['title'], recipe_detail)
+        # add recipe to datastore
+        return self.recipe_store.add_recipe_doc(recipe_id, recipe_info['title'], recipe_detail)
+
+    def prefetch_recipes(self, recipes):
+        if self.recipe_prefetcher is not None:
+            self.recipe_prefetcher.prefetch([recipe['id'] for recipe in recipes])
+
+    @staticmethod
+    def get_unsaved_recipe_doc(recipe_id, recipe_title, recipe_detail):
+        name = CloudantRecipeStore.get_unique_recipe_name(recipe_id)
+        return {
+            '_id': CloudantRecipeStore.get_doc_id('recipe', name),
+            'type': 'recipe',
+            'name': name,
+            'title': recipe_title.strip(),
+            'instructions': recipe_detail
+        }
+
     @staticmethod
     def clear_user_state(state):
         state.ingredient_cuisine = None
         state.conversation_context = None
         state.conversation_started = False
 
+    @staticmethod
+    def rank_recipes(recipes, popular_recipes):
+        """
+        Returns the recipes with the most picked first, each picked recipe with its number of picks, the others in their order.
+        Parameters
+        ----------
+        recipes - The recipes found for an ingredient or cuisine
+        popular_recipes - The recipes users picked most often for the ingredient or cuisine, with their count
+        """
+        picks = dict((recipe['id'], recipe['count']) for recipe in popular_recipes)
+        ranked = []
+        for recipe in recipes:
+            count = picks.get(CloudantRecipeStore.get_unique_recipe_name(recipe['id']), 0)
+            ranked.append(dict(recipe, picks=count) if count > 0 else recipe)
+        # sorted is stable, so recipes nobody picked keep their order
+        return sorted(ranked, key=lambda recipe: -recipe.get('picks', 0))
+
     @staticmethod
     def get_recipe_list_response(state):
         response = "Lets see here...\nI've found these recipes:\n"
         for i, recipe in enumerate(state.conversation_context['recipes']):
-            response += str(i + 1) + ". " + recipe['title'] + "\n"
+            response += str(i + 1) + ". " + recipe['title']
+            if recipe.get('picks'):
+                response += " _(popular right now, picked {} {})_".format(recipe['picks'], 'time' if recipe['picks'] == 1 else 'times')
+            response += "\n"
         response += "\nPlease enter the corresponding number of your choice."
         return response
 
@@ -208,19 +369,57 @@ class SousChef(threading.Thread):
         return response
 
     def run(self):
+        self.open()
+        self.read_slack_messages()
+        logger.info('sous-chef shutting down...')
+        self.close()
+
+    def open(self):
+        """
+        Initializes the recipe store and starts the workers handling messages.
+        """
         self.recipe_store.init()
+        # misspellings are corrected to the ingredients stored by any process, so every process normalizes them the same way
+        for ingredient in self.recipe_store.get_known_ingredients():
+            self.normalizer.add_ingredients(ingredient)
+        self.dispatcher.start()
+
+    def read_slack_messages(self):
+        # reads messages from the slack rtm api and dispatches them until stopped
         while self.running:
             if self.slack_client.rtm_connect():
-                print("sous-chef is connected and running!")
+                logger.info('sous-chef is connected and running!')
                 while self.running:
                     slack_output = self.slack_client.rtm_read()
-                    message, message_sender, channel = self.parse_slack_output(slack_output)
-                    if message and channel and message_sender != self.slack_bot_id:
-                        self.handle_message(message, message_sender, channel)
-                    time.sleep(self.delay)
+                    self.dispatch_slack_messages(slack_output)
+                    if not slack_output:
+                        self.wait_for_slack_output()
             else:
-                print("Connection failed. Invalid Slack token or bot ID?")
-        print("sous-chef shutting down...")
+                logger.error('Connection failed. Invalid Slack token or bot ID?')
+
+    def dispatch_slack_messages(self, slack_output):
+        """
+        Queues the messages in the list of Slack events to be handled, ignoring the messages sent by the bot.
+        Parameters
+        ----------
+        slack_output - A list of Slack message events, as returned by the RTM API or sent by the Events API
+        """
+        for message, message_sender, channel in self.parse_slack_messages(slack_output):
+            if message and channel and message_sender != self.slack_bot_id:
+                self.dispatcher.dispatch(message_sender, message, message_sender, channel)
+
+    def close(self):
+        """
+        Waits for dispatched messages to be handled and closes the clients and stores.
+        """
+        self.dispatcher.stop()
+        if self.recipe_prefetcher is not None:
+            self.recipe_prefetcher.stop()
+        self.recipe_client.close()
+        self.recipe_store.close()
+        self.session_store.close()
 
     def stop(self):
+        # run() then waits for queued messages to be handled and closes the recipe store,
+        # which flushes the request docs that are still waiting to be written
         self.running = False
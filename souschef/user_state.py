@@ -1,7 +1,23 @@
 class UserState(object):
+    # user states are kept for every active user, slots keep each one small
+    __slots__ = ('user_id', 'conversation_context', 'user', 'ingredient_cuisine', 'conversation_started', 'conversation_id')
+
     def __init__(self, user_id):
         self.user_id = user_id
         self.conversation_context = {}
         self.user = None
         self.ingredient_cuisine = None
+        self.conversation_started = False
+        # correlates the log records of the messages in the current conversation
+        self.conversation_id = None
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
 
+    @classmethod
+    def from_dict(cls, values):
+        state = cls(values['user_id'])
+        for name in cls.__slots__:
+            if name in values:
+                setattr(state, name, values[name])
+        return state
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.async_bulk_writer import AsyncBulkDocWriter
+
+
+class FakeBulkDocs(object):
+
+    def __init__(self, results=None):
+        # the results of each call, then no errors
+        self.results = list(results or [])
+        self.batches = []
+
+    async def __call__(self, docs):
+        self.batches.append([doc['_id'] for doc in docs])
+        if len(self.results) > 0:
+            results = self.results.pop(0)
+            if isinstance(results, Exception):
+                raise results
+            return results
+        return [{'id': doc['_id'], 'rev': '1-a'} for doc in docs]
+
+
+class AsyncBulkDocWriterTest(unittest.TestCase):
+
+    def run_writer(self, bulk_docs, test, **kwargs):
+        async def main():
+            writer = AsyncBulkDocWriter(bulk_docs, **kwargs)
+            writer.start()
+            await test(writer)
+        asyncio.run(main())
+
+    def test_writes_full_batches_and_rest_on_stop(self):
+        bulk_docs = FakeBulkDocs()
+
+        async def test(writer):
+            for i in range(5):
+                await writer.add({'_id': str(i)})
+            await writer.stop()
+            self.assertFalse(writer.is_running())
+        self.run_writer(bulk_docs, test, batch_size=2, flush_interval=60)
+        self.assertEqual(bulk_docs.batches, [['0', '1'], ['2', '3'], ['4']])
+
+    def test_flush_waits_for_queued_docs(self):
+        bulk_docs = FakeBulkDocs()
+
+        async def test(writer):
+            await writer.add({'_id': 'a'})
+            await writer.flush()
+            self.assertEqual(bulk_docs.batches, [['a']])
+            await writer.stop()
+        self.run_writer(bulk_docs, test, flush_interval=60)
+
+    def test_retries_failed_docs_and_ignores_conflicts(self):
+        bulk_docs = FakeBulkDocs([
+            IOError('connection reset'),
+            [{'id': 'a', 'error': 'conflict'}, {'id': 'b', 'error': 'unknown_error'}]
+        ])
+
+        async def test(writer):
+            await writer.add({'_id': 'a'})
+            await writer.add({'_id': 'b'})
+            await writer.stop()
+        self.run_writer(bulk_docs, test, flush_interval=60)
+        self.assertEqual(bulk_docs.batches, [['a', 'b'], ['a', 'b'], ['b']])
+
+    def test_drops_docs_after_max_retries(self):
+        bulk_docs = FakeBulkDocs([IOError('down'), IOError('down'), [{'id': 'c', 'rev': '1-a'}]])
+
+        async def test(writer):
+            await writer.add({'_id': 'a'})
+            await writer.flush()
+            await writer.add({'_id': 'c'})
+            await writer.stop()
+        self.run_writer(bulk_docs, test, flush_interval=60, max_retries=1)
+        self.assertEqual(bulk_docs.batches, [['a'], ['a'], ['c']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.async_souschef import AsyncSousChef
+from souschef.session_store import InMemorySessionStore
+
+
+class ThreadRecordingSessionStore(InMemorySessionStore):
+
+    def __init__(self):
+        InMemorySessionStore.__init__(self)
+        self.threads = []
+
+    def get(self, user_id):
+        self.threads.append(threading.current_thread())
+        return InMemorySessionStore.get(self, user_id)
+
+    def put(self, state):
+        self.threads.append(threading.current_thread())
+        InMemorySessionStore.put(self, state)
+
+
+class FailingConversationClient(object):
+
+    async def message(self, workspace_id, message_input, context):
+        raise IOError('conversation unavailable')
+
+
+class RecordingSlackClient(object):
+
+    def __init__(self):
+        self.posts = []
+
+    async def api_call(self, method, **kwargs):
+        self.posts.append(kwargs['text'])
+
+
+class SessionStoreTest(unittest.TestCase):
+
+    def test_session_store_calls_run_off_the_event_loop(self):
+        session_store = ThreadRecordingSessionStore()
+        slack_client = RecordingSlackClient()
+
+        async def handle():
+            souschef = AsyncSousChef('BOT', slack_client, FailingConversationClient(), 'workspace', None, None,
+                                     session_store=session_store)
+            await souschef.handle_message('hi', 'U1', 'C1')
+            souschef.session_executor.shutdown()
+
+        asyncio.run(handle())
+        self.assertEqual(len(session_store.threads), 2)
+        self.assertNotIn(threading.main_thread(), session_store.threads)
+        self.assertIsNotNone(session_store.get('U1'))
+        self.assertEqual(len(slack_client.posts), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
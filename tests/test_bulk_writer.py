@@ -0,0 +1,131 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.bulk_writer import BulkDocWriter
+
+
+class FakeDatabase(object):
+
+    def __init__(self, results=None):
+        # the results of each call, then no errors
+        self.results = list(results or [])
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def bulk_docs(self, docs):
+        with self.lock:
+            self.batches.append([doc['_id'] for doc in docs])
+            if len(self.results) > 0:
+                results = self.results.pop(0)
+                if isinstance(results, Exception):
+                    raise results
+                return results
+        return [{'id': doc['_id'], 'rev': '1-a'} for doc in docs]
+
+
+class BulkDocWriterTest(unittest.TestCase):
+
+    def create_writer(self, db, **kwargs):
+        writer = BulkDocWriter(lambda: db, **kwargs)
+        writer.start()
+        return writer
+
+    def test_writes_full_batches_and_rest_on_stop(self):
+        db = FakeDatabase()
+        writer = self.create_writer(db, batch_size=2, flush_interval=60)
+        for i in range(5):
+            writer.add({'_id': str(i)})
+        writer.stop()
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(db.batches, [['0', '1'], ['2', '3'], ['4']])
+
+    def test_writes_batch_after_flush_interval(self):
+        db = FakeDatabase()
+        writer = self.create_writer(db, flush_interval=0.05)
+        writer.add({'_id': 'a'})
+        deadline = time.time() + 5
+        while len(db.batches) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(db.batches, [['a']])
+        writer.stop()
+
+    def test_flush_waits_for_queued_docs(self):
+        db = FakeDatabase()
+        writer = self.create_writer(db, flush_interval=60)
+        writer.add({'_id': 'a'})
+        writer.add({'_id': 'b'})
+        writer.flush()
+        self.assertEqual(db.batches, [['a', 'b']])
+        writer.stop()
+
+    def test_flush_returns_while_other_threads_add_docs(self):
+        db = FakeDatabase()
+        writer = self.create_writer(db, batch_size=10, flush_interval=60)
+        stop = threading.Event()
+
+        def add():
+            i = 0
+            while not stop.is_set():
+                writer.add({'_id': str(i)})
+                i += 1
+        adder = threading.Thread(target=add)
+        adder.start()
+        try:
+            flusher = threading.Thread(target=writer.flush)
+            flusher.start()
+            flusher.join(5)
+            self.assertFalse(flusher.is_alive())
+        finally:
+            stop.set()
+            adder.join()
+            writer.stop()
+
+    def test_flush_without_writer_thread_returns(self):
+        writer = BulkDocWriter(lambda: FakeDatabase())
+        writer.add({'_id': 'a'})
+        writer.flush()
+        writer.stop()
+
+    def test_retries_failed_docs_and_ignores_conflicts(self):
+        db = FakeDatabase([
+            IOError('connection reset'),
+            [{'id': 'a', 'error': 'conflict'}, {'id': 'b', 'error': 'unknown_error'}]
+        ])
+        written = []
+        writer = self.create_writer(db, flush_interval=60, on_written=lambda docs: written.extend(doc['_id'] for doc in docs))
+        writer.add({'_id': 'a'})
+        writer.add({'_id': 'b'})
+        writer.stop()
+        self.assertEqual(db.batches, [['a', 'b'], ['a', 'b'], ['b']])
+        # a conflict means an earlier attempt wrote the doc
+        self.assertEqual(written, ['a', 'b'])
+
+    def test_drops_docs_after_max_retries(self):
+        db = FakeDatabase([IOError('down'), IOError('down')])
+        written = []
+        writer = self.create_writer(db, flush_interval=60, max_retries=1, on_written=written.extend)
+        writer.add({'_id': 'a'})
+        writer.flush()
+        writer.add({'_id': 'c'})
+        writer.stop()
+        self.assertEqual(db.batches, [['a'], ['a'], ['c']])
+        self.assertEqual([doc['_id'] for doc in written], ['c'])
+
+    def test_holding_write_lock_pauses_writes(self):
+        db = FakeDatabase()
+        writer = self.create_writer(db, flush_interval=0)
+        with writer.write_lock:
+            writer.add({'_id': 'a'})
+            time.sleep(0.05)
+            self.assertEqual(db.batches, [])
+        writer.flush()
+        self.assertEqual(db.batches, [['a']])
+        writer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
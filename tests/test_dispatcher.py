@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.dispatcher import MessageDispatcher
+
+
+class Recorder(object):
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.handled = []
+        self.active = {}
+        self.overlapping = []
+
+    def handle(self, key, value):
+        with self.lock:
+            if self.active.get(key):
+                self.overlapping.append(key)
+            self.active[key] = True
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[key] = False
+            self.handled.append((key, value))
+
+
+class MessageDispatcherTest(unittest.TestCase):
+
+    def test_messages_with_same_key_are_handled_in_order_one_at_a_time(self):
+        recorder = Recorder(0.001)
+        dispatcher = MessageDispatcher(recorder.handle, num_workers=4)
+        dispatcher.start()
+        for i in range(20):
+            for key in ['a', 'b', 'c']:
+                dispatcher.dispatch(key, key, i)
+        dispatcher.stop()
+        self.assertEqual(len(recorder.handled), 60)
+        self.assertEqual(recorder.overlapping, [])
+        for key in ['a', 'b', 'c']:
+            self.assertEqual([value for k, value in recorder.handled if k == key], list(range(20)))
+
+    def test_messages_with_different_keys_are_handled_in_parallel(self):
+        started = threading.Barrier(2, timeout=5)
+        dispatcher = MessageDispatcher(lambda key: started.wait(), num_workers=2)
+        dispatcher.start()
+        dispatcher.dispatch('a', 'a')
+        dispatcher.dispatch('b', 'b')
+        dispatcher.stop()
+        self.assertFalse(started.broken)
+
+    def test_stop_waits_for_dispatched_messages(self):
+        recorder = Recorder(0.01)
+        dispatcher = MessageDispatcher(recorder.handle, num_workers=2)
+        dispatcher.start()
+        for i in range(10):
+            dispatcher.dispatch('a', 'a', i)
+        dispatcher.stop()
+        self.assertEqual(len(recorder.handled), 10)
+        self.assertEqual(dispatcher.key_messages, {})
+        self.assertEqual(dispatcher.workers, [])
+
+    def test_handler_errors_do_not_stop_the_key(self):
+        handled = []
+
+        def handle(value):
+            if value == 1:
+                raise ValueError('bad message')
+            handled.append(value)
+        dispatcher = MessageDispatcher(handle, num_workers=1)
+        dispatcher.start()
+        for i in range(3):
+            dispatcher.dispatch('a', i)
+        dispatcher.stop()
+        self.assertEqual(handled, [0, 2])
+
+    def test_dispatch_blocks_while_max_pending_messages_wait(self):
+        release = threading.Event()
+        dispatcher = MessageDispatcher(lambda value: release.wait(5), num_workers=1, max_pending=2)
+        dispatcher.start()
+        dispatcher.dispatch('a', 0)
+        dispatcher.dispatch('a', 1)
+        third = threading.Thread(target=dispatcher.dispatch, args=('b', 2))
+        third.start()
+        third.join(0.1)
+        self.assertTrue(third.is_alive())
+        release.set()
+        third.join(5)
+        self.assertFalse(third.is_alive())
+        dispatcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.favorites import FavoriteRecipes
+
+
+def request_doc(request_id, user_id, recipe_name, recipe_title):
+    return {
+        'type': 'userRecipeRequest',
+        '_id': request_id,
+        'user_id': user_id,
+        'recipe_name': recipe_name,
+        'recipe_title': recipe_title
+    }
+
+
+class FavoriteRecipesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.favorites = FavoriteRecipes(capacity=3)
+
+    def test_not_loaded_until_load(self):
+        self.assertIsNone(self.favorites.get('u', 5))
+        self.favorites.record(request_doc('a', 'u', '1', 'Soup'))
+        self.assertIsNone(self.favorites.get('u', 5))
+
+    def test_load_from_grouped_rows(self):
+        self.favorites.start_load('u')
+        self.assertEqual(self.favorites.get_loading_recipes('u'), [])
+        self.favorites.load('u', [
+            {'key': ['u', '1', 'Soup'], 'value': 2},
+            {'key': ['u', '2', 'Salad'], 'value': 5}
+        ], [])
+        self.assertEqual(self.favorites.get('u', 5), [
+            {'id': '2', 'title': 'Salad', 'count': 5},
+            {'id': '1', 'title': 'Soup', 'count': 2}
+        ])
+        self.assertEqual(self.favorites.loading, {})
+
+    def test_counts_requests_recorded_after_load(self):
+        self.favorites.start_load('u')
+        self.favorites.load('u', [{'key': ['u', '1', 'Soup'], 'value': 1}], [])
+        self.favorites.record(request_doc('a', 'u', '1', 'Soup'))
+        self.favorites.record(request_doc('b', 'u', '2', 'Salad'))
+        self.assertEqual(self.favorites.get('u', 5), [
+            {'id': '1', 'title': 'Soup', 'count': 2},
+            {'id': '2', 'title': 'Salad', 'count': 1}
+        ])
+
+    def test_requests_recorded_during_load_are_counted_once(self):
+        self.favorites.start_load('u')
+        self.favorites.record(request_doc('a', 'u', '1', 'Soup'))
+        self.favorites.record(request_doc('b', 'u', '1', 'Soup'))
+        # the counts were read before either request was written
+        rows = [{'key': ['u', '1', 'Soup'], 'value': 3}]
+        self.assertEqual(self.favorites.get_loading_recipes('u'), ['1'])
+        # a was written before the requests of the recipe were read, b was not
+        request_rows = [{'id': request_id, 'key': ['u', '1', 'Soup'], 'value': 1} for request_id in ['x', 'y', 'z', 'a']]
+        # c is recorded after the recipes were recounted, for a recipe whose count came from the grouped rows
+        self.favorites.record(request_doc('c', 'u', '2', 'Salad'))
+        self.favorites.load('u', rows, request_rows)
+        self.assertEqual(self.favorites.get('u', 5), [
+            {'id': '1', 'title': 'Soup', 'count': 5},
+            {'id': '2', 'title': 'Salad', 'count': 1}
+        ])
+
+    def test_cancel_load_drops_buffered_requests(self):
+        self.favorites.start_load('u')
+        self.favorites.record(request_doc('a', 'u', '1', 'Soup'))
+        self.favorites.cancel_load('u')
+        self.assertEqual(self.favorites.loading, {})
+        self.assertIsNone(self.favorites.get('u', 5))
+
+    def test_concurrent_loads_share_buffered_requests(self):
+        self.favorites.start_load('u')
+        self.favorites.start_load('u')
+        self.favorites.record(request_doc('a', 'u', '1', 'Soup'))
+        self.favorites.cancel_load('u')
+        self.assertEqual(self.favorites.get_loading_recipes('u'), ['1'])
+        self.favorites.load('u', [], [])
+        self.assertEqual(self.favorites.get('u', 5), [{'id': '1', 'title': 'Soup', 'count': 1}])
+
+    def test_only_titles_of_top_are_kept(self):
+        self.favorites.start_load('u')
+        self.favorites.load('u', [{'key': ['u', str(i), 'Recipe {}'.format(i)], 'value': 10 - i} for i in range(6)], [])
+        top, titles, _ = self.favorites.users['u']
+        self.assertEqual(sorted(titles), ['0', '1', '2'])
+
+    def test_evicts_least_recently_used_user(self):
+        favorites = FavoriteRecipes(max_users=2)
+        for user_id in ['u', 'v', 'w']:
+            favorites.start_load(user_id)
+            favorites.load(user_id, [], [])
+        self.assertIsNone(favorites.get('u', 5))
+        self.assertEqual(favorites.get('w', 5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
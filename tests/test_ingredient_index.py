@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.ingredient_index import IngredientIndex
+
+
+def recipe(recipe_id, used_ingredient_count):
+    return {'id': recipe_id, 'title': 'Recipe {}'.format(recipe_id), 'usedIngredientCount': used_ingredient_count}
+
+
+class IngredientIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = IngredientIndex()
+        self.index.load([
+            {'name': 'basil,rice,tomato', 'recipes': [recipe(1, 3), recipe(2, 2), recipe(3, 3)]},
+            {'name': 'basil,tomato', 'recipes': [recipe(3, 2), recipe(4, 2)]},
+            {'name': 'rice', 'recipes': [recipe(5, 1)]},
+            {'name': 'basil,garlic', 'recipes': [{'id': 6, 'title': 'Recipe 6'}]}
+        ])
+
+    def test_get_ingredients(self):
+        self.assertEqual(IngredientIndex.get_ingredients(' Tomato, basil,, '), frozenset(['tomato', 'basil']))
+        self.assertEqual(IngredientIndex.get_ingredients(''), frozenset())
+
+    def test_finds_supersets_fewest_extra_ingredients_first(self):
+        self.assertTrue(self.index.is_loaded())
+        self.assertEqual(self.index.find('tomato,basil'), [('basil,tomato', 1.0), ('basil,rice,tomato', 1.0)])
+        self.assertEqual(self.index.find('rice'), [('rice', 1.0), ('basil,rice,tomato', 1.0)])
+        self.assertEqual(self.index.find('tomato,garlic'), [])
+        self.assertEqual(self.index.find(''), [])
+
+    def test_finds_partial_matches_by_coverage(self):
+        self.assertEqual(self.index.find('tomato,garlic', min_coverage=0.5),
+                         [('basil,garlic', 0.5), ('basil,tomato', 0.5), ('basil,rice,tomato', 0.5)])
+
+    def test_find_recipes_uses_all_ingredients_of_doc(self):
+        # recipe 2 misses one of its doc's ingredients, recipe 3 is in both docs
+        recipes = self.index.find_recipes('basil,tomato', 5)
+        self.assertEqual([r['id'] for r in recipes], [3, 4, 1])
+        self.assertEqual([r['id'] for r in self.index.find_recipes('basil,tomato', 2)], [3, 4])
+
+    def test_recipes_without_used_ingredient_count_are_left_out(self):
+        self.assertEqual(self.index.find_recipes('garlic', 5), [])
+
+    def test_known_ingredients_have_recipes(self):
+        self.index.add({'name': 'chive,leek', 'recipes': []})
+        self.assertEqual(self.index.get_known_ingredients(), ['basil', 'garlic', 'rice', 'tomato'])
+
+    def test_add_replaces_recipes_of_same_doc(self):
+        self.index.add({'name': 'rice', 'recipes': [recipe(7, 1)]})
+        self.assertEqual([r['id'] for r in self.index.find_recipes('rice', 5)], [7, 1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
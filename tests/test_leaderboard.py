@@ -0,0 +1,96 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.leaderboard import Leaderboards, TopK
+
+
+class TopKTest(unittest.TestCase):
+
+    def test_keeps_most_counted_sorted(self):
+        top = TopK(2)
+        for name in ['a', 'b', 'c', 'c', 'b', 'c']:
+            top.add(name)
+        self.assertEqual(top.top(2), [('c', 3), ('b', 2)])
+        self.assertEqual(top.top(1), [('c', 3)])
+
+    def test_name_enters_top_when_counted_past_last(self):
+        top = TopK(2)
+        top.add('a', 5)
+        top.add('b', 3)
+        top.add('c', 3)
+        self.assertEqual(top.top(2), [('a', 5), ('b', 3)])
+        top.add('c')
+        self.assertEqual(top.top(2), [('a', 5), ('c', 4)])
+        self.assertEqual(sorted(top.positions), ['a', 'c'])
+
+    def test_counts_outside_top_are_capped(self):
+        top = TopK(2, margin=4)
+        top.add('a', 100)
+        top.add('b', 50)
+        for i in range(1000):
+            top.add('name{}'.format(i))
+            self.assertLessEqual(len(top.counts), 6)
+        self.assertEqual(top.top(2), [('a', 100), ('b', 50)])
+
+    def test_trim_keeps_most_counted_outside_top(self):
+        top = TopK(1, margin=2)
+        for name, amount in [('a', 10), ('b', 5), ('c', 4), ('d', 1)]:
+            top.add(name, amount)
+        # trimmed to the top and half the margin
+        self.assertEqual(sorted(top.counts), ['a', 'b'])
+        top.add('c')
+        self.assertEqual(top.counts['c'], 1)
+
+
+def request_doc(request_id, ingredient_name):
+    # 2017-01-01 was a Sunday
+    return {'type': 'userIngredientRequest', '_id': request_id, 'ingredient_name': ingredient_name, 'date': 1483272000000}
+
+
+class LeaderboardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.leaderboards = Leaderboards(capacity=2)
+
+    def test_requests_are_not_counted_before_loading(self):
+        self.leaderboards.record(request_doc('a', 'rice'))
+        self.leaderboards.start_load()
+        self.leaderboards.load({'ingredients': [{'key': 'rice', 'value': 3}]}, {})
+        self.assertEqual(self.leaderboards.get('ingredients', 5)['top'], [{'name': 'rice', 'count': 3}])
+
+    def test_counts_requests_recorded_after_load(self):
+        self.leaderboards.start_load()
+        self.leaderboards.load({'ingredients': [{'key': 'rice', 'value': 1}]}, {'ingredients': [{'key': 'Sunday', 'value': 1}]})
+        self.leaderboards.record(request_doc('a', 'rice'))
+        self.leaderboards.record(request_doc('b', 'basil,tomato'))
+        leaderboard = self.leaderboards.get('ingredients', 5)
+        self.assertEqual(leaderboard['top'], [{'name': 'rice', 'count': 2}, {'name': 'basil,tomato', 'count': 1}])
+        self.assertEqual(leaderboard['by_day_of_week']['Sunday'], 3)
+        self.assertEqual(self.leaderboards.get('cuisines', 5)['top'], [])
+
+    def test_requests_recorded_while_loading_are_counted_once(self):
+        self.leaderboards.start_load()
+        self.leaderboards.record(request_doc('a', 'rice'))
+        self.leaderboards.record(request_doc('b', 'rice'))
+        # a was written before the views were read, b was not
+        self.leaderboards.written([request_doc('a', 'rice')])
+        self.leaderboards.load({'ingredients': [{'key': 'rice', 'value': 4}]}, {'ingredients': [{'key': 'Sunday', 'value': 4}]})
+        leaderboard = self.leaderboards.get('ingredients', 5)
+        self.assertEqual(leaderboard['top'], [{'name': 'rice', 'count': 5}])
+        self.assertEqual(leaderboard['by_day_of_week']['Sunday'], 5)
+        self.assertIsNone(self.leaderboards.loading)
+
+    def test_cancel_load_drops_kept_requests(self):
+        self.leaderboards.start_load()
+        self.leaderboards.record(request_doc('a', 'rice'))
+        self.leaderboards.cancel_load()
+        self.assertFalse(self.leaderboards.is_loaded())
+        self.leaderboards.start_load()
+        self.leaderboards.load({}, {})
+        self.assertEqual(self.leaderboards.get('ingredients', 5)['top'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.recipe_prefetcher import RecipePrefetcher
+
+
+class FakeRecipeStore(object):
+
+    def __init__(self, recipe_ids=()):
+        self.recipes = set(recipe_ids)
+        self.lock = threading.Lock()
+
+    def find_recipe(self, recipe_id):
+        with self.lock:
+            return {'name': str(recipe_id)} if recipe_id in self.recipes else None
+
+    def fetch_recipe(self, recipe_id):
+        with self.lock:
+            self.recipes.add(recipe_id)
+
+
+class RecipePrefetcherTest(unittest.TestCase):
+
+    def test_prefetches_a_whole_list_within_the_budget(self):
+        store = FakeRecipeStore()
+        prefetcher = RecipePrefetcher(store, store.fetch_recipe, max_workers=2, budget_per_hour=1)
+        prefetcher.prefetch([1, 2, 3, 4, 5])
+        prefetcher.prefetch([6])
+        prefetcher.stop()
+        self.assertEqual(store.recipes, set([1, 2, 3, 4, 5]))
+        self.assertEqual(prefetcher.stats(), {'prefetched': 5, 'skipped': 1, 'errors': 0})
+
+    def test_skips_stored_recipes_without_using_the_budget(self):
+        store = FakeRecipeStore([1, 2])
+        prefetcher = RecipePrefetcher(store, store.fetch_recipe, budget_per_hour=1, burst=1)
+        prefetcher.prefetch([1, 2, 3])
+        prefetcher.stop()
+        self.assertEqual(store.recipes, set([1, 2, 3]))
+        self.assertEqual(prefetcher.stats(), {'prefetched': 1, 'skipped': 0, 'errors': 0})
+
+    def test_counts_errors(self):
+        def fetch_recipe(recipe_id):
+            raise IOError('Spoonacular unavailable')
+        prefetcher = RecipePrefetcher(FakeRecipeStore(), fetch_recipe)
+        prefetcher.prefetch([1])
+        prefetcher.stop()
+        self.assertEqual(prefetcher.stats(), {'prefetched': 0, 'skipped': 0, 'errors': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from souschef.async_single_flight import AsyncSingleFlight
+from souschef.single_flight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, single_flight, fn, num_threads):
+        # calls fn for the same key from num_threads threads, fn returns once all of them have called do
+        results = [None] * num_threads
+        errors = [None] * num_threads
+        started = threading.Semaphore(0)
+
+        def call(i):
+            started.release()
+            try:
+                results[i] = single_flight.do('key', fn, started, num_threads)
+            except Exception as e:
+                errors[i] = e
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    @staticmethod
+    def wait_for_callers(started, num_threads):
+        for _ in range(num_threads):
+            started.acquire()
+        # give the last callers time to find the call in flight
+        time.sleep(0.05)
+
+    def test_concurrent_calls_share_one_call(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def fn(started, num_threads):
+            calls.append(1)
+            self.wait_for_callers(started, num_threads)
+            return 'recipes'
+        results, errors = self.run_concurrently(single_flight, fn, 5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(errors, [None] * 5)
+        self.assertEqual(sorted(results), [('recipes', False)] * 4 + [('recipes', True)])
+        self.assertEqual(single_flight.calls, {})
+
+    def test_error_is_raised_in_every_caller(self):
+        single_flight = SingleFlight()
+
+        def fn(started, num_threads):
+            self.wait_for_callers(started, num_threads)
+            raise IOError('Spoonacular unavailable')
+        results, errors = self.run_concurrently(single_flight, fn, 3)
+        self.assertEqual(results, [None] * 3)
+        self.assertEqual([str(e) for e in errors], ['Spoonacular unavailable'] * 3)
+        self.assertEqual(single_flight.calls, {})
+
+    def test_later_calls_start_a_new_flight(self):
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do('key', lambda: 1), (1, True))
+        self.assertEqual(single_flight.do('key', lambda: 2), (2, True))
+        with self.assertRaises(ValueError):
+            single_flight.do('key', int, 'x')
+        self.assertEqual(single_flight.do('key', lambda: 3), (3, True))
+
+
+class AsyncSingleFlightTest(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_call(self):
+        calls = []
+
+        async def fn(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        async def main():
+            single_flight = AsyncSingleFlight()
+            results = await asyncio.gather(*[single_flight.do('key', fn, i) for i in range(3)])
+            self.assertEqual(single_flight.calls, {})
+            return results
+        self.assertEqual(asyncio.run(main()), [(0, True), (0, False), (0, False)])
+        self.assertEqual(calls, [0])
+
+    def test_error_is_raised_in_every_caller(self):
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise IOError('Spoonacular unavailable')
+
+        async def main():
+            single_flight = AsyncSingleFlight()
+            return await asyncio.gather(*[single_flight.do('key', fn) for i in range(3)], return_exceptions=True)
+        self.assertEqual([str(e) for e in asyncio.run(main())], ['Spoonacular unavailable'] * 3)
+
+    def test_cancelled_waiter_does_not_cancel_the_call(self):
+        async def fn():
+            await asyncio.sleep(0.05)
+            return 'recipes'
+
+        async def main():
+            single_flight = AsyncSingleFlight()
+            leader = asyncio.ensure_future(single_flight.do('key', fn))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(single_flight.do('key', fn))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            return await leader
+        self.assertEqual(asyncio.run(main()), ('recipes', True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+
+from cloudant.client import Cloudant
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../benchmarks'))
+from souschef.cloudant_recipe_store import CloudantRecipeStore
+from souschef.recipe import RecipeClient
+from souschef.souschef import SousChef
+from standins import CouchDBStandIn, Faults, SpoonacularStandIn
+
+
+class FailingStepsRecipeClient(RecipeClient):
+
+    def get_steps_by_id(self, id):
+        raise IOError('analyzedInstructions unavailable')
+
+
+class SousChefTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.spoonacular_faults = Faults()
+        self.spoonacular = SpoonacularStandIn(self.spoonacular_faults).start()
+        self.couch = CouchDBStandIn(Faults()).start()
+        self.recipe_store = CloudantRecipeStore(Cloudant('admin', 'admin', url=self.couch.url), 'souschef')
+        self.recipe_store.init()
+        self.souschef = None
+
+    def tearDown(self):
+        self.souschef.close()
+        self.spoonacular.stop()
+        self.couch.stop()
+
+    def create_souschef(self, recipe_client_class):
+        recipe_client = recipe_client_class('key', pool_size=2, max_retries=0, endpoint=self.spoonacular.url)
+        self.souschef = SousChef('BOT', None, None, 'workspace', recipe_client, self.recipe_store)
+
+
+class FetchRecipeTest(SousChefTestCase):
+
+    def get_recipe_docs(self):
+        return [doc for doc_id, doc in self.couch.dbs['souschef'].items() if doc_id.startswith('recipe:')]
+
+    def test_stores_recipe_with_steps(self):
+        self.create_souschef(RecipeClient)
+        recipe = self.souschef.get_recipe(101)
+        self.assertEqual(recipe['_id'], 'recipe:101')
+        self.assertNotIn('_No instructions available', recipe['instructions'])
+        self.assertEqual(len(self.get_recipe_docs()), 1)
+
+    def test_does_not_store_recipe_without_steps(self):
+        self.create_souschef(FailingStepsRecipeClient)
+        recipe = self.souschef.get_recipe(101)
+        # the user still gets the recipe, without its steps
+        self.assertEqual(recipe['_id'], 'recipe:101')
+        self.assertEqual(recipe['name'], '101')
+        self.assertIn('_No instructions available', recipe['instructions'])
+        self.assertEqual(self.get_recipe_docs(), [])
+        self.assertIsNone(self.recipe_store.find_recipe(101))
+
+
+class FetchIngredientTest(SousChefTestCase):
+
+    def add_superset(self, recipe_count):
+        user = self.recipe_store.add_user('U1')
+        recipes = [{'id': i, 'title': 'Recipe {}'.format(i), 'usedIngredientCount': 3} for i in range(recipe_count)]
+        self.recipe_store.add_ingredient('basil,rice,tomato', recipes, user)
+        return user
+
+    def test_answers_from_superset_with_full_list(self):
+        self.create_souschef(RecipeClient)
+        user = self.add_superset(5)
+        ingredient = self.souschef.fetch_ingredient('basil,tomato', 'tomato, basil', user)
+        self.assertEqual([recipe['id'] for recipe in ingredient['recipes']], [0, 1, 2, 3, 4])
+        self.assertEqual(self.spoonacular_faults.total_calls(), 0)
+
+    def test_asks_spoonacular_when_superset_has_fewer_recipes(self):
+        self.create_souschef(RecipeClient)
+        user = self.add_superset(1)
+        ingredient = self.souschef.fetch_ingredient('basil,tomato', 'tomato, basil', user)
+        self.assertEqual(self.spoonacular_faults.calls, {'findByIngredients': 1})
+        self.assertEqual(ingredient['recipes'], self.souschef.recipe_client.find_by_ingredients('tomato, basil'))
+
+
+class OpenTest(SousChefTestCase):
+
+    def test_normalizer_knows_stored_ingredients(self):
+        user = self.recipe_store.add_user('U1')
+        self.recipe_store.add_ingredient('tomato', [{'id': 1, 'title': 'Recipe 1', 'usedIngredientCount': 1}], user)
+        self.recipe_store.add_ingredient('avocado', [], user)
+        self.create_souschef(RecipeClient)
+        self.souschef.open()
+        self.assertEqual(self.souschef.normalizer.normalize_ingredients('Tomatoe'), 'tomato')
+        self.assertEqual(self.souschef.normalizer.normalize_ingredients('avocadoo'), 'avocadoo')
+
+
+if __name__ == '__main__':
+    unittest.main()
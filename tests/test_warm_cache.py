@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+from cloudant.client import Cloudant
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../benchmarks'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../scripts'))
+from souschef.normalizer import Normalizer
+from souschef.recipe import RecipeClient
+from standins import CouchDBStandIn, Faults, SpoonacularStandIn
+import warm_cache
+
+
+class WarmCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spoonacular_faults = Faults()
+        self.spoonacular = SpoonacularStandIn(self.spoonacular_faults).start()
+        self.couch = CouchDBStandIn(Faults()).start()
+        self.client = Cloudant('admin', 'admin', url=self.couch.url)
+        self.client.connect()
+        self.db = self.client.create_database('souschef')
+        self.recipe_client = RecipeClient('key', pool_size=2, max_retries=0, endpoint=self.spoonacular.url)
+        self.queries = warm_cache.get_queries(['Italian', 'thai'], ['Tomatoes, basil', 'rice'], Normalizer())
+
+    def tearDown(self):
+        self.recipe_client.close()
+        self.client.disconnect()
+        self.spoonacular.stop()
+        self.couch.stop()
+
+    def test_writes_docs_under_derived_ids(self):
+        warm_cache.warm(self.db, self.recipe_client, self.queries, 2, 3, False)
+        docs = self.couch.dbs['souschef']
+        self.assertEqual(sorted(docs.keys()), ['cuisine:italian', 'cuisine:thai', 'ingredient:basil,tomato', 'ingredient:rice'])
+        self.assertEqual(docs['ingredient:basil,tomato']['type'], 'ingredient')
+        self.assertEqual(docs['ingredient:basil,tomato']['name'], 'basil,tomato')
+        self.assertEqual(docs['cuisine:thai']['recipes'], self.recipe_client.find_by_cuisine('thai'))
+
+    def test_resumed_run_skips_stored_docs(self):
+        warm_cache.warm(self.db, self.recipe_client, dict(list(sorted(self.queries.items()))[:2]), 2, 3, False)
+        stored = dict(self.couch.dbs['souschef'])
+        self.assertEqual(sorted(stored.keys()), ['cuisine:italian', 'cuisine:thai'])
+        self.spoonacular_faults.reset()
+        warm_cache.warm(self.db, self.recipe_client, self.queries, 2, 3, False)
+        # only the ingredients are fetched, the cuisines are left as they were
+        self.assertEqual(self.spoonacular_faults.calls, {'findByIngredients': 2})
+        self.assertEqual(len(self.couch.dbs['souschef']), 4)
+        for doc_id, doc in stored.items():
+            self.assertEqual(self.couch.dbs['souschef'][doc_id]['_rev'], doc['_rev'])
+        self.spoonacular_faults.reset()
+        warm_cache.warm(self.db, self.recipe_client, self.queries, 2, 3, False)
+        self.assertEqual(self.spoonacular_faults.total_calls(), 0)
+
+    def test_dry_run_writes_nothing(self):
+        warm_cache.warm(self.db, self.recipe_client, self.queries, 2, 3, True)
+        self.assertEqual(self.spoonacular_faults.total_calls(), 0)
+        self.assertEqual(self.couch.dbs['souschef'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()